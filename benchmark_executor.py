@@ -0,0 +1,77 @@
+"""Microbenchmarks of the local Python executor.
+
+Usage: python benchmark_executor.py
+"""
+import pkgutil
+import timeit
+
+from smolagents.local_python_executor import AuthorizedImports, LocalPythonExecutor, check_import_authorized
+from smolagents.utils import BASE_BUILTIN_MODULES
+
+
+def authorized_imports_of_size(size: int) -> list[str]:
+    """Authorized imports as built by run_gaia.py, padded with fake modules up to `size` entries."""
+    imports = list(BASE_BUILTIN_MODULES)
+    for module in pkgutil.iter_modules():
+        imports += [module.name, f"{module.name}.*"]
+    imports += [f"fake_module_{i}.*" for i in range(max(size - len(imports), 0))]
+    return imports[:size]
+
+
+def time_per_call(fn, number: int) -> float:
+    """Best time per call in microseconds."""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def bench_import_checks():
+    print("Import authorization check (µs per check)")
+    print(f"{'imports':>8} {'list':>12} {'compiled':>12}")
+    for size in (100, 1000, 10000):
+        imports = authorized_imports_of_size(size)
+        compiled = AuthorizedImports(imports)
+        list_time = time_per_call(lambda: check_import_authorized("collections.abc", imports), number=20)
+        compiled_time = time_per_call(lambda: check_import_authorized("collections.abc", compiled), number=20000)
+        print(f"{size:>8} {list_time:>12.2f} {compiled_time:>12.2f}")
+
+
+def bench_executor_imports():
+    print("\nExecutor run of 50 import statements (ms per run)")
+    code = "\n".join(["import math", "import re", "from collections import Counter", "import statistics", "import time"] * 10)
+    for size in (100, 1000, 10000):
+        executor = LocalPythonExecutor(additional_authorized_imports=authorized_imports_of_size(size))
+        executor.send_tools({})
+        print(f"{size:>8} {time_per_call(lambda: executor(code), number=20) / 1000:>12.2f}")
+
+
+INTERPRETER_BENCHMARKS = {
+    "for loop": "total = 0\nfor i in range(20000):\n    total += i * 2 % 7\n",
+    "while loop": "i = 0\nwhile i < 20000:\n    i = i + 1\n",
+    "list comprehension": "squares = [x * x for x in range(20000) if x % 3 == 0]\n",
+    "dict comprehension": "d = {str(x): x for x in range(10000)}\n",
+    "function calls": "def f(a, b):\n    return a + b\nfor i in range(5000):\n    f(i, 1)\n",
+    "method calls": "items = []\nfor i in range(10000):\n    items.append(i)\nlen(items)\n",
+}
+
+
+def bench_interpreter():
+    print("\nInterpreter (ms per run)")
+    for name, code in INTERPRETER_BENCHMARKS.items():
+        executor = LocalPythonExecutor(additional_authorized_imports=[])
+        executor.send_tools({})
+        print(f"{name:>20} {time_per_call(lambda: executor(code), number=3) / 1000:>10.1f}")
+
+
+def bench_large_state():
+    print("\nCalls with 5000 variables from earlier steps in the state (ms per run)")
+    code = "def f(a):\n    return a + 1\nsum(f(i) for i in range(2000)) + sum([(lambda x: x)(i) for i in range(2000)])\n"
+    executor = LocalPythonExecutor(additional_authorized_imports=[])
+    executor.send_tools({})
+    executor.send_variables({f"var_{i}": i for i in range(5000)})
+    print(f"{'helper calls':>20} {time_per_call(lambda: executor(code), number=3) / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    bench_import_checks()
+    bench_executor_imports()
+    bench_interpreter()
+    bench_large_state()
@@ -2,6 +2,7 @@ import argparse
 import json
 import os
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
@@ -14,7 +15,8 @@ from openinference.instrumentation.smolagents import SmolagentsInstrumentor
 import pkgutil
 from dotenv import load_dotenv
 from smolagents.mcp_client import MCPClient
-from src.extractor import run_extract
+from src.extractor import run_extract, run_extract_batch
+from src.self_consistency import run_self_consistency
 from src.tools.arxiv_tool import ArxivWebSearchTool
 from src.tools.search_tool import IntegratedSearchTool, IntegratedSearchTool_v2
 from src.tools.text_tool import text_parse_tool
@@ -34,11 +36,15 @@ from src.utils import load_gaia_dataset, append_answer, get_zip_files, load_prom
 from src.tools.wikipedia_tool import WikiSearchTool, WikiPageTool
 from tqdm import tqdm
 from rich.console import Console
-from smolagents.agents import CodeAgent, ToolCallingAgent
-from smolagents.models import OpenAIServerModel
+from smolagents.agents import CodeAgent, MultiStepAgent, ToolCallingAgent
+from smolagents.models import OpenAIServerModel, RequestHedgingPolicy
 from smolagents import PythonInterpreterTool, BASE_BUILTIN_MODULES
 from smolagents.local_python_executor import LocalPythonExecutor
-from smolagents.monitoring import AgentLogger, LogLevel
+from smolagents.process_executor import ExecutorProcessPool
+from smolagents.memory import MemoryPolicy
+from smolagents.serialization import write_memory
+from smolagents.monitoring import AgentLogger, LogLevel, Tracer
+from smolagents.utils import CancellationToken
 
 load_dotenv(override=True)
 
@@ -51,6 +57,10 @@ def parse_args():
     parser.add_argument("--run_name", type=str, default="gaia_run")
     parser.add_argument("--split", type=str, default="validation")
     parser.add_argument("--extract_model_id", type=str, default="o4-mini")
+    parser.add_argument("--extract_mode", type=str, default="sync", choices=["sync", "batch"], help="Extract answers with one request per record, or with a single request batch")
+    parser.add_argument("--task_time_budget", type=float, default=None, help="Time budget per task in seconds, used as deadline for model calls")
+    parser.add_argument("--self_consistency", type=int, default=1, help="Number of concurrent attempts per task, voting on the answer")
+    parser.add_argument("--quorum", type=int, default=None, help="Number of agreeing attempts that stops the others, defaults to a strict majority")
     return parser.parse_args()
 
 os.environ['SERPAPI_API_KEY'] = os.getenv("SERPAPI_API_KEY", "")
@@ -66,7 +76,16 @@ code_agent_step = 60
 code_agent_plan_interval = 5
 manager_agent_step = 80
 manager_agent_plan_interval = 4
+# Browser and search runs are long and their old observations are rarely needed verbatim
+browser_agent_memory_policy = MemoryPolicy.window(k=5)
+search_agent_memory_policy = MemoryPolicy.digest_older(k=8)
+code_agent_memory_policy = MemoryPolicy()
+manager_agent_memory_policy = MemoryPolicy()
+# Temperatures of the self-consistency attempts: the first attempt keeps the model default
+self_consistency_temperatures = [None, 0.7, 1.0]
 max_tokens = 200000
+# Warm processes with the scientific modules imported, for the Logic_Expert executors; started in main()
+executor_pool: ExecutorProcessPool | None = None
 extract_conv_num = 5
 SEARCH_ENGINE = ["bing"]
 # search_tool_func = IntegratedSearchTool(SEARCH_ENGINE, num0=10)
@@ -107,23 +126,16 @@ WEB_TOOLS = [
 
 
 def create_agent_team(workspace_path: Path, logger=None, **kwargs):
-    project_root=workspace_path.parent.parent.parent
+    project_root = Path(__file__).parent.resolve()
     server_parameters = StdioServerParameters(
         command="npx",
         args=["-y", "@playwright/mcp@latest", "--viewport-size", "1920, 1080", "--output-dir", f"{str(workspace_path)}",  "--isolated"], # --isolated is used to create multiple browser instances
         env={"UV_PYTHON": "3.11", **os.environ},
     )
+    # Disconnected by cleanup_agent_team, which stops the Playwright server of the team
     mcp_client = MCPClient(server_parameters)
     BROWSWER_TOOLS=mcp_client.get_tools() 
 
-    link_pool = LinkPool()
-    crawler = SimpleCrawler(link_pool=link_pool)
-    set_crawler_and_link_pool(crawler, link_pool)
-
-    for module in pkgutil.iter_modules():
-        BASE_BUILTIN_MODULES.append(module.name)
-        BASE_BUILTIN_MODULES.append(f"{module.name}.*")
-
     search_agent_description = "An expert in Web Retrieval and Information Gathering with specialized tools. Don't hesitate to delegate task to him with details"
     code_agent_description = "An expert in Programming, Logical reasoning, and Math with special mode. Don't hesitate to delegate task to him with details"
     browser_agent_description = "An expert in Browser Navigation and Web Interaction with capabilities in direct browser automation, dynamic content extraction, interactive web operations and so on."
@@ -134,7 +146,9 @@ def create_agent_team(workspace_path: Path, logger=None, **kwargs):
         max_steps=browser_agent_steps,
         verbosity_level=2,
         planning_interval=browser_agent_plan_interval,
+        executor_kwargs={"artifact_parent_directory": str(workspace_path)},
         name="Browser_Expert",
+        memory_policy=browser_agent_memory_policy,
         description=browser_agent_description,
         prompt_templates=load_prompt_template_from_yaml(str(project_root / "prompts/browser_agent/code_agent.yaml")),
         logger=logger or AgentLogger(level=LogLevel.INFO),
@@ -148,7 +162,9 @@ def create_agent_team(workspace_path: Path, logger=None, **kwargs):
         max_steps=search_agent_steps,
         verbosity_level=2,
         planning_interval=search_agent_plan_interval,
+        executor_kwargs={"artifact_parent_directory": str(workspace_path)},
         name="Retrieval_Expert",
+        memory_policy=search_agent_memory_policy,
         description=search_agent_description,
         provide_run_summary=False,
         prompt_templates=load_prompt_template_from_yaml(str(project_root / "prompts/search_agent/code_agent.yaml")),
@@ -164,9 +180,24 @@ def create_agent_team(workspace_path: Path, logger=None, **kwargs):
         max_steps=code_agent_step,
         verbosity_level=2,
         additional_authorized_imports=["*"],
+        # Trusted agent doing CPU-bound analysis: run its code compiled instead of interpreted, in a child process
+        # that is restarted when a step runs away in time or memory, and that spills large idle variables to disk.
+        # Its steps mostly transform data in place, so a failing step is rolled back instead of leaving it half-updated
+        executor_type="process",
+        executor_kwargs={
+            "compiled": True,
+            "timeout": 600,
+            "memory_limit": 8 * 1024**3,
+            "memory_budget": 2 * 1024**3,
+            "rollback_on_error": True,
+            "pool": executor_pool,
+            "cwd": str(workspace_path),
+            "artifact_parent_directory": str(workspace_path),
+        },
         planning_interval=code_agent_plan_interval,
         provide_run_summary=True,
         name="Logic_Expert",
+        memory_policy=code_agent_memory_policy,
         description=code_agent_description,
         prompt_templates=load_prompt_template_from_yaml(str(project_root / "prompts/logic_agent/code_agent.yaml")),
         logger=logger or AgentLogger(level=LogLevel.INFO),
@@ -180,15 +211,75 @@ def create_agent_team(workspace_path: Path, logger=None, **kwargs):
         max_steps=manager_agent_step,
         verbosity_level=2,
         planning_interval=manager_agent_plan_interval,
+        executor_kwargs={"artifact_parent_directory": str(workspace_path)},
         managed_agents=[search_agent, code_agent],
+        memory_policy=manager_agent_memory_policy,
         prompt_templates=load_prompt_template_from_yaml(str(project_root / "prompts/manage_agent/code_agent.yaml")),
         logger=logger or AgentLogger(level=LogLevel.INFO),
     )
     if isinstance(manager_agent.python_executor, LocalPythonExecutor):
         manager_agent.python_executor.static_tools = {"open": open}
+    manager_agent.mcp_client = mcp_client
     return manager_agent
 
-def run_agent(example: dict, run_name: str, answers_file: str, project_root: Path) -> None:
+def cleanup_agent_team(agent: CodeAgent):
+    """Stop the executors of a team built by create_agent_team, and disconnect its Playwright MCP server."""
+    try:
+        agent.cleanup()
+    finally:
+        agent.mcp_client.disconnect()
+
+def log_executor_stats(agent: MultiStepAgent, agent_logger: AgentLogger):
+    """Log the memory accounting and rollbacks of the Python executors of an agent tree whose state tracks them."""
+    agents = [agent]
+    while agents:
+        current = agents.pop()
+        agents.extend(current.managed_agents.values())
+        executor = getattr(current, "python_executor", None)
+        report = executor.memory_report() if hasattr(executor, "memory_report") else None
+        if report is None:
+            continue
+        budget = report["memory_budget"]
+        agent_logger.log_metrics(
+            {
+                "memory usage (MiB)": report["memory_usage"] / 2**20,
+                "memory budget (MiB)": budget / 2**20 if budget is not None else "none",
+                "spilled variables": len(report["spilled"]),
+                "spilled size (MiB)": sum(report["spilled"].values()) / 2**20,
+                "rolled back steps": executor.rolled_back_steps,
+            },
+            title=f"Python executor of {current.name or 'manager'}",
+        )
+
+def log_agent_state(agent: MultiStepAgent, memory_path: Path, agent_logger: AgentLogger):
+    """Log the executor statistics of an agent tree and dump its memory to `memory_path`.
+
+    Both are debugging aids: errors are logged instead of raised, so that they never lose the answer of the task.
+    """
+    try:
+        log_executor_stats(agent, agent_logger)
+        write_memory(agent.memory, memory_path)
+    except Exception:
+        agent_logger.log_error(traceback.format_exc())
+
+def initialize_shared_resources():
+    """One-time setup of the state shared by all the agent teams, which run concurrently."""
+    for module in pkgutil.iter_modules():
+        BASE_BUILTIN_MODULES.append(module.name)
+        BASE_BUILTIN_MODULES.append(f"{module.name}.*")
+
+    link_pool = LinkPool()
+    crawler = SimpleCrawler(link_pool=link_pool)
+    set_crawler_and_link_pool(crawler, link_pool)
+
+def create_models(hedging_policy: RequestHedgingPolicy, deadline: float | None, temperature: float | None = None) -> dict:
+    model_kwargs = {"temperature": temperature} if temperature is not None else {}
+    return {
+        f"{role}_model": OpenAIServerModel(model_id="anthropic.claude-sonnet-4-20250514-v1:0", api_base=os.getenv("OPENAI_BASE_URL"), api_key=os.getenv("OPENAI_API_KEY"), max_tokens=65535, timeout=100, client_kwargs={"max_retries": 3}, hedging_policy=hedging_policy, deadline=deadline, **model_kwargs)
+        for role in ["manager", "search", "code", "browser"]
+    }
+
+def run_agent(example: dict, run_name: str, answers_file: str, project_root: Path, task_time_budget: float | None = None, self_consistency: int = 1, quorum: int | None = None) -> None:
     task_id = example["task_id"]
     workspace_path = project_root / "workspaces" / run_name / task_id
     workspace_path.mkdir(parents=True, exist_ok=True)
@@ -208,10 +299,11 @@ def run_agent(example: dict, run_name: str, answers_file: str, project_root: Pat
             console = Console(file=log_file, record=False, force_terminal=False)
             agent_logger = AgentLogger(level=LogLevel.INFO, console=console)
 
-            manager_model = OpenAIServerModel(model_id="anthropic.claude-sonnet-4-20250514-v1:0", api_base=os.getenv("OPENAI_BASE_URL"), api_key=os.getenv("OPENAI_API_KEY"), max_tokens=65535, timeout=100, client_kwargs={"max_retries": 3})
-            search_model = OpenAIServerModel(model_id="anthropic.claude-sonnet-4-20250514-v1:0", api_base=os.getenv("OPENAI_BASE_URL"), api_key=os.getenv("OPENAI_API_KEY"), max_tokens=65535, timeout=100, client_kwargs={"max_retries": 3})
-            code_model = OpenAIServerModel(model_id="anthropic.claude-sonnet-4-20250514-v1:0", api_base=os.getenv("OPENAI_BASE_URL"), api_key=os.getenv("OPENAI_API_KEY"), max_tokens=65535, timeout=100, client_kwargs={"max_retries": 3})
-            browser_model = OpenAIServerModel(model_id="anthropic.claude-sonnet-4-20250514-v1:0", api_base=os.getenv("OPENAI_BASE_URL"), api_key=os.getenv("OPENAI_API_KEY"), max_tokens=65535, timeout=100, client_kwargs={"max_retries": 3})
+            # Slow calls are hedged with a duplicate request, and all calls share the deadline of the task budget
+            hedging_policy = RequestHedgingPolicy()
+            deadline = time.time() + task_time_budget if task_time_budget else None
+            models = create_models(hedging_policy=hedging_policy, deadline=deadline)
+            manager_model = models["manager_model"]
 
             prompt_data = load_prompt_from_yaml(str(project_root / "prompts/augmented_question.yaml"))
             augmented_question = str(prompt_data).format(original_question=example["question"])
@@ -229,30 +321,65 @@ def run_agent(example: dict, run_name: str, answers_file: str, project_root: Pat
             agent_logger.log_task_start(task_id, example.get('question', ''))
             
             output, intermediate_steps, final_exception = None, [], None
+            self_consistency_stats = None
             iteration_limit_exceeded = False
             
-            agent = create_agent_team(workspace_path, logger=agent_logger, manager_model=manager_model, search_model=search_model, code_model=code_model, browser_model=browser_model)
-            with using_metadata({"task_id": task_id}):
-                for attempt in range(2):
+            # Timing spans of the whole agent tree, exported as a Chrome trace next to the task log
+            tracer = Tracer()
+            # Cancelled once the task budget is exhausted: stops the agent tree, its tool calls and its model calls
+            cancellation_token = CancellationToken(deadline=deadline)
+            with using_metadata({"task_id": task_id}), tracer.activate(), cancellation_token.activate():
+                if self_consistency > 1:
+                    # Independent attempts with different temperatures share the task deadline and vote on the answer
+                    def build_attempt_team(index: int):
+                        temperature = self_consistency_temperatures[index % len(self_consistency_temperatures)]
+                        attempt_models = create_models(hedging_policy=hedging_policy, deadline=deadline, temperature=temperature)
+                        # Attempts run concurrently, so each one downloads and writes its files in its own directory
+                        attempt_workspace_path = workspace_path / f"attempt_{index}"
+                        attempt_workspace_path.mkdir(parents=True, exist_ok=True)
+                        return create_agent_team(attempt_workspace_path, logger=agent_logger, **attempt_models)
+
+                    result = run_self_consistency(build_attempt_team, augmented_question, n_attempts=self_consistency, quorum=quorum, time_budget=task_time_budget, logger=agent_logger, cleanup_agent=cleanup_agent_team)
+                    output = result.answer
+                    intermediate_steps = result.attempt.intermediate_steps if result.attempt else []
+                    self_consistency_stats = result.dict()
+                    if result.attempt is not None:
+                        log_agent_state(result.attempt.agent, log_dir / f"{task_id}.memory", agent_logger)
+                    if output is None:
+                        final_exception = Exception("; ".join(a.error for a in result.attempts if a.error) or "No attempt finished within the time budget.")
+                else:
+                    agent = create_agent_team(workspace_path, logger=agent_logger, **models)
                     try:
-                        output = agent.run(augmented_question)
-                        intermediate_steps = agent.write_memory_to_messages()
-                        if output and "Agent stopped due to iteration limit or time limit." in str(output):
-                            iteration_limit_exceeded = True
-                        break
-                    except Exception as e:
-                        agent_logger.log_error(traceback.format_exc())
-                        final_exception = e
-                        if attempt == 0:
-                            agent_logger.log_error("Agent error, restarting...")
-                            sleep(60)
-                        else:
-                            agent_logger.log_error(f"Agent failed after multiple attempts.")
+                        for attempt in range(2):
+                            try:
+                                output = agent.run(augmented_question)
+                                intermediate_steps = agent.write_memory_to_messages()
+                                if output and "Agent stopped due to iteration limit or time limit." in str(output):
+                                    iteration_limit_exceeded = True
+                                break
+                            except Exception as e:
+                                agent_logger.log_error(traceback.format_exc())
+                                final_exception = e
+                                if cancellation_token.cancelled:
+                                    break
+                                if attempt == 0:
+                                    agent_logger.log_error("Agent error, restarting...")
+                                    sleep(60)
+                                else:
+                                    agent_logger.log_error(f"Agent failed after multiple attempts.")
+                        log_agent_state(agent, log_dir / f"{task_id}.memory", agent_logger)
+                    finally:
+                        # Stops the executor processes, removes the artifacts of the whole agent tree and stops its browser
+                        cleanup_agent_team(agent)
             
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
             status = "completed" if output and not iteration_limit_exceeded and not final_exception else "failed"
             agent_logger.log_task_end(task_id, duration, status)
+            agent_logger.log_metrics(hedging_policy.stats, title="Request hedging")
+            agent_logger.log_metrics(tracer.summary(), title="Time spent per span category (s)")
+            tracer.export(log_dir / f"{task_id}.trace.json")
+            hedging_policy.shutdown()
 
             annotated_example = {
                 "agent_name": manager_model.model_id, "task_id": task_id, "prediction": None,
@@ -262,6 +389,7 @@ def run_agent(example: dict, run_name: str, answers_file: str, project_root: Pat
                 "parsing_error": None, "iteration_limit_exceeded": iteration_limit_exceeded,
                 "agent_error": str(final_exception) if final_exception else None,
                 "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"), "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+                "self_consistency": self_consistency_stats,
             }
             append_answer(annotated_example, answers_file, append_answer_lock)
             print(f"Task {task_id} completed")
@@ -269,6 +397,7 @@ def run_agent(example: dict, run_name: str, answers_file: str, project_root: Pat
         os.chdir(original_cwd)
 
 def main():
+    global executor_pool
     args = parse_args()
     project_root = Path(__file__).parent.resolve()
     
@@ -294,13 +423,21 @@ def main():
 
     print(f"🎯 Running {len(tasks_to_run)} tasks. Results will be saved to: {answers_file_path}")
     
-    with ThreadPoolExecutor(max_workers=args.concurrency) as exe:
-        futures = [exe.submit(run_agent, example, args.run_name, str(temp_answer_path), project_root) for example in tasks_to_run]
-        for f in tqdm(as_completed(futures), total=len(tasks_to_run), desc="Processing tasks"):
-            f.result()
+    initialize_shared_resources()
+    executor_pool = ExecutorProcessPool(size=args.concurrency)
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as exe:
+            futures = [exe.submit(run_agent, example, args.run_name, str(temp_answer_path), project_root, args.task_time_budget, args.self_consistency, args.quorum) for example in tasks_to_run]
+            for f in tqdm(as_completed(futures), total=len(tasks_to_run), desc="Processing tasks"):
+                f.result()
+    finally:
+        executor_pool.shutdown()
     
     print("✅ All tasks completed. Starting answer extraction...")
-    run_extract(str(temp_answer_path), args.extract_model_id, extract_conv_num)
+    if args.extract_mode == "batch":
+        run_extract_batch(str(temp_answer_path), args.extract_model_id)
+    else:
+        run_extract(str(temp_answer_path), args.extract_model_id, extract_conv_num)
     print(f"✅ All tasks processed. Final results are in: {answers_file_path}")
 
 if __name__ == "__main__":
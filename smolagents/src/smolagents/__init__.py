@@ -18,14 +18,18 @@ __version__ = "1.20.0.dev0"
 
 from .agent_types import *  # noqa: I001
 from .agents import *  # Above noqa avoids a circular dependency due to cli.py
+from .artifacts import *
 from .default_tools import *
+from .executor_state import *
 from .gradio_ui import *
 from .local_python_executor import *
 from .mcp_client import *
 from .memory import *
 from .models import *
 from .monitoring import *
+from .process_executor import *
 from .remote_executors import *
+from .serialization import *
 from .tools import *
 from .utils import *
 from .cli import *
@@ -15,6 +15,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from datetime import datetime
+import copy
+import hashlib
 import importlib
 import json
 import os
@@ -25,8 +27,8 @@ import time
 import warnings
 from abc import ABC, abstractmethod
 from collections.abc import Callable, Generator
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from logging import getLogger
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Literal, Type, TypeAlias, TypedDict, Union
@@ -53,8 +55,11 @@ from .memory import (
     AgentMemory,
     CallbackRegistry,
     FinalAnswerStep,
+    MemoryPolicy,
     MemoryStep,
     PlanningStep,
+    SummarizeMemoryPolicy,
+    SummaryStep,
     SystemPromptStep,
     TaskStep,
     Timing,
@@ -68,6 +73,8 @@ from .models import (
     ChatMessageToolCall,
     MessageRole,
     Model,
+    OpenAIServerModel,
+    TokenEstimator,
     agglomerate_stream_deltas,
     parse_json_if_needed,
 )
@@ -75,11 +82,16 @@ from .monitoring import (
     AgentLogger,
     LogLevel,
     Monitor,
+    get_active_tracer,
+    trace_span,
 )
+from .process_executor import ProcessExecutor
 from .remote_executors import DockerExecutor, E2BExecutor, WasmExecutor
 from .tools import Tool, validate_tool_arguments
 from .utils import (
     AGENT_GRADIO_APP_TEMPLATE,
+    MAX_LENGTH_TRUNCATE_CONTENT,
+    AgentCancelledError,
     AgentError,
     AgentExecutionError,
     AgentGenerationError,
@@ -87,7 +99,10 @@ from .utils import (
     AgentParsingError,
     AgentToolCallError,
     AgentToolExecutionError,
+    CancellationToken,
+    StreamingCodeBlockParser,
     extract_code_from_text,
+    get_cancellation_token,
     is_valid_name,
     make_init_file,
     parse_code_blobs,
@@ -184,6 +199,15 @@ class PromptTemplates(TypedDict):
     final_answer: FinalAnswerPromptTemplate
 
 
+DEFAULT_SUMMARY_PROMPT_TEMPLATES = {
+    "system_prompt": (
+        "You are an expert at summarizing the history of an AI agent solving a task. "
+        "Condense the steps you are given while preserving every fact, result, URL, file path, variable name and "
+        "failed approach that could matter to finish the task. Answer with the summary only."
+    ),
+    "user_prompt": "Here are the oldest steps of the agent's memory:\n\n{{messages}}\nSummarize them.",
+}
+
 EMPTY_PROMPT_TEMPLATES = PromptTemplates(
     system_prompt="",
     planning=PlanningPromptTemplate(
@@ -203,9 +227,11 @@ class RunResult:
     Attributes:
         output (Any | None): The final output of the agent run, if available.
         state (Literal["success", "max_steps_error"]): The final state of the agent after the run.
-        messages (list[dict]): The agent's memory, as a list of messages.
+        messages (list[dict]): The agent's memory, as a list of steps. Their model input messages are spans of
+            `message_log`.
         token_usage (TokenUsage | None): Count of tokens used during the run.
         timing (Timing): Timing details of the agent run: start time, end time, duration.
+        message_log (list[dict]): The messages sent to the model during the run, referenced by the steps in `messages`.
     """
 
     output: Any | None
@@ -213,6 +239,7 @@ class RunResult:
     messages: list[dict]
     token_usage: TokenUsage | None
     timing: Timing
+    message_log: list[dict] = field(default_factory=list)
 
 
 StreamEvent: TypeAlias = Union[
@@ -254,6 +281,23 @@ class MultiStepAgent(ABC):
             Each function should:
             - Take the final answer and the agent's memory as arguments.
             - Return a boolean indicating whether the final answer is valid.
+        enable_memory_summarization (`bool`, default `False`): Whether to summarize the oldest steps of the memory once a
+            step uses more than `memory_token_limit` tokens. Summaries run in the background while the agent keeps
+            stepping, and are swapped into the memory at the start of the next step after they complete.
+        memory_token_limit (`int`, default `100000`): Number of tokens of a step above which the memory is summarized.
+        summary_model_config (`dict`, *optional*): Config of an OpenAI-compatible summary model, with keys `model`,
+            `base_url`, `api_key` and any other [`OpenAIServerModel`] argument, defaulting to `gpt-4.1` at
+            `OPENAI_BASE_URL`. Ignored if `summary_model` is given.
+        summary_model (`Model`, *optional*): Model used to summarize the memory, which must not be the agent's model
+            since summaries run on a background thread. Defaults to a model built from `summary_model_config`.
+        summary_oldest_steps (`int`, default `10`): Number of oldest steps folded into the summary each time.
+        summary_keep_steps (`int`, default `2`): Number of most recent steps that are never summarized.
+        memory_policy ([`MemoryPolicy`], *optional*): How the memory is rendered as messages for the model, e.g.
+            `MemoryPolicy.window(k)` or `MemoryPolicy.digest_older(k)` to keep only the last `k` action steps in full
+            without any extra model call. `MemoryPolicy.summarize()` enables memory summarization. Defaults to
+            rendering every step in full.
+        context_token_budget (`int`, *optional*): Maximum number of input tokens sent to the model. The input messages are
+            estimated locally before each call, and the memory is compressed or its oldest messages trimmed to fit.
     """
 
     def __init__(
@@ -278,7 +322,12 @@ class MultiStepAgent(ABC):
         enable_memory_summarization: bool = False,
         memory_token_limit: int = 100000,
         summary_model_config: dict[str, Any] | None = None,
+        summary_model: Model | None = None,
+        summary_oldest_steps: int = 10,
+        summary_keep_steps: int = 2,
+        memory_policy: MemoryPolicy | None = None,
         code_block_tags: str | tuple[str, str] | None = None,
+        context_token_budget: int | None = None,
     ):
         self.agent_name = self.__class__.__name__
         self.model = model
@@ -314,11 +363,22 @@ class MultiStepAgent(ABC):
         self.enable_memory_summarization = enable_memory_summarization
         self.memory_token_limit = memory_token_limit
         self.summary_model_config = summary_model_config or {}
+        self.summary_oldest_steps = summary_oldest_steps
+        self.summary_keep_steps = summary_keep_steps
+        self.memory_policy = memory_policy or MemoryPolicy()
+        if isinstance(self.memory_policy, SummarizeMemoryPolicy):
+            self.enable_memory_summarization = True
+            if self.memory_policy.memory_token_limit is not None:
+                self.memory_token_limit = self.memory_policy.memory_token_limit
+            summary_model = self.memory_policy.summary_model or summary_model
+        self.context_token_budget = context_token_budget
+        self.token_estimator = TokenEstimator()
         self._setup_managed_agents(managed_agents)
         self._setup_tools(tools, add_base_tools)
         self._validate_tools_and_managed_agents(tools, managed_agents)
 
         self.task: str | None = None
+        self.cancellation_token: CancellationToken | None = None
         self.memory = AgentMemory(self.system_prompt)
 
         if logger is None:
@@ -330,12 +390,14 @@ class MultiStepAgent(ABC):
         self._setup_step_callbacks(step_callbacks)
         self.stream_outputs = False
         
-        # Initialize summary model if memory summarization is enabled  
-        self._openai_client = None
-        self._summary_model_config = None
+        # Initialize summary model if memory summarization is enabled
+        self._summary_model: Model | None = None
         self._summary_prompt_templates = None
+        self._summary_cache: dict[str, str] = {}
+        self._summary_executor: ThreadPoolExecutor | None = None
+        self._pending_summary: tuple[list[MemoryStep], str, Future] | None = None
         if self.enable_memory_summarization:
-            self._initialize_summary_model()
+            self._initialize_summary_model(summary_model)
 
     @property
     def system_prompt(self) -> str:
@@ -417,119 +479,36 @@ class MultiStepAgent(ABC):
         # Register monitor update_metrics only for ActionStep for backward compatibility
         self.step_callbacks.register(ActionStep, self.monitor.update_metrics)
 
-    def _initialize_summary_model(self):
-        """Initialize the summary model for memory compression using native OpenAI client."""
-        try:
-            # Import OpenAI client
-            import openai
-            
-            # Load summary prompt templates
-            try:
-                # Try to load from project prompts directory first
-                prompts_path = Path("prompts/summary.yaml")
-                if prompts_path.exists():
-                    with open(prompts_path, 'r', encoding='utf-8') as f:
-                        self._summary_prompt_templates = yaml.safe_load(f)
-                else:
-                    # Fallback to a default prompt if file doesn't exist
-                    self._summary_prompt_templates = {
-                        "system_prompt": (
-                            "You are an expert at analyzing and summarizing AI agent conversation histories. "
-                            "Your task is to condense the memory while preserving all critical information. "
-                            "Return the summarized history as a JSON object."
-                        ),
-                        "user_prompt": "Please summarize the following conversation memory: {{messages}}"
-                    }
-                    self.logger.log(
-                        "Warning: prompts/summary.yaml not found, using default summary prompts", 
-                        level=LogLevel.INFO
-                    )
-            except Exception as e:
-                self.logger.log(f"Error loading summary prompts: {e}", level=LogLevel.ERROR)
-                self._summary_prompt_templates = None
-                return
-
-            self._summary_tool_schema = {
-                "type": "function",
-                "function": {
-                    "name": "save_summary",
-                    "description": "Saves the summarized conversation history.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "summary_messages": {
-                                "type": "array",
-                                "description": "A list of summarized message objects, each with role and content.",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "role": {"type": "string", "enum": ["system", "user", "assistant"]},
-                                        "content": {"type": "string"},
-                                    },
-                                    "required": ["role", "content"],
-                                }
-                            }
-                        },
-                        "required": ["summary_messages"]
-                    }
-                }
-            }
-
-            # Initialize native OpenAI client with default or custom config
-            default_config = {
+    def _initialize_summary_model(self, summary_model: Model | None = None):
+        """Initialize the model and prompts used to summarize the oldest steps of the memory."""
+        prompts_path = Path("prompts/summary.yaml")
+        if prompts_path.exists():
+            with open(prompts_path, "r", encoding="utf-8") as f:
+                self._summary_prompt_templates = yaml.safe_load(f)
+        else:
+            self._summary_prompt_templates = DEFAULT_SUMMARY_PROMPT_TEMPLATES
+
+        if summary_model is self.model:
+            # Summaries run on a background thread: sharing the agent's model would race on its token counts,
+            # rate limiter and hedging statistics
+            raise ValueError("The summary model must be a separate instance from the agent's model.")
+        if summary_model is not None:
+            self._summary_model = summary_model
+        else:
+            config = {
                 "model": "gpt-4.1",
-                "api_key": os.getenv("OPENAI_API_KEY"),
                 "base_url": os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                "api_key": os.getenv("OPENAI_API_KEY"),
                 "max_tokens": 32768,
-                "temperature": 0.1
+                "temperature": 0.1,
+                **self.summary_model_config,
             }
-            config = {**default_config, **self.summary_model_config}
-            
-            # Initialize OpenAI client
-            self._openai_client = openai.OpenAI(
-                api_key=config["api_key"],
-                base_url=config["base_url"]
+            self._summary_model = OpenAIServerModel(
+                model_id=config.pop("model"),
+                api_base=config.pop("base_url"),
+                api_key=config.pop("api_key"),
+                **config,
             )
-            
-            # Store model configuration for later use
-            self._summary_model_config = {
-                "model": config["model"],
-                "max_completion_tokens": config["max_tokens"],
-                "temperature": config["temperature"],
-                "response_format": {
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "save_summary",
-                        "strict": True,
-                        "schema": {
-                            "type": "object",
-                            "properties": {
-                                "summary_messages": {
-                                    "type": "array",
-                                    "description": "A list of summarized message objects, each with role and content.",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "role": {"type": "string", "enum": ["system", "user", "assistant"]},
-                                            "content": {"type": "string"},
-                                        },
-                                        "required": ["role", "content"],
-                                    }
-                                }
-                            },
-                            "required": ["summary_messages"]
-                        }
-                    }
-                }
-            }
-            
-            self.logger.log("Summary model initialized successfully with native OpenAI client", level=LogLevel.INFO)
-            
-        except Exception as e:
-            self.logger.log(f"Failed to initialize summary model: {e}", level=LogLevel.ERROR)
-            self._openai_client = None
-            self._summary_model_config = None
-            self._summary_prompt_templates = None
 
     def run(
         self,
@@ -539,6 +518,7 @@ class MultiStepAgent(ABC):
         images: list["PIL.Image.Image"] | None = None,
         additional_args: dict | None = None,
         max_steps: int | None = None,
+        cancellation_token: CancellationToken | None = None,
     ):
         """
         Run the agent for the given task.
@@ -552,6 +532,9 @@ class MultiStepAgent(ABC):
             images (`list[PIL.Image.Image]`, *optional*): Image(s) objects.
             additional_args (`dict`, *optional*): Any other variables that you want to pass to the agent run, for instance images or dataframes. Give them clear names!
             max_steps (`int`, *optional*): Maximum number of steps the agent can take to solve the task. if not provided, will use the agent's default value.
+            cancellation_token (`CancellationToken`, *optional*): Token to cancel the run. Defaults to a child of the token
+                of the run in progress, if any, so that cancelling a manager also cancels its managed agents, their tools
+                and their model calls.
 
         Example:
         ```py
@@ -563,6 +546,10 @@ class MultiStepAgent(ABC):
         max_steps = max_steps or self.max_steps
         self.task = task
         self.interrupt_switch = False
+        if cancellation_token is None:
+            parent_token = get_cancellation_token()
+            cancellation_token = parent_token.child() if parent_token is not None else CancellationToken()
+        self.cancellation_token = cancellation_token
         if additional_args is not None:
             self.state.update(additional_args)
             self.task += f"""
@@ -588,11 +575,12 @@ You have been provided with these additional arguments, that you can access usin
 
         if stream:
             # The steps are returned as they are executed through a generator to iterate on.
-            return self._run_stream(task=self.task, max_steps=max_steps, images=images)
+            return self._run_stream_with_cancellation(task=self.task, max_steps=max_steps, images=images)
         run_start_time = time.time()
         # Outputs are returned only at the end. We only look at the last step.
 
-        steps = list(self._run_stream(task=self.task, max_steps=max_steps, images=images))
+        with trace_span(f"run:{self.name or self.agent_name}", "run"):
+            steps = list(self._run_stream_with_cancellation(task=self.task, max_steps=max_steps, images=images))
         assert isinstance(steps[-1], FinalAnswerStep)
         output = steps[-1].output
 
@@ -626,10 +614,22 @@ You have been provided with these additional arguments, that you can access usin
                 messages=messages,
                 timing=Timing(start_time=run_start_time, end_time=time.time()),
                 state=state,
+                message_log=self.memory.get_message_log(),
             )
 
         return output
 
+    def _run_stream_with_cancellation(
+        self, task: str, max_steps: int, images: list["PIL.Image.Image"] | None = None
+    ) -> Generator[ActionStep | PlanningStep | FinalAnswerStep | ChatMessageStreamDelta]:
+        """Run `_run_stream` with the cancellation token of the run active, so that managed agents, tools and model
+        calls can find it."""
+        try:
+            with self.cancellation_token.activate():
+                yield from self._run_stream(task=task, max_steps=max_steps, images=images)
+        finally:
+            self._shutdown_summary_executor()
+
     def _run_stream(
         self, task: str, max_steps: int, images: list["PIL.Image.Image"] | None = None
     ) -> Generator[ActionStep | PlanningStep | FinalAnswerStep | ChatMessageStreamDelta]:
@@ -638,6 +638,9 @@ You have been provided with these additional arguments, that you can access usin
         while not returned_final_answer and self.step_number <= max_steps:
             if self.interrupt_switch:
                 raise AgentError("Agent interrupted.", self.logger)
+            if self.cancellation_token.cancelled:
+                raise AgentCancelledError(f"Agent cancelled: {self.cancellation_token.reason}", self.logger)
+            self._apply_pending_summary()
 
             # Run a planning step if scheduled
             if self.planning_interval is not None and (
@@ -684,7 +687,11 @@ You have been provided with these additional arguments, that you can access usin
                         returned_final_answer = True
                         action_step.is_final_answer = True
 
+            except AgentCancelledError:
+                raise
             except AgentGenerationError as e:
+                if self.cancellation_token.cancelled:
+                    raise AgentCancelledError(f"Agent cancelled: {self.cancellation_token.reason}", self.logger) from e
                 # Agent generation errors are not caused by a Model error but an implementation error: so we should raise them and exit.
                 raise e
             except AgentError as e:
@@ -710,10 +717,40 @@ You have been provided with these additional arguments, that you can access usin
 
     def _finalize_step(self, memory_step: ActionStep | PlanningStep):
         memory_step.timing.end_time = time.time()
+        tracer = get_active_tracer()
+        if tracer is not None:
+            tracer.add_span(
+                f"step {memory_step.step_number}" if isinstance(memory_step, ActionStep) else "planning",
+                "step",
+                memory_step.timing.start_time,
+                memory_step.timing.end_time,
+                agent=self.name or self.agent_name,
+            )
+        if (
+            memory_step.estimated_input_tokens
+            and memory_step.token_usage
+            and memory_step.token_usage.input_tokens
+            and not memory_step.token_usage_estimated
+        ):
+            self.logger.log(
+                f"Input tokens: {memory_step.estimated_input_tokens} estimated, {memory_step.token_usage.input_tokens} actual",
+                level=LogLevel.DEBUG,
+            )
+            self.token_estimator.calibrate(memory_step.estimated_input_tokens, memory_step.token_usage.input_tokens)
         self.step_callbacks.callback(memory_step, agent=self)
         # Check if memory compression is needed after this step
         self._check_and_summarize_memory_if_needed(memory_step)
 
+    def _trace_model_stream(self, start_time: float, first_token_time: float | None):
+        """Record the spans of a streamed model call, including the time to first token."""
+        tracer = get_active_tracer()
+        if tracer is None:
+            return
+        end_time = time.time()
+        tracer.add_span("model.generate_stream", "model", start_time, end_time, model_id=self.model.model_id)
+        if first_token_time is not None:
+            tracer.add_span("time_to_first_token", "model", start_time, first_token_time, model_id=self.model.model_id)
+
     def _handle_max_steps_reached(self, task: str, images: list["PIL.Image.Image"]) -> Any:
         action_step_start_time = time.time()
         final_answer = self.provide_final_answer(task, images)
@@ -776,7 +813,9 @@ You have been provided with these additional arguments, that you can access usin
         else:
             # Summary mode removes the system prompt and previous planning messages output by the model.
             # Removing previous planning messages avoids influencing too much the new plan.
-            memory_messages = self.write_memory_to_messages(summary_mode=True)
+            memory_messages = self._fit_messages_to_context(
+                self.write_memory_to_messages(summary_mode=True), summary_mode=True
+            )
             plan_update_pre = ChatMessage(
                 role=MessageRole.SYSTEM,
                 content=[
@@ -840,11 +879,12 @@ You have been provided with these additional arguments, that you can access usin
         self.logger.log(rule, level=LogLevel.INFO)
         self.logger.log_markdown(plan, title=log_headline, level=LogLevel.INFO)
         yield PlanningStep(
-            model_input_messages=input_messages,
+            model_input_messages=self.memory.reference_messages(input_messages),
             plan=plan,
             model_output_message=ChatMessage(role=MessageRole.ASSISTANT, content=plan_message_content),
             token_usage=TokenUsage(input_tokens=input_tokens, output_tokens=output_tokens),
             timing=Timing(start_time=start_time, end_time=time.time()),
+            estimated_input_tokens=self.token_estimator.estimate(input_messages),
         )
 
     @property
@@ -860,8 +900,38 @@ You have been provided with these additional arguments, that you can access usin
         ...
 
     def interrupt(self):
-        """Interrupts the agent execution."""
+        """Interrupts the agent execution, cancelling its managed agents, tool calls and model calls in progress."""
         self.interrupt_switch = True
+        if self.cancellation_token is not None:
+            self.cancellation_token.cancel("Agent interrupted.")
+
+    def clone(self) -> "MultiStepAgent":
+        """Return a copy of the agent that can run concurrently with it.
+
+        The copy shares the model, tools, prompt templates and logger, but has its own memory, monitor, state and
+        step callbacks, and clones of the managed agents.
+        """
+        clone = copy.copy(self)
+        clone.state = {}
+        clone.memory = AgentMemory(self.system_prompt)
+        clone.monitor = Monitor(self.model, self.logger)
+        clone.step_callbacks = CallbackRegistry()
+        for step_cls, callbacks in self.step_callbacks._callbacks.items():
+            for callback in callbacks:
+                if callback == self.monitor.update_metrics:
+                    callback = clone.monitor.update_metrics
+                clone.step_callbacks.register(step_cls, callback)
+        clone.managed_agents = {name: agent.clone() for name, agent in self.managed_agents.items()}
+        clone._pending_summary = None
+        clone._summary_executor = None
+        return clone
+
+    def cleanup(self):
+        """Clean up resources used by the agent and its managed agents."""
+        self._shutdown_summary_executor()
+        for agent in self.managed_agents.values():
+            if hasattr(agent, "cleanup"):
+                agent.cleanup()
 
     def write_memory_to_messages(
         self,
@@ -872,314 +942,189 @@ You have been provided with these additional arguments, that you can access usin
         that can be used as input to the LLM. Adds a number of keywords (such as PLAN, error, etc) to help
         the LLM.
         """
-        messages = self.memory.system_prompt.to_messages(summary_mode=summary_mode)
-        for memory_step in self.memory.steps:
-            messages.extend(memory_step.to_messages(summary_mode=summary_mode))
+        return self.memory_policy.to_messages(self.memory, summary_mode=summary_mode)
+
+    def _fit_messages_to_context(
+        self, messages: list[ChatMessage], memory_step: ActionStep | None = None, summary_mode: bool = False
+    ) -> list[ChatMessage]:
+        """Estimate the input tokens of `messages` and make them fit in `context_token_budget`.
+
+        If the estimate exceeds the budget, the memory is first compressed (when memory summarization is enabled).
+        If it still does not fit, the oldest steps following the system prompt and the task are dropped, whole so that
+        no observation is separated from the action it answers. Without a budget, `messages` are returned as they are and nothing is estimated.
+
+        Args:
+            messages (`list[ChatMessage]`): Input messages written from memory with `write_memory_to_messages`.
+            memory_step (`ActionStep`, *optional*): Step for which the estimate is recorded, to be calibrated once the
+                actual token usage is known.
+            summary_mode (`bool`, default `False`): Whether `messages` were written from memory in summary mode.
+        """
+        if self.context_token_budget is None:
+            return messages
+        estimated_tokens = self.token_estimator.estimate(messages)
+        if estimated_tokens > self.context_token_budget:
+            self.logger.log(
+                f"Estimated input ({estimated_tokens} tokens) exceeds the context budget ({self.context_token_budget}).",
+                level=LogLevel.INFO,
+            )
+            if self.enable_memory_summarization:
+                self._compress_memory_contents()
+                messages = self.write_memory_to_messages(summary_mode=summary_mode)
+                estimated_tokens = self.token_estimator.estimate(messages)
+            if estimated_tokens > self.context_token_budget:
+                # Keep the system prompt and the task, then the most recent steps
+                groups = self.memory_policy.to_step_messages(self.memory, summary_mode=summary_mode)
+                head_length = next(
+                    (
+                        i + 1
+                        for i, group in enumerate(groups)
+                        if any(message.role == MessageRole.USER for message in group)
+                    ),
+                    len(groups),
+                )
+                head, tail = groups[:head_length], groups[head_length:]
+                tail_tokens = [self.token_estimator.estimate(group) for group in tail]
+                dropped = 0
+                while dropped < len(tail) and estimated_tokens > self.context_token_budget:
+                    estimated_tokens -= tail_tokens[dropped]
+                    dropped += 1
+                dropped_messages = sum(len(group) for group in tail[:dropped])
+                tail = tail[dropped:]
+                self.logger.log(
+                    f"Trimmed the {dropped} oldest steps ({dropped_messages} messages) to fit the context budget.",
+                    level=LogLevel.INFO,
+                )
+                messages = [message for group in head + tail for message in group]
+        if memory_step is not None:
+            memory_step.estimated_input_tokens = estimated_tokens
         return messages
 
     def _check_and_summarize_memory_if_needed(self, step: ActionStep | PlanningStep):
-        """Check if memory summarization is needed based on actual token usage."""
+        """Schedule a background summary of the oldest steps if the step exceeded the memory token limit."""
         if not self.enable_memory_summarization or not step.token_usage:
-            # self.logger.log_error("Memory summarization is disabled or token usage is not available.")
             return
-            
+
         total_tokens = step.token_usage.input_tokens + step.token_usage.output_tokens
         if total_tokens > self.memory_token_limit:
             self.logger.log(
-                f"Step token usage ({total_tokens} tokens) exceeds limit ({self.memory_token_limit}). Summarizing memory...", 
-                level=LogLevel.INFO
+                f"Step token usage ({total_tokens} tokens) exceeds limit ({self.memory_token_limit}). "
+                "Summarizing the oldest steps in the background...",
+                level=LogLevel.INFO,
             )
-                         # Summarize the memory by compressing message contents
-            self._compress_memory_contents()
-
-    def _compress_memory_contents(self):
-        """Compress memory contents while maintaining the same message structure."""
-        if not self._openai_client or not self._summary_model_config or not self._summary_prompt_templates:
-            self.logger.log("Summary model not available for compression", level=LogLevel.INFO)
-            return
-            
-        try:
-            # Get current memory as messages
-            current_messages = self.write_memory_to_messages()
-            
-            if not current_messages:
-                return
-                
-            # Prepare messages text for compression
-            messages_text = ""
-            for i, msg in enumerate(current_messages):
-                role = msg.role.value if hasattr(msg.role, 'value') else str(msg.role)
-                content = ""
-                if isinstance(msg.content, str):
-                    content = msg.content
-                elif isinstance(msg.content, list):
-                    content = " ".join([
-                        item.get("text", "") for item in msg.content 
+            self._schedule_summary()
+
+    def _summary_start(self) -> int:
+        """Index of the first step that can be summarized: the one following the first task."""
+        return next((i + 1 for i, step in enumerate(self.memory.steps) if isinstance(step, TaskStep)), 0)
+
+    def _summary_prefix(self) -> tuple[int, list[MemoryStep]]:
+        """Return the start index and the oldest steps to summarize: the previous summary, if any, and the next
+        `summary_oldest_steps` steps, always keeping the last `summary_keep_steps` steps verbatim."""
+        steps = self.memory.steps
+        start = self._summary_start()
+        end = start + (1 if start < len(steps) and isinstance(steps[start], SummaryStep) else 0)
+        end = min(end + self.summary_oldest_steps, len(steps) - self.summary_keep_steps)
+        if end - start < 2:
+            return start, []
+        return start, steps[start:end]
+
+    def _render_summary_prompt(self, steps: list[MemoryStep]) -> list[ChatMessage]:
+        messages_text = ""
+        message_count = 0
+        for step in steps:
+            for message in step.to_messages(summary_mode=False):
+                message_count += 1
+                if isinstance(message.content, list):
+                    content = " ".join(
+                        item.get("text", "")
+                        for item in message.content
                         if isinstance(item, dict) and item.get("type") == "text"
-                    ])
+                    )
                 else:
-                    content = str(msg.content)
-                messages_text += f"Message {i+1} (role: {role}):\n{content}\n{'='*50}\n\n"
-
-            # Create compression request
-            compression_prompt = populate_template(
-                self._summary_prompt_templates["user_prompt"],
-                variables={
-                    "messages": messages_text,
-                    "message_count": len(current_messages)
-                }
-            )
-            
-            # Prepare messages for OpenAI client format
-            messages = [
-                {
-                    "role": "system",
-                    "content": self._summary_prompt_templates["system_prompt"]
-                },
-                {
-                    "role": "user", 
-                    "content": compression_prompt
-                }
-            ]
+                    content = str(message.content or "")
+                messages_text += f"Message {message_count} (role: {MessageRole(message.role).value}):\n{content}\n{'=' * 50}\n\n"
+        user_prompt = populate_template(
+            self._summary_prompt_templates["user_prompt"],
+            variables={"messages": messages_text, "message_count": message_count},
+        )
+        return [
+            ChatMessage(
+                role=MessageRole.SYSTEM,
+                content=[{"type": "text", "text": self._summary_prompt_templates["system_prompt"]}],
+            ),
+            ChatMessage(role=MessageRole.USER, content=[{"type": "text", "text": user_prompt}]),
+        ]
 
-            # Call OpenAI API with response_format to enforce JSON
-            completion = self._openai_client.chat.completions.create(
-                messages=messages,
-                **self._summary_model_config
-            )
-            
-            compression_content = completion.choices[0].message.content
-
-            if compression_content:
-                try:
-                    # Parse JSON response (should be guaranteed by response_format)
-                    compression_data = json.loads(compression_content)
-                    if isinstance(compression_data, dict) and "summary_messages" in compression_data:
-                        compressed_messages = compression_data["summary_messages"]
-                        
-                        if not isinstance(compressed_messages, list):
-                            self.logger.log(
-                                f"Warning: 'summary_messages' is not a list. Got {type(compressed_messages)}. Using original messages.",
-                                level=LogLevel.INFO
-                            )
-                            return
-                        
-                        # Update memory contents with compressed versions
-                        self._apply_compressed_contents(compressed_messages)
-                        
-                        self.logger.log(
-                            f"Memory content compressed successfully.",
-                            level=LogLevel.INFO
-                        )
-                        
-                        return
-                    else:
-                        self.logger.log("Compression model returned invalid format", level=LogLevel.INFO)
-                        return
-                        
-                except json.JSONDecodeError as e:
-                    self.logger.log(f"Compression model returned non-JSON response despite response_format: {e}", level=LogLevel.ERROR)
-                    return
-            else:
-                self.logger.log("Compression model returned empty response", level=LogLevel.ERROR)
-                return
+    def _schedule_summary(self):
+        """Summarize the oldest steps on the summary thread, unless a summary is already pending.
 
-        except Exception as e:
-            self.logger.log(f"Error during memory compression: {e}", level=LogLevel.ERROR)
+        Summaries are cached by the hash of the rendered steps, so an unchanged prefix is swapped in immediately.
+        """
+        if self._summary_model is None or self._pending_summary is not None:
             return
-
-    def _apply_compressed_contents(self, compressed_messages: list[dict]):
-        """Apply compressed contents by rebuilding memory from summarized messages."""
-        try:
-            from .memory import ActionStep, PlanningStep
-            from .models import MessageRole, ChatMessage
-            from .monitoring import Timing
-            import time
-
-            new_steps = []
-            current_time = time.time()
-            timing = Timing(start_time=current_time, end_time=current_time)
-            for i, msg_data in enumerate(compressed_messages):
-                role_str = msg_data.get("role", "assistant")
-                content = str(msg_data.get("content", ""))  # Ensure content is string
-
-                try:
-                    role = MessageRole(role_str.lower())
-                except ValueError:
-                    self.logger.log(f"Warning: Invalid role '{role_str}' in summary, defaulting to 'assistant'.", level=LogLevel.INFO)
-                    role = MessageRole.ASSISTANT
-
-                if role == MessageRole.ASSISTANT:
-                    step = ActionStep(step_number=i + 1, timing=timing)
-                    step.model_output = content
-                else:
-                    # For non-assistant roles, we use a PlanningStep as a simple container.
-                    # Its `to_messages` method will render the content as an assistant message.
-                    # This is a simplification; the original role is preserved as a prefix in the text.
-                    plan_content = f"[{role.value.upper()}] {content}"
-                    step = PlanningStep(
-                        plan=plan_content,
-                        model_input_messages=[],
-                        model_output_message=ChatMessage(role=MessageRole.ASSISTANT, content=plan_content),
-                        timing=timing,
-                    )
-                
-                new_steps.append(step)
-
-            original_steps_count = len(self.memory.steps)
-            self.memory.steps = new_steps
-            
-            self.logger.log(
-                f"Successfully compressed {original_steps_count} memory steps into {len(new_steps)} summarized steps.",
-                level=LogLevel.INFO
-            )
-            
-        except Exception as e:
-            self.logger.log(f"Error applying compressed contents: {e}", level=LogLevel.ERROR)
-
-    def _summarize_memory(self, messages: list[ChatMessage]) -> list[ChatMessage]:
-        """Summarize the memory using the summary model."""
-        if not self._openai_client or not self._summary_model_config or not self._summary_prompt_templates:
-            self.logger.log("Summary model not available, skipping summarization", level=LogLevel.INFO)
-            return messages
-
+        start, prefix = self._summary_prefix()
+        if not prefix:
+            return
+        summary_messages = self._render_summary_prompt(prefix)
+        prefix_hash = hashlib.sha256(
+            "\n".join(message.content[0]["text"] for message in summary_messages).encode("utf-8")
+        ).hexdigest()
+        if prefix_hash in self._summary_cache:
+            self._swap_in_summary(prefix, self._summary_cache[prefix_hash])
+            return
+        if self._summary_executor is None:
+            self._summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+        future = self._summary_executor.submit(self._summary_model.generate, summary_messages)
+        self._pending_summary = (prefix, prefix_hash, future)
+
+    def _apply_pending_summary(self, wait: bool = False):
+        """Swap in the pending summary if it is ready, or wait for it if `wait` is set."""
+        if self._pending_summary is None:
+            return
+        prefix, prefix_hash, future = self._pending_summary
+        if not wait and not future.done():
+            return
+        self._pending_summary = None
         try:
-            # Convert all messages to a format suitable for the summary model
-            messages_text = ""
-            for i, msg in enumerate(messages):
-                role = msg.role.value if hasattr(msg.role, 'value') else str(msg.role)
-                content = ""
-                if isinstance(msg.content, str):
-                    content = msg.content
-                elif isinstance(msg.content, list):
-                    content = " ".join([
-                        item.get("text", "") for item in msg.content 
-                        if isinstance(item, dict) and item.get("type") == "text"
-                    ])
-                messages_text += f"Message {i+1} (role: {role}):\n{content}\n{'='*50}\n\n"
-
-            # Create summary request
-            summary_prompt = populate_template(
-                self._summary_prompt_templates["user_prompt"],
-                variables={"messages": messages_text}
-            )
-            
-            # Prepare messages for OpenAI client format
-            summary_messages = [
-                {
-                    "role": "system",
-                    "content": self._summary_prompt_templates["system_prompt"]
-                },
-                {
-                    "role": "user",
-                    "content": summary_prompt
-                }
-            ]
-
-            # Call OpenAI API with response_format to enforce JSON
-            completion = self._openai_client.chat.completions.create(
-                messages=summary_messages,
-                **self._summary_model_config
-            )
-            
-            summary_content = completion.choices[0].message.content
-
-            if summary_content:
-                # Convert content to string if it's not already
-                if isinstance(summary_content, list):
-                    # Extract text from content list
-                    content_text = ""
-                    for item in summary_content:
-                        if isinstance(item, dict) and item.get("type") == "text":
-                            content_text += item.get("text", "")
-                    summary_content = content_text
-                elif not isinstance(summary_content, str):
-                    summary_content = str(summary_content)
-                    
-                try:
-                    # Try to parse as JSON
-                    summary_data = json.loads(summary_content)
-                    if isinstance(summary_data, dict) and "summary_messages" in summary_data:
-                        # Reconstruct summarized messages from JSON response
-                        summarized_messages = []
-                        
-                        for msg_data in summary_data["summary_messages"]:
-                            role_str = msg_data.get("role", "user").lower()
-                            content = msg_data.get("content", "")
-                            
-                            # Map role strings to MessageRole enum
-                            role_mapping = {
-                                "system": MessageRole.SYSTEM,
-                                "user": MessageRole.USER,
-                                "assistant": MessageRole.ASSISTANT,
-                                "tool_call": MessageRole.TOOL_CALL,
-                                "tool_response": MessageRole.TOOL_RESPONSE
-                            }
-                            role = role_mapping.get(role_str, MessageRole.USER)
-                            
-                            summarized_messages.append(
-                                ChatMessage(
-                                    role=role,
-                                    content=[{"type": "text", "text": content}]
-                                )
-                            )
-                        
-                        # Log compression statistics
-                        compression_stats = summary_data.get("compression_stats", {})
-                        original_count = compression_stats.get("original_message_count", len(messages))
-                        summary_count = compression_stats.get("summary_message_count", len(summarized_messages))
-                        compression_ratio = compression_stats.get("compression_ratio", "unknown")
-                        
-                        self.logger.log(
-                            f"Memory summarized successfully: {original_count} -> {summary_count} messages. "
-                            f"Compression ratio: {compression_ratio}",
-                            level=LogLevel.INFO
-                        )
-                        
-                        # Log preserved context info
-                        preserved_context = summary_data.get("preserved_context", {})
-                        if preserved_context:
-                            self.logger.log(
-                                f"Preserved context: {len(preserved_context.get('task_objectives', []))} objectives, "
-                                f"{len(preserved_context.get('key_decisions', []))} decisions, "
-                                f"{len(preserved_context.get('successful_patterns', []))} patterns",
-                                level=LogLevel.DEBUG
-                            )
-                        
-                        return summarized_messages
-                    else:
-                        # Fallback: treat as simple text summary
-                        self.logger.log("Summary model returned non-structured response, using simple summary", level=LogLevel.INFO)
-                        return self._create_fallback_summary(messages, summary_content)
-                        
-                except json.JSONDecodeError as e:
-                    # Fallback: treat as simple text summary
-                    self.logger.log(f"Summary model returned non-JSON response: {e}, using simple summary", level=LogLevel.INFO)
-                    return self._create_fallback_summary(messages, summary_content)
-            else:
-                self.logger.log("Summary model returned empty response", level=LogLevel.ERROR)
-                return messages
-
+            summary = future.result().content
         except Exception as e:
             self.logger.log(f"Error during memory summarization: {e}", level=LogLevel.ERROR)
-            return messages
-
-    def _create_fallback_summary(self, original_messages: list[ChatMessage], summary_text: str) -> list[ChatMessage]:
-        """Create a fallback summary when JSON parsing fails."""
-        # Keep the system prompt if it exists
-        fallback_messages = []
-        if original_messages and original_messages[0].role == MessageRole.SYSTEM:
-            fallback_messages.append(original_messages[0])
-        
-        # Add the summary as a single user message
-        fallback_messages.append(
-            ChatMessage(
-                role=MessageRole.USER,
-                content=[{"type": "text", "text": f"[SUMMARIZED MEMORY]:\n{summary_text}"}]
-            )
+            return
+        if not summary:
+            self.logger.log("Summary model returned an empty summary", level=LogLevel.ERROR)
+            return
+        self._summary_cache[prefix_hash] = summary
+        self._swap_in_summary(prefix, summary)
+
+    def _swap_in_summary(self, prefix: list[MemoryStep], summary: str):
+        """Replace the summarized steps with a `SummaryStep`, if they are still in memory unchanged."""
+        steps = self.memory.steps
+        start = self._summary_start()
+        if len(steps) < start + len(prefix) or any(a is not b for a, b in zip(steps[start:], prefix)):
+            self.logger.log("Memory changed during summarization, discarding the summary.", level=LogLevel.DEBUG)
+            return
+        summarized_steps = sum(step.summarized_steps if isinstance(step, SummaryStep) else 1 for step in prefix)
+        summary_step = SummaryStep(summary=summary, summarized_steps=summarized_steps)
+        # Build a new list and assign it in one go, so that the memory is never seen half-summarized
+        self.memory.steps = steps[:start] + [summary_step] + steps[start + len(prefix) :]
+        self.logger.log(
+            f"Summarized the {summarized_steps} oldest memory steps.",
+            level=LogLevel.INFO,
         )
-        
-        return fallback_messages
+
+    def _shutdown_summary_executor(self):
+        """Drop the pending summary and stop the summary thread, which is started again by the next summary."""
+        self._pending_summary = None
+        if self._summary_executor is not None:
+            self._summary_executor.shutdown(wait=False, cancel_futures=True)
+            self._summary_executor = None
+
+    def _compress_memory_contents(self):
+        """Summarize the oldest steps of the memory, waiting for the summary."""
+        if not self.enable_memory_summarization:
+            return
+        self._schedule_summary()
+        self._apply_pending_summary(wait=True)
 
     def _step_stream(
         self, memory_step: ActionStep
@@ -1287,7 +1232,8 @@ You have been provided with these additional arguments, that you can access usin
             self.prompt_templates["managed_agent"]["task"],
             variables=dict(name=self.name, task=task),
         )
-        result = self.run(full_task, **kwargs)
+        with trace_span(f"agent:{self.name}", "agent"):
+            result = self.run(full_task, **kwargs)
         if isinstance(result, RunResult):
             report = result.output
         else:
@@ -1687,13 +1633,15 @@ class ToolCallingAgent(MultiStepAgent):
         """
         memory_messages = self.write_memory_to_messages()
 
-        input_messages = memory_messages.copy()
+        input_messages = self._fit_messages_to_context(memory_messages.copy(), memory_step)
 
         # Add new step in logs
-        memory_step.model_input_messages = input_messages
+        memory_step.model_input_messages = self.memory.reference_messages(input_messages)
 
         try:
             if self.stream_outputs and hasattr(self.model, "generate_stream"):
+                model_start_time = time.time()
+                first_token_time = None
                 output_stream = self.model.generate_stream(
                     input_messages,
                     stop_sequences=["Observation:", "Calling tools:"],
@@ -1702,16 +1650,20 @@ class ToolCallingAgent(MultiStepAgent):
 
                 chat_message_stream_deltas: list[ChatMessageStreamDelta] = []
                 for event in output_stream:
+                    if first_token_time is None:
+                        first_token_time = time.time()
                     chat_message_stream_deltas.append(event)
                     self.logger.log(agglomerate_stream_deltas(chat_message_stream_deltas).render_as_markdown(), level=LogLevel.INFO)
                     yield event
                 chat_message = agglomerate_stream_deltas(chat_message_stream_deltas)
+                self._trace_model_stream(model_start_time, first_token_time)
             else:
-                chat_message: ChatMessage = self.model.generate(
-                    input_messages,
-                    stop_sequences=["Observation:", "Calling tools:"],
-                    tools_to_call_from=self.tools_and_managed_agents,
-                )
+                with trace_span("model.generate", "model", model_id=self.model.model_id):
+                    chat_message: ChatMessage = self.model.generate(
+                        input_messages,
+                        stop_sequences=["Observation:", "Calling tools:"],
+                        tools_to_call_from=self.tools_and_managed_agents,
+                    )
                 if chat_message.content is None and chat_message.raw is not None:
                     log_content = str(chat_message.raw)
                 else:
@@ -1912,7 +1864,8 @@ class CodeAgent(MultiStepAgent):
         prompt_templates ([`~agents.PromptTemplates`], *optional*): Prompt templates.
         additional_authorized_imports (`list[str]`, *optional*): Additional authorized imports for the agent.
         planning_interval (`int`, *optional*): Interval at which the agent will run a planning step.
-        executor_type (`Literal["local", "e2b", "docker", "wasm"]`, default `"local"`): Type of code executor.
+        executor_type (`Literal["local", "process", "e2b", "docker", "wasm"]`, default `"local"`): Type of code executor.
+            `"process"` runs the code in a child process with time and memory limits, see [`ProcessExecutor`].
         executor_kwargs (`dict`, *optional*): Additional arguments to pass to initialize the executor.
         max_print_outputs_length (`int`, *optional*): Maximum length of the print outputs.
         stream_outputs (`bool`, *optional*, default `False`): Whether to stream outputs during execution.
@@ -1924,6 +1877,8 @@ class CodeAgent(MultiStepAgent):
             Parameter `grammar` is deprecated and will be removed in version 1.20.
             </Deprecated>
         code_block_tags (`tuple[str, str]` | `Literal["markdown"]`, *optional*): Opening and closing tags for code blocks (regex strings). Pass a custom tuple, or pass 'markdown' to use ("```(?:python|py)", "\\n```"), leave empty to use ("<code>", "</code>").
+        stream_early_stop (`bool`, default `True`): When streaming outputs, whether to abort the stream client-side as soon as the code block is closed or a stop sequence is generated, for servers ignoring stop sequences.
+        stream_render_interval (`float`, default `0.1`): When streaming outputs, minimum interval in seconds between two refreshes of the live display.
         **kwargs: Additional keyword arguments.
     """
 
@@ -1934,13 +1889,15 @@ class CodeAgent(MultiStepAgent):
         prompt_templates: PromptTemplates | None = None,
         additional_authorized_imports: list[str] | None = None,
         planning_interval: int | None = None,
-        executor_type: Literal["local", "e2b", "docker", "wasm"] = "local",
+        executor_type: Literal["local", "process", "e2b", "docker", "wasm"] = "local",
         executor_kwargs: dict[str, Any] | None = None,
         max_print_outputs_length: int | None = None,
         stream_outputs: bool = False,
         use_structured_outputs_internally: bool = False,
         grammar: dict[str, str] | None = None,
         code_block_tags: str | tuple[str, str] | None = None,
+        stream_early_stop: bool = True,
+        stream_render_interval: float = 0.1,
         **kwargs,
     ):
         self.additional_authorized_imports = additional_authorized_imports if additional_authorized_imports else []
@@ -1977,6 +1934,8 @@ class CodeAgent(MultiStepAgent):
             **kwargs,
         )
         self.stream_outputs = stream_outputs
+        self.stream_early_stop = stream_early_stop
+        self.stream_render_interval = stream_render_interval
         if self.stream_outputs and not hasattr(self.model, "generate_stream"):
             raise ValueError(
                 "`stream_outputs` is set to True, but the model class implements no `generate_stream` method."
@@ -1986,7 +1945,7 @@ class CodeAgent(MultiStepAgent):
                 "Caution: you set an authorization for all imports, meaning your agent can decide to import any package it deems necessary. This might raise issues if the package is not installed in your environment.",
                 level=LogLevel.INFO,
             )
-        if executor_type not in {"local", "e2b", "docker", "wasm"}:
+        if executor_type not in {"local", "process", "e2b", "docker", "wasm"}:
             raise ValueError(f"Unsupported executor type: {executor_type}")
         self.executor_type = executor_type
         self.executor_kwargs: dict[str, Any] = executor_kwargs or {}
@@ -1999,9 +1958,20 @@ class CodeAgent(MultiStepAgent):
         self.cleanup()
 
     def cleanup(self):
-        """Clean up resources used by the agent, such as the remote Python executor."""
+        """Clean up resources used by the agent and its managed agents, such as the Python executor."""
         if hasattr(self.python_executor, "cleanup"):
             self.python_executor.cleanup()
+        super().cleanup()
+
+    def clone(self) -> "CodeAgent":
+        if self.executor_type not in {"local", "process"}:
+            # Each clone would start a sandbox of its own
+            raise ValueError(
+                f"An agent with a {self.executor_type} executor can't be cloned, e.g. to be submitted: call it directly."
+            )
+        clone = super().clone()
+        clone.python_executor = clone.create_python_executor()
+        return clone
 
     def create_python_executor(self) -> PythonExecutor:
         if self.executor_type == "local":
@@ -2009,6 +1979,11 @@ class CodeAgent(MultiStepAgent):
                 self.additional_authorized_imports,
                 **{"max_print_outputs_length": self.max_print_outputs_length} | self.executor_kwargs,
             )
+        elif self.executor_type == "process":
+            return ProcessExecutor(
+                self.additional_authorized_imports,
+                **{"max_print_outputs_length": self.max_print_outputs_length} | self.executor_kwargs,
+            )
         else:
             if self.managed_agents:
                 raise Exception("Managed agents are not yet supported with remote code execution.")
@@ -2043,9 +2018,9 @@ class CodeAgent(MultiStepAgent):
         """
         memory_messages = self.write_memory_to_messages()
 
-        input_messages = memory_messages.copy()
+        input_messages = self._fit_messages_to_context(memory_messages.copy(), memory_step)
         ### Generate model output ###
-        memory_step.model_input_messages = input_messages
+        memory_step.model_input_messages = self.memory.reference_messages(input_messages)
         stop_sequences = ["Observation:", "Calling tools:"]
         if self.code_block_tags[1] not in self.code_block_tags[0]:
             # If the closing tag is contained in the opening tag, adding it as a stop sequence would cut short any code generation
@@ -2057,28 +2032,62 @@ class CodeAgent(MultiStepAgent):
             if self._use_structured_outputs_internally:
                 additional_args["response_format"] = CODEAGENT_RESPONSE_FORMAT
             if self.stream_outputs:
+                model_start_time = time.time()
+                first_token_time = None
                 output_stream = self.model.generate_stream(
                     input_messages,
                     stop_sequences=stop_sequences,
                     **additional_args,
                 )
                 chat_message_stream_deltas: list[ChatMessageStreamDelta] = []
+                # The code block is parsed incrementally, so that the stream can be aborted as soon as it is closed
+                stream_parser = StreamingCodeBlockParser(
+                    self.code_block_tags,
+                    stop_sequences=[sequence for sequence in stop_sequences if sequence != self.code_block_tags[1]],
+                )
+                last_render_time = 0.0
                 with Live("", console=self.logger.console, vertical_overflow="visible") as live:
-                    for event in output_stream:
-                        chat_message_stream_deltas.append(event)
-                        live.update(
-                            Markdown(agglomerate_stream_deltas(chat_message_stream_deltas).render_as_markdown())
-                        )
-                        yield event
+                    try:
+                        for event in output_stream:
+                            self.cancellation_token.raise_if_cancelled()
+                            if first_token_time is None:
+                                first_token_time = time.time()
+                            chat_message_stream_deltas.append(event)
+                            stream_parser.feed(event.content)
+                            if time.time() - last_render_time >= self.stream_render_interval:
+                                live.update(Markdown(stream_parser.text))
+                                last_render_time = time.time()
+                            yield event
+                            if self.stream_early_stop and stream_parser.done:
+                                self.logger.log(
+                                    "Code block complete: aborting the output stream.", level=LogLevel.DEBUG
+                                )
+                                break
+                    finally:
+                        if hasattr(output_stream, "close"):
+                            output_stream.close()
+                    live.update(Markdown(stream_parser.text))
+                self._trace_model_stream(model_start_time, first_token_time)
                 chat_message = agglomerate_stream_deltas(chat_message_stream_deltas)
+                if self.stream_early_stop and stream_parser.done:
+                    chat_message.content = stream_parser.text
+                    if chat_message.token_usage is None or chat_message.token_usage.total_tokens == 0:
+                        # Servers that report usage in the last chunk of the stream never sent it: estimate it instead
+                        chat_message.token_usage = TokenUsage(
+                            input_tokens=memory_step.estimated_input_tokens
+                            or self.token_estimator.estimate(input_messages),
+                            output_tokens=self.token_estimator.estimate_text(chat_message.content or ""),
+                        )
+                        memory_step.token_usage_estimated = True
                 memory_step.model_output_message = chat_message
                 output_text = chat_message.content
             else:
-                chat_message: ChatMessage = self.model.generate(
-                    input_messages,
-                    stop_sequences=stop_sequences,
-                    **additional_args,
-                )
+                with trace_span("model.generate", "model", model_id=self.model.model_id):
+                    chat_message: ChatMessage = self.model.generate(
+                        input_messages,
+                        stop_sequences=stop_sequences,
+                        **additional_args,
+                    )
                 memory_step.model_output_message = chat_message
                 output_text = chat_message.content
                 self.logger.log('Request ID: ', chat_message.request_id)
@@ -2101,12 +2110,13 @@ class CodeAgent(MultiStepAgent):
 
         ### Parse output ###
         try:
-            if self._use_structured_outputs_internally:
-                code_action = json.loads(output_text)["code"]
-                code_action = extract_code_from_text(code_action, self.code_block_tags) or code_action
-            else:
-                code_action = parse_code_blobs(output_text, self.code_block_tags)
-            code_action = fix_final_answer_code(code_action)
+            with trace_span("parse", "parse"):
+                if self._use_structured_outputs_internally:
+                    code_action = json.loads(output_text)["code"]
+                    code_action = extract_code_from_text(code_action, self.code_block_tags) or code_action
+                else:
+                    code_action = parse_code_blobs(output_text, self.code_block_tags)
+                code_action = fix_final_answer_code(code_action)
             memory_step.code_action = code_action
         except Exception as e:
             error_msg = f"Error in code parsing:\n{e}\nMake sure to provide correct code blobs."
@@ -2123,7 +2133,8 @@ class CodeAgent(MultiStepAgent):
         ### Execute action ###
         self.logger.log_code(title="Executing parsed code:", content=code_action, level=LogLevel.INFO)
         try:
-            code_output = self.python_executor(code_action)
+            with trace_span("execute", "exec"):
+                code_output = self.python_executor(code_action)
             execution_outputs_console = []
             if len(code_output.logs) > 0:
                 execution_outputs_console += [
@@ -2149,7 +2160,11 @@ class CodeAgent(MultiStepAgent):
                 )
             raise AgentExecutionError(error_msg, self.logger)
 
-        truncated_output = truncate_content(str(code_output.output))
+        artifact_store = getattr(self.python_executor, "artifact_store", None)
+        if artifact_store is not None:
+            truncated_output = artifact_store.spill(str(code_output.output), threshold=MAX_LENGTH_TRUNCATE_CONTENT)
+        else:
+            truncated_output = truncate_content(str(code_output.output))
         observation += "Last output from code snippet:\n" + truncated_output
         memory_step.observations = observation
 
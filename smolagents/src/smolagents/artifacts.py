@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+
+__all__ = ["ArtifactStore"]
+
+
+class ArtifactStore:
+    """
+    Store for large observations, kept on disk instead of in the agent's memory.
+
+    Content longer than `threshold` characters is written to a file named after its hash, which gives it a stable
+    handle, and only a head/tail preview mentioning the handle is kept in memory. The agent retrieves the rest with the
+    `read_artifact` and `grep_artifact` helpers of the Python executor.
+
+    Args:
+        directory (`str`, *optional*): Directory where artifacts are stored. Defaults to a new temporary directory,
+            removed by `cleanup`. It is only created when the first artifact is stored.
+        threshold (`int`, default `20000`): Content longer than this number of characters is stored as an artifact.
+        preview_length (`int`, *optional*): Number of characters of the head/tail preview kept in memory. Defaults to
+            the length the content would be truncated to without a store, e.g. `threshold`.
+        parent_directory (`str`, *optional*): Directory in which the temporary directory is created if `directory` is
+            not given, e.g. the workspace of a task. Defaults to the system's temporary directory.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        threshold: int = 20000,
+        preview_length: int | None = None,
+        parent_directory: str | None = None,
+    ):
+        self._directory = Path(directory) if directory is not None else None
+        self._owns_directory = directory is None
+        self._created = False
+        self.parent_directory = parent_directory
+        self.threshold = threshold
+        self.preview_length = preview_length
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> Path:
+        """Directory of the artifacts, created on first access."""
+        if not self._created:
+            with self._lock:
+                if self._directory is None:
+                    if self.parent_directory is not None:
+                        os.makedirs(self.parent_directory, exist_ok=True)
+                    self._directory = Path(tempfile.mkdtemp(prefix="smolagents-artifacts-", dir=self.parent_directory))
+                else:
+                    self._directory.mkdir(parents=True, exist_ok=True)
+                self._created = True
+        return self._directory
+
+    def _path(self, handle: str) -> Path:
+        if not re.fullmatch(r"artifact-[0-9a-f]{16}", handle):
+            raise ValueError(f"Invalid artifact handle: {handle!r}")
+        path = self._directory / f"{handle}.txt" if self._directory is not None else None
+        if path is None or not path.exists():
+            raise ValueError(f"Unknown artifact: {handle!r}")
+        return path
+
+    def put(self, content: str) -> str:
+        """Store content and return its handle. Storing the same content twice returns the same handle."""
+        handle = "artifact-" + hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        path = self.directory / f"{handle}.txt"
+        with self._lock:
+            if not path.exists():
+                path.write_text(content, encoding="utf-8")
+        return handle
+
+    def writer(self) -> "ArtifactWriter":
+        """Return a writer storing content as it is written, for content too large to build in memory."""
+        return ArtifactWriter(self)
+
+    def spill(self, content: str, threshold: int | None = None) -> str:
+        """Return the content if it is short enough, else store it and return a preview mentioning its handle."""
+        threshold = self.threshold if threshold is None else threshold
+        if len(content) <= threshold:
+            return content
+        handle = self.put(content)
+        half = self.preview_size(threshold) // 2
+        return self.preview(handle, len(content), content[:half], content[len(content) - half :])
+
+    def preview_size(self, max_length: int) -> int:
+        """Number of characters of the preview of a content that would be truncated to `max_length` characters."""
+        return max_length if self.preview_length is None else min(self.preview_length, max_length)
+
+    def preview(self, handle: str, length: int, head: str, tail: str) -> str:
+        """Return the head and tail of a stored content of `length` characters, joined by a mention of its handle."""
+        return (
+            head
+            + f"\n..._This content has {length} characters: it was stored as artifact '{handle}'. "
+            f"Use read_artifact('{handle}', offset, length) to page through it "
+            f"or grep_artifact('{handle}', pattern) to search it_...\n"
+            + tail
+        )
+
+    def read(self, handle: str, offset: int = 0, length: int = 10000) -> str:
+        """Return `length` characters of an artifact, starting at character `offset`."""
+        content = self._path(handle).read_text(encoding="utf-8")
+        if offset < 0:
+            offset = max(len(content) + offset, 0)
+        chunk = content[offset : offset + length]
+        end = offset + len(chunk)
+        if end < len(content):
+            chunk += f"\n..._Characters {offset}-{end} of {len(content)}: read from offset={end} to continue_..."
+        return chunk
+
+    def grep(self, handle: str, pattern: str, context: int = 0, max_matches: int = 50) -> str:
+        """Return the lines of an artifact matching a regular expression, prefixed with their line numbers."""
+        lines = self._path(handle).read_text(encoding="utf-8").splitlines()
+        regex = re.compile(pattern)
+        selected: list[int] = []
+        matches = 0
+        for i, line in enumerate(lines):
+            if regex.search(line):
+                matches += 1
+                if matches > max_matches:
+                    break
+                for j in range(max(i - context, 0), min(i + context + 1, len(lines))):
+                    if not selected or j > selected[-1]:
+                        selected.append(j)
+        if not selected:
+            return f"No line of '{handle}' matches {pattern!r}."
+        result = "\n".join(f"{j + 1}: {lines[j]}" for j in selected)
+        if matches > max_matches:
+            result += f"\n..._Stopped after {max_matches} matches_..."
+        return result
+
+    def cleanup(self):
+        """Remove the artifacts, and the directory if it was created by the store."""
+        if self._directory is None:
+            return
+        if self._owns_directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+            self._created = False
+        else:
+            for pattern in ("artifact-*.txt", "partial-*.txt"):
+                for path in self._directory.glob(pattern):
+                    path.unlink(missing_ok=True)
+
+
+class ArtifactWriter:
+    """
+    Writer of an artifact whose content is written in chunks, returned by [`ArtifactStore.writer`].
+
+    The content goes to a partial file as it is written, and is only given its handle, the hash of the whole content,
+    by `close`.
+    """
+
+    def __init__(self, store: ArtifactStore):
+        self.store = store
+        self.length = 0
+        descriptor, path = tempfile.mkstemp(prefix="partial-", suffix=".txt", dir=store.directory)
+        self._path = Path(path)
+        self._file = os.fdopen(descriptor, "w", encoding="utf-8", newline="")
+        self._hash = hashlib.sha256()
+
+    def write(self, text: str):
+        self._file.write(text)
+        self._hash.update(text.encode("utf-8"))
+        self.length += len(text)
+
+    def close(self) -> str:
+        """Finish the artifact and return its handle."""
+        self._file.close()
+        handle = "artifact-" + self._hash.hexdigest()[:16]
+        path = self.store.directory / f"{handle}.txt"
+        with self.store._lock:
+            self._path.replace(path)
+        return handle
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import copy
+import logging
+import pickle
+import shutil
+import sys
+import tempfile
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from types import CodeType, FunctionType, ModuleType
+from typing import Any
+
+
+__all__ = ["ExecutorState", "estimate_size"]
+
+logger = logging.getLogger(__name__)
+
+# Variables smaller than this are never spilled: reloading them would cost more than keeping them
+DEFAULT_SPILL_THRESHOLD = 1 << 20
+# Number of elements of a container measured to estimate its size
+SIZE_SAMPLE = 100
+SIZE_MAX_DEPTH = 3
+
+
+def estimate_size(value: Any, depth: int = 0) -> int:
+    """
+    Estimate the memory used by a value in bytes.
+
+    Arrays, data frames and images report the size of their buffers. Containers are measured from a sample of their
+    elements, up to a few levels deep, so that the estimate stays cheap for large ones.
+    """
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return int(value.nbytes)
+    pandas = sys.modules.get("pandas")
+    if pandas is not None and isinstance(value, (pandas.DataFrame, pandas.Series, pandas.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    pil_image_module = sys.modules.get("PIL.Image")
+    if pil_image_module is not None and isinstance(value, pil_image_module.Image):
+        return value.width * value.height * len(value.getbands())
+    try:
+        size = sys.getsizeof(value)
+    except TypeError:
+        return 0
+    if depth >= SIZE_MAX_DEPTH or isinstance(value, (str, bytes, bytearray)):
+        return size
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+    else:
+        return size
+    sampled_size, sampled = 0, 0
+    for item in items:
+        if sampled == SIZE_SAMPLE:
+            break
+        if isinstance(value, dict):
+            sampled_size += estimate_size(item[0], depth + 1) + estimate_size(item[1], depth + 1)
+        else:
+            sampled_size += estimate_size(item, depth + 1)
+        sampled += 1
+    if sampled:
+        size += sampled_size * len(value) // sampled
+    return size
+
+
+def _is_accounted(name: str, value: Any) -> bool:
+    # Internal variables, modules, functions and classes are small or shared with other agents
+    return not name.startswith("_") and not isinstance(value, ModuleType) and not callable(value)
+
+
+IMMUTABLE_TYPES = (str, bytes, int, float, complex, bool, type(None))
+# Variables set by the executor itself on each step, which a rollback must not restore
+INTERNAL_VARIABLES = frozenset({"__name__", "__builtins__", "_print_outputs", "_operations_count"})
+# Marks a variable that did not exist before the step in the journal
+_UNBOUND = object()
+
+
+def _is_exclusively_owned(value: Any, depth: int = 0) -> bool:
+    """
+    Whether reloading a copy of `value` from disk keeps the behavior of the code: the value must be plain data, and
+    none of its mutable parts may be referenced from elsewhere.
+
+    Besides the one held by its container, the caller and this function each hold a reference to `value`, and
+    `sys.getrefcount` counts its own argument: any more means it is referenced from elsewhere.
+    """
+    if sys.getrefcount(value) > 4:
+        return False
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        # Views share their buffer with another array
+        return value.base is None
+    pandas = sys.modules.get("pandas")
+    if pandas is not None and isinstance(value, (pandas.DataFrame, pandas.Series)):
+        return True
+    pil_image_module = sys.modules.get("PIL.Image")
+    if pil_image_module is not None and isinstance(value, pil_image_module.Image):
+        return True
+    if isinstance(value, (str, bytes, bytearray)):
+        return True
+    if depth >= SIZE_MAX_DEPTH:
+        return False
+    if isinstance(value, dict):
+        items = value.values()
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+    else:
+        return False
+    return all(isinstance(item, IMMUTABLE_TYPES) or _is_exclusively_owned(item, depth + 1) for item in items)
+
+
+def _global_names(code: CodeType) -> set[str]:
+    """Names that code and its nested functions may read as globals, along with attribute names."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def _copy_for_rollback(value: Any) -> Any:
+    numpy = sys.modules.get("numpy")
+    pandas = sys.modules.get("pandas")
+    if (numpy is not None and isinstance(value, numpy.ndarray)) or (
+        pandas is not None and isinstance(value, (pandas.DataFrame, pandas.Series))
+    ):
+        # Shallow copies of arrays and frames share their data, which is what gets mutated
+        return value.copy()
+    return copy.copy(value)
+
+
+def _restore_in_place(value: Any, saved: Any) -> bool:
+    """Restore the content of a mutated container from its copy, so that other references to it see it restored."""
+    if isinstance(value, (list, bytearray)):
+        value[:] = saved
+    elif isinstance(value, (dict, set)):
+        value.clear()
+        value.update(saved)
+    else:
+        return False
+    return True
+
+
+@dataclass
+class SpilledVariable:
+    path: Path
+    size: int
+
+
+class ExecutorState(dict):
+    """
+    State of a [`LocalPythonExecutor`], which accounts for the memory used by its variables and spills large, cold
+    ones to disk.
+
+    The size of each variable is estimated after each step, and re-estimated when the variable is rebound or used by
+    the code of a step. If the total exceeds `memory_budget`, the variables larger than `spill_threshold` that were not
+    used by the last step are written to disk, least recently used first, until the total fits. Arrays are stored as
+    `.npy` files and other values are pickled. A spilled variable is reloaded as soon as code reads it, so spilling is
+    invisible to the code. Variables that are also referenced from elsewhere, e.g. from another variable, are kept in
+    memory since spilling them would not free anything.
+
+    A step can also be journaled, so that its changes to the variables can be rolled back if it fails. The journal
+    keeps the previous value of each variable the step rebinds or deletes, and a copy of each variable it mutates, made
+    before the first mutation: rolling back costs time in the number of changed variables, not in the size of the
+    state. Mutations are recorded by the interpreter through `record_mutation`, for assignments and deletions of an
+    item or attribute of a variable, augmented assignments and calls to mutating methods such as `append`. Mutations
+    of nested values or through other methods are not rolled back.
+
+    Args:
+        memory_budget (`int`, *optional*): Memory in bytes that the variables may use before being spilled. If not
+            set, variables are only accounted for.
+        spill_threshold (`int`, default `1 MiB`): Variables smaller than this number of bytes are never spilled.
+        directory (`str`, *optional*): Directory of the spilled variables. Defaults to a new temporary directory,
+            removed by `cleanup`.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int | None = None,
+        spill_threshold: int = DEFAULT_SPILL_THRESHOLD,
+        directory: str | None = None,
+    ):
+        super().__init__()
+        self.memory_budget = memory_budget
+        self.spill_threshold = spill_threshold
+        self.step = 0
+        self._directory = Path(directory) if directory is not None else None
+        self._owns_directory = directory is None
+        self._spilled: dict[str, SpilledVariable] = {}
+        # Estimated size of each variable, with the id of the value it was estimated for
+        self._sizes: dict[str, tuple[int, int]] = {}
+        self._last_used: dict[str, int] = {}
+        # Values that failed to be spilled, by variable name, so that they are not retried on every step
+        self._unspillable: dict[str, int] = {}
+        # Values of the variables before the journaled step rebound or deleted them
+        self._journal: dict[str, Any] | None = None
+        # Mutated values of the journaled step, with their copy from before the mutation
+        self._mutations: dict[str, tuple[Any, Any]] = {}
+
+    def __missing__(self, key: str) -> Any:
+        spilled = self._spilled.pop(key, None)
+        if spilled is None:
+            raise KeyError(key)
+        value = self._load(spilled.path)
+        spilled.path.unlink(missing_ok=True)
+        dict.__setitem__(self, key, value)
+        self._sizes[key] = (id(value), spilled.size)
+        self._last_used[key] = self.step
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return dict.__contains__(self, key) or key in self._spilled
+
+    def __delitem__(self, key: str):
+        spilled = self._spilled.pop(key, None)
+        if spilled is not None and not dict.__contains__(self, key):
+            spilled.path.unlink(missing_ok=True)
+            return
+        dict.__delitem__(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def begin_step(self, names: Iterable[str], journal: bool = False):
+        """Start a step whose code uses `names`: reload the ones that were spilled, and journal the step if asked."""
+        self.step += 1
+        for name in names:
+            if name in self._spilled and not dict.__contains__(self, name):
+                self[name]
+        self._journal = {} if journal else None
+        self._mutations = {}
+        # Only a journaled step pays for journaling stores, the others keep the stores of dict
+        self.__class__ = _JournalingExecutorState if journal else ExecutorState
+
+    def update_from(self, variables: dict[str, Any]):
+        """Apply the changes that code run against `variables`, a plain copy of the state, made to the variables."""
+        for name in [name for name in dict.keys(self) if name not in variables]:
+            del self[name]
+        for name, value in variables.items():
+            if dict.get(self, name, _UNBOUND) is not value:
+                self[name] = value
+
+    def record_mutation(self, name: str):
+        """Record that the journaled step is about to mutate the value of a variable, by copying it the first time."""
+        if self._journal is None or name in self._journal or name in self._mutations or name in INTERNAL_VARIABLES:
+            return
+        value = self.get(name, _UNBOUND)
+        if value is _UNBOUND or isinstance(value, (ModuleType, *IMMUTABLE_TYPES)) or callable(value):
+            return
+        try:
+            self._mutations[name] = (value, _copy_for_rollback(value))
+        except Exception as e:
+            logger.debug(f"Variable '{name}' cannot be copied to roll it back: {type(e).__name__}: {e}")
+
+    def rollback(self) -> bool:
+        """Undo the changes of the journaled step to the variables. Returns whether it had changed any."""
+        if self._journal is None:
+            return False
+        journal, mutations = self._journal, self._mutations
+        self._journal, self._mutations = None, {}
+        self.__class__ = ExecutorState
+        for name, (value, saved) in mutations.items():
+            if _restore_in_place(value, saved):
+                saved = value
+            # Rebinding the variable to the copy restores it, but not other references to the mutated value
+            journal[name] = saved
+        for name, value in journal.items():
+            if value is _UNBOUND:
+                dict.pop(self, name, None)
+            else:
+                dict.__setitem__(self, name, value)
+        return bool(journal)
+
+    def end_step(self, names: Iterable[str], function_globals: dict[str, Any] | None = None):
+        """
+        Account for the variables after a step whose code used `names`, and spill cold ones if over budget.
+
+        `function_globals` are the globals of the functions defined by compiled code, if it did not run against the
+        state itself: the variables these functions read are not spilled, since they would not be reloaded.
+        """
+        self._journal, self._mutations = None, {}
+        self.__class__ = ExecutorState
+        names = set(names)
+        for name in list(self._spilled):
+            if dict.__contains__(self, name):
+                # Rebound while spilled: the stored value is stale
+                self._spilled.pop(name).path.unlink(missing_ok=True)
+        sizes = {}
+        for name, value in dict.items(self):
+            if not _is_accounted(name, value):
+                continue
+            cached = self._sizes.get(name)
+            if cached is not None and cached[0] == id(value) and name not in names:
+                sizes[name] = cached
+            else:
+                sizes[name] = (id(value), estimate_size(value))
+            if name in names or name not in self._last_used:
+                self._last_used[name] = self.step
+        self._sizes = sizes
+        self._last_used = {
+            name: step for name, step in self._last_used.items() if name in sizes or name in self._spilled
+        }
+        if self.memory_budget is not None:
+            self._spill_cold_variables(function_globals)
+
+    @property
+    def memory_usage(self) -> int:
+        """Estimated memory used by the variables in bytes, as of the last step."""
+        return sum(size for _, size in self._sizes.values())
+
+    def memory_report(self) -> dict[str, Any]:
+        """Estimated size of each variable in bytes, as of the last step, and size of the spilled variables."""
+        return {
+            "memory_usage": self.memory_usage,
+            "memory_budget": self.memory_budget,
+            "variables": {name: size for name, (_, size) in sorted(self._sizes.items(), key=lambda item: -item[1][1])},
+            "spilled": {name: spilled.size for name, spilled in self._spilled.items()},
+        }
+
+    def _names_read_by_functions(self, function_globals: dict[str, Any]) -> set[str]:
+        names = set()
+        for value in dict.values(self):
+            if isinstance(value, FunctionType):
+                functions = [value]
+            elif isinstance(value, type):
+                functions = [member for member in vars(value).values() if isinstance(member, FunctionType)]
+            else:
+                continue
+            for function in functions:
+                if function.__globals__ is function_globals:
+                    names |= _global_names(function.__code__)
+        return names
+
+    def _spill_cold_variables(self, function_globals: dict[str, Any] | None = None):
+        total = self.memory_usage
+        if total <= self.memory_budget:
+            return
+        pinned = self._names_read_by_functions(function_globals) if function_globals is not None else set()
+        candidates = sorted(
+            (
+                name
+                for name, (_, size) in self._sizes.items()
+                if size >= self.spill_threshold and self._last_used[name] < self.step and name not in pinned
+            ),
+            key=lambda name: (self._last_used[name], -self._sizes[name][1]),
+        )
+        for name in candidates:
+            if total <= self.memory_budget:
+                break
+            size = self._sizes[name][1]
+            if self._spill(name):
+                total -= size
+
+    def _spill(self, name: str) -> bool:
+        value = dict.__getitem__(self, name)
+        if self._unspillable.get(name) == id(value):
+            return False
+        # A value referenced from elsewhere would stay in memory, and be duplicated when reloaded
+        if not _is_exclusively_owned(value):
+            return False
+        if self._directory is None:
+            self._directory = Path(tempfile.mkdtemp(prefix="smolagents-state-"))
+        numpy = sys.modules.get("numpy")
+        is_array = numpy is not None and type(value) is numpy.ndarray and not value.dtype.hasobject
+        path = self._directory / f"{name}-{self.step}.{'npy' if is_array else 'pkl'}"
+        try:
+            if is_array:
+                numpy.save(path, value, allow_pickle=False)
+            else:
+                with open(path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            path.unlink(missing_ok=True)
+            self._unspillable[name] = id(value)
+            logger.debug(f"Variable '{name}' cannot be spilled to disk: {type(e).__name__}: {e}")
+            return False
+        size = self._sizes.pop(name)[1]
+        self._spilled[name] = SpilledVariable(path=path, size=size)
+        self._unspillable.pop(name, None)
+        dict.__delitem__(self, name)
+        logger.info(f"Spilled variable '{name}' ({size / (1 << 20):.1f} MiB) to {path}")
+        return True
+
+    @staticmethod
+    def _load(path: Path) -> Any:
+        if path.suffix == ".npy":
+            import numpy
+
+            return numpy.load(path, allow_pickle=False)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def cleanup(self):
+        """Remove the spilled variables."""
+        for spilled in self._spilled.values():
+            spilled.path.unlink(missing_ok=True)
+        self._spilled.clear()
+        if self._owns_directory and self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+
+class _JournalingExecutorState(ExecutorState):
+    """Class of an [`ExecutorState`] while a step is journaled, which keeps the previous values of the variables."""
+
+    def __setitem__(self, key: str, value: Any):
+        journal = self._journal
+        if key not in journal and key not in INTERNAL_VARIABLES:
+            # A spilled variable that is rebound keeps its file until the step ends, so it needs no journal value
+            journal[key] = dict.get(self, key, _UNBOUND)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key: str):
+        if key not in self._journal and key not in INTERNAL_VARIABLES:
+            self._journal[key] = self[key]
+        super().__delitem__(key)
@@ -16,21 +16,28 @@
 # limitations under the License.
 import ast
 import builtins
+import contextvars
 import difflib
 import inspect
 import logging
 import math
+import operator
 import os
 import re
-from collections.abc import Callable, Mapping
+import traceback
+from collections import deque
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
-from functools import wraps
+from functools import lru_cache, partial, wraps
 from importlib import import_module
 from types import BuiltinFunctionType, FunctionType, ModuleType
 from typing import Any
 
+from .artifacts import ArtifactStore, ArtifactWriter
+from .executor_state import DEFAULT_SPILL_THRESHOLD, ExecutorState
 from .tools import Tool
-from .utils import BASE_BUILTIN_MODULES, truncate_content
+from .utils import BASE_BUILTIN_MODULES, get_cancellation_token
 
 
 logger = logging.getLogger(__name__)
@@ -54,6 +61,37 @@ ERRORS = {
 DEFAULT_MAX_LEN_OUTPUT = 50000
 MAX_OPERATIONS = 1000000000
 MAX_WHILE_ITERATIONS = 1000000
+CANCELLATION_CHECK_INTERVAL = 10000
+PARSE_CACHE_SIZE = 256
+# Results of these types cannot be modules, module dicts or functions, so `check_safer_result` can skip them
+PLAIN_VALUE_TYPES = frozenset({int, float, complex, bool, str, bytes, type(None), list, tuple, set, frozenset})
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.FloorDiv: operator.floordiv,
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+    ast.BitXor: operator.xor,
+    ast.LShift: operator.lshift,
+    ast.RShift: operator.rshift,
+}
+COMPARISON_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda left, right: left in right,
+    ast.NotIn: lambda left, right: left not in right,
+}
 
 
 def custom_print(*args):
@@ -237,17 +275,101 @@ def safer_func(
 
 
 class PrintContainer:
-    def __init__(self):
-        self.value = ""
+    """
+    Sink of the print outputs of a code action, which keeps at most `max_length` characters in memory.
+
+    Beyond `max_length` characters, only the first and last halves are kept: the characters in between are dropped as
+    they are printed, and counted in `dropped`. If an `artifact_store` is given, the complete output is also written to
+    an artifact as it is printed, and `finalize` replaces the output by a preview mentioning its handle. Otherwise
+    `finalize` marks where characters were dropped. `value` is only joined once after each print.
+
+    Args:
+        max_length (`int`, *optional*): Maximum number of characters kept in memory. Unbounded if not set.
+        artifact_store (`ArtifactStore`, *optional*): Store of the complete output if it exceeds `max_length`.
+    """
+
+    def __init__(self, max_length: int | None = None, artifact_store: ArtifactStore | None = None):
+        self.max_length = max_length
+        self.artifact_store = artifact_store
+        self.length = 0
+        self._head: list[str] = []
+        self._head_length = 0
+        self._tail: deque[str] = deque()
+        self._tail_length = 0
+        self._value: str | None = ""
+        self._writer: ArtifactWriter | None = None
+
+    @property
+    def dropped(self) -> int:
+        """Number of printed characters that were dropped from memory."""
+        return self.length - self._head_length - self._tail_length
+
+    @property
+    def value(self) -> str:
+        if self._value is None:
+            head, tail = "".join(self._head), "".join(self._tail)
+            self._head, self._tail = [head], deque([tail])
+            if self.dropped:
+                self._value = (
+                    head
+                    + f"\n..._This content has been truncated to stay below {self.max_length} characters: "
+                    f"{self.dropped} characters were dropped_...\n"
+                    + tail
+                )
+            else:
+                self._value = head + tail
+        return self._value
+
+    @value.setter
+    def value(self, value: str):
+        self.length = self._head_length = len(value)
+        self._head, self._tail, self._tail_length = [value], deque(), 0
+        self._value = value
 
     def append(self, text):
-        self.value += text
+        self._value = None
+        self.length += len(text)
+        if self._writer is not None:
+            self._writer.write(text)
+        if self.max_length is None:
+            self._head.append(text)
+            self._head_length += len(text)
+            return self
+        head_room = self.max_length // 2 - self._head_length
+        if head_room > 0:
+            self._head.append(text[:head_room])
+            self._head_length += len(self._head[-1])
+            text = text[head_room:]
+        if text:
+            self._tail.append(text)
+            self._tail_length += len(text)
+        excess = self._tail_length - (self.max_length - self.max_length // 2)
+        if excess > 0:
+            if self.artifact_store is not None and self._writer is None:
+                # Everything printed so far is still in memory: start the artifact with it
+                self._writer = self.artifact_store.writer()
+                self._writer.write("".join(self._head) + "".join(self._tail))
+            while excess and excess >= len(self._tail[0]):
+                excess -= len(self._tail[0])
+                self._tail_length -= len(self._tail.popleft())
+            if excess:
+                self._tail[0] = self._tail[0][excess:]
+                self._tail_length -= excess
         return self
 
+    def finalize(self) -> str:
+        """Finish the output of the code action: store it as an artifact if it was too long, and return it."""
+        if self._writer is not None:
+            handle = self._writer.close()
+            self._writer = None
+            half = self.artifact_store.preview_size(self.max_length) // 2
+            head, tail = "".join(self._head), "".join(self._tail)
+            self.value = self.artifact_store.preview(handle, self.length, head[:half], tail[len(tail) - half :])
+        return self.value
+
     def __iadd__(self, other):
         """Implements the += operator"""
-        self.value += str(other)
-        return self
+        return self.append(str(other))
 
     def __str__(self):
         """String representation"""
@@ -312,7 +434,7 @@ def fix_final_answer_code(code: str) -> str:
     return code
 
 
-def build_import_tree(authorized_imports: list[str]) -> dict[str, Any]:
+def build_import_tree(authorized_imports: Iterable[str]) -> dict[str, Any]:
     tree = {}
     for import_path in authorized_imports:
         parts = import_path.split(".")
@@ -324,8 +446,52 @@ def build_import_tree(authorized_imports: list[str]) -> dict[str, Any]:
     return tree
 
 
-def check_import_authorized(import_to_check: str, authorized_imports: list[str]) -> bool:
-    current_node = build_import_tree(authorized_imports)
+class AuthorizedImports(Sequence[str]):
+    """
+    Immutable list of authorized imports, compiled once into an import tree.
+
+    Checking an import against a plain list rebuilds the tree of the whole list, which is slow for long lists such as
+    one entry per installed package. This compiles the tree once, and remembers the result of each checked import.
+
+    Args:
+        authorized_imports (`Iterable[str]`): Authorized import paths, e.g. `"numpy"`, `"numpy.*"` or `"*"`.
+    """
+
+    def __init__(self, authorized_imports: Iterable[str]):
+        self._imports = tuple(dict.fromkeys(authorized_imports))
+        self._import_set = frozenset(self._imports)
+        self._tree = build_import_tree(self._imports)
+        self._checked: dict[str, bool] = {}
+
+    def __getitem__(self, index):
+        return self._imports[index]
+
+    def __len__(self) -> int:
+        return len(self._imports)
+
+    def __contains__(self, import_path: object) -> bool:
+        return import_path in self._import_set
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, AuthorizedImports):
+            return self._import_set == other._import_set
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self._import_set)
+
+    def __repr__(self) -> str:
+        return f"AuthorizedImports({list(self._imports)!r})"
+
+    def is_authorized(self, import_to_check: str) -> bool:
+        authorized = self._checked.get(import_to_check)
+        if authorized is None:
+            authorized = self._checked[import_to_check] = _check_import_tree(import_to_check, self._tree)
+        return authorized
+
+
+def _check_import_tree(import_to_check: str, tree: dict[str, Any]) -> bool:
+    current_node = tree
     for part in import_to_check.split("."):
         if "*" in current_node:
             return True
@@ -335,6 +501,12 @@ def check_import_authorized(import_to_check: str, authorized_imports: list[str])
     return True
 
 
+def check_import_authorized(import_to_check: str, authorized_imports: list[str] | AuthorizedImports) -> bool:
+    if isinstance(authorized_imports, AuthorizedImports):
+        return authorized_imports.is_authorized(import_to_check)
+    return _check_import_tree(import_to_check, build_import_tree(authorized_imports))
+
+
 def evaluate_attribute(
     expression: ast.Attribute,
     state: dict[str, Any],
@@ -368,6 +540,87 @@ def evaluate_unaryop(
         raise InterpreterError(f"Unary operation {expression.op.__class__.__name__} is not supported.")
 
 
+class Scope(dict):
+    """
+    Local scope of a function call or a comprehension iteration, chained to the state of the enclosing scope.
+
+    Variables of the enclosing scopes are read through the chain, and assignments only go to the local scope. This
+    gives the same visibility as a copy of the enclosing state, at a cost that does not depend on its size. Lookups
+    of local variables stay plain dict lookups: the chain is only walked on misses.
+    """
+
+    __slots__ = ("parent",)
+
+    def __init__(self, parent: dict[str, Any]):
+        super().__init__()
+        self.parent = parent
+
+    def __missing__(self, key: str) -> Any:
+        return self.parent[key]
+
+    def __contains__(self, key: object) -> bool:
+        return dict.__contains__(self, key) or key in self.parent
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def flatten(self) -> dict[str, Any]:
+        """Return the variables visible from this scope as a plain dict."""
+        parent = self.parent.flatten() if isinstance(self.parent, Scope) else dict(self.parent)
+        parent.update(dict.items(self))
+        return parent
+
+    def __iter__(self):
+        return iter(self.flatten())
+
+    def __len__(self) -> int:
+        return len(self.flatten())
+
+    def keys(self):
+        return self.flatten().keys()
+
+    def values(self):
+        return self.flatten().values()
+
+    def items(self):
+        return self.flatten().items()
+
+    def copy(self) -> dict[str, Any]:
+        return self.flatten()
+
+
+# Methods that mutate builtin containers, arrays and data frames in place
+MUTATING_METHODS = frozenset(
+    {"append", "extend", "insert", "pop", "popitem", "remove", "clear", "update", "setdefault", "add", "discard"}
+    | {"sort", "reverse", "fill", "resize", "put", "drop", "fillna", "rename", "reset_index", "set_index"}
+)
+
+
+def record_mutation(target: ast.AST, state: dict[str, Any]):
+    """
+    Record that a variable of the executor state is about to be mutated through `target`, e.g. `x` for `x[0] = 1`,
+    so that the step can be rolled back. Only mutations of the value of a variable itself are recorded.
+    """
+    if not isinstance(target, ast.Name):
+        return
+    if isinstance(state, ExecutorState):
+        # Most mutations are of top-level variables, which is cheap to check when no step is journaled
+        if state._journal is not None:
+            state.record_mutation(target.id)
+        return
+    name = target.id
+    while isinstance(state, Scope):
+        if dict.__contains__(state, name):
+            # Local variable of a function or comprehension
+            return
+        state = state.parent
+    if isinstance(state, ExecutorState):
+        state.record_mutation(name)
+
+
 def evaluate_lambda(
     lambda_expression: ast.Lambda,
     state: dict[str, Any],
@@ -378,7 +631,7 @@ def evaluate_lambda(
     args = [arg.arg for arg in lambda_expression.args.args]
 
     def lambda_func(*values: Any) -> Any:
-        new_state = state.copy()
+        new_state = Scope(state)
         for arg, value in zip(args, values):
             new_state[arg] = value
         return evaluate_ast(
@@ -424,7 +677,7 @@ def create_function(
     source_code = ast.unparse(func_def)
 
     def new_func(*args: Any, **kwargs: Any) -> Any:
-        func_state = state.copy()
+        func_state = Scope(state)
         arg_names = [arg.arg for arg in func_def.args.args]
         default_values = [
             evaluate_ast(d, state, static_tools, custom_tools, authorized_imports) for d in func_def.args.defaults
@@ -602,6 +855,11 @@ def evaluate_augassign(
 
     current_value = get_current_value(expression.target)
     value_to_add = evaluate_ast(expression.value, state, static_tools, custom_tools, authorized_imports)
+    # In-place operators mutate lists, arrays or frames before the result is assigned back
+    record_mutation(
+        expression.target.value if isinstance(expression.target, (ast.Subscript, ast.Attribute)) else expression.target,
+        state,
+    )
 
     if isinstance(expression.op, ast.Add):
         if isinstance(current_value, list):
@@ -680,32 +938,10 @@ def evaluate_binop(
     right_val = evaluate_ast(binop.right, state, static_tools, custom_tools, authorized_imports)
 
     # Determine the operation based on the type of the operator in the BinOp
-    if isinstance(binop.op, ast.Add):
-        return left_val + right_val
-    elif isinstance(binop.op, ast.Sub):
-        return left_val - right_val
-    elif isinstance(binop.op, ast.Mult):
-        return left_val * right_val
-    elif isinstance(binop.op, ast.Div):
-        return left_val / right_val
-    elif isinstance(binop.op, ast.Mod):
-        return left_val % right_val
-    elif isinstance(binop.op, ast.Pow):
-        return left_val**right_val
-    elif isinstance(binop.op, ast.FloorDiv):
-        return left_val // right_val
-    elif isinstance(binop.op, ast.BitAnd):
-        return left_val & right_val
-    elif isinstance(binop.op, ast.BitOr):
-        return left_val | right_val
-    elif isinstance(binop.op, ast.BitXor):
-        return left_val ^ right_val
-    elif isinstance(binop.op, ast.LShift):
-        return left_val << right_val
-    elif isinstance(binop.op, ast.RShift):
-        return left_val >> right_val
-    else:
+    operation = BINARY_OPERATORS.get(type(binop.op))
+    if operation is None:
         raise NotImplementedError(f"Binary operation {type(binop.op).__name__} is not implemented.")
+    return operation(left_val, right_val)
 
 
 def evaluate_assign(
@@ -757,12 +993,17 @@ def set_value(
     elif isinstance(target, ast.Subscript):
         obj = evaluate_ast(target.value, state, static_tools, custom_tools, authorized_imports)
         key = evaluate_ast(target.slice, state, static_tools, custom_tools, authorized_imports)
+        record_mutation(target.value, state)
         obj[key] = value
     elif isinstance(target, ast.Attribute):
         obj = evaluate_ast(target.value, state, static_tools, custom_tools, authorized_imports)
+        record_mutation(target.value, state)
         setattr(obj, target.attr, value)
 
 
+_MISSING = object()
+
+
 def evaluate_call(
     call: ast.Call,
     state: dict[str, Any],
@@ -782,9 +1023,11 @@ def evaluate_call(
     elif isinstance(call.func, ast.Attribute):
         obj = evaluate_ast(call.func.value, state, static_tools, custom_tools, authorized_imports)
         func_name = call.func.attr
-        if not hasattr(obj, func_name):
+        func = getattr(obj, func_name, _MISSING)
+        if func is _MISSING:
             raise InterpreterError(f"Object {obj} has no attribute {func_name}")
-        func = getattr(obj, func_name)
+        if func_name in MUTATING_METHODS:
+            record_mutation(call.func.value, state)
     elif isinstance(call.func, ast.Name):
         func_name = call.func.id
         if func_name in state:
@@ -837,7 +1080,8 @@ def evaluate_call(
         state["_print_outputs"] += " ".join(map(str, args)) + "\n"
         return None
     else:  # Assume it's a callable object
-        if (inspect.getmodule(func) == builtins) and inspect.isbuiltin(func) and (func not in static_tools.values()):
+        # Cheapest check first: most calls are not to builtins
+        if inspect.isbuiltin(func) and (inspect.getmodule(func) == builtins) and (func not in static_tools.values()):
             raise InterpreterError(
                 f"Invoking a builtin function that has not been explicitly added as a tool is not allowed ({func_name})."
             )
@@ -895,30 +1139,11 @@ def evaluate_condition(
     result = True
     left = evaluate_ast(condition.left, state, static_tools, custom_tools, authorized_imports)
     for i, (op, comparator) in enumerate(zip(condition.ops, condition.comparators)):
-        op = type(op)
         right = evaluate_ast(comparator, state, static_tools, custom_tools, authorized_imports)
-        if op == ast.Eq:
-            current_result = left == right
-        elif op == ast.NotEq:
-            current_result = left != right
-        elif op == ast.Lt:
-            current_result = left < right
-        elif op == ast.LtE:
-            current_result = left <= right
-        elif op == ast.Gt:
-            current_result = left > right
-        elif op == ast.GtE:
-            current_result = left >= right
-        elif op == ast.Is:
-            current_result = left is right
-        elif op == ast.IsNot:
-            current_result = left is not right
-        elif op == ast.In:
-            current_result = left in right
-        elif op == ast.NotIn:
-            current_result = left not in right
-        else:
-            raise InterpreterError(f"Unsupported comparison operator: {op}")
+        operation = COMPARISON_OPERATORS.get(type(op))
+        if operation is None:
+            raise InterpreterError(f"Unsupported comparison operator: {type(op)}")
+        current_result = operation(left, right)
 
         if current_result is False:
             return False
@@ -1010,7 +1235,7 @@ def evaluate_listcomp(
         )
         result = []
         for value in iter_value:
-            new_state = current_state.copy()
+            new_state = Scope(current_state)
             if isinstance(generator.target, ast.Tuple):
                 for idx, elem in enumerate(generator.target.elts):
                     new_state[elem.id] = value[idx]
@@ -1037,7 +1262,7 @@ def evaluate_setcomp(
     for gen in setcomp.generators:
         iter_value = evaluate_ast(gen.iter, state, static_tools, custom_tools, authorized_imports)
         for value in iter_value:
-            new_state = state.copy()
+            new_state = Scope(state)
             set_value(
                 gen.target,
                 value,
@@ -1167,46 +1392,62 @@ def evaluate_with(
             context.__exit__(None, None, None)
 
 
-def get_safe_module(raw_module, authorized_imports, visited=None):
-    """Creates a safe copy of a module or returns the original if it's a function"""
-    # If it's a function or non-module object, return it directly
-    if not isinstance(raw_module, ModuleType):
-        return raw_module
+class SafeModule(ModuleType):
+    """
+    Read-only view of a module, resolving its attributes on access.
 
-    # Handle circular references: Initialize visited set for the first call
-    if visited is None:
-        visited = set()
+    Nested modules are returned as safe modules too, so that the interpreter checks them against the authorized
+    imports like any other module. Setting attributes is forbidden, since the view is shared by every import of the
+    module with the same authorized imports.
+    """
 
-    module_id = id(raw_module)
-    if module_id in visited:
-        return raw_module  # Return original for circular refs
+    def __init__(self, raw_module: ModuleType, authorized_imports: AuthorizedImports):
+        super().__init__(raw_module.__name__, raw_module.__doc__)
+        # Dunder attributes cannot be reached from the interpreted code
+        self.__dict__["__raw_module__"] = raw_module
+        self.__dict__["__authorized_imports__"] = authorized_imports
+        for attr_name in ("__package__", "__loader__", "__spec__"):
+            self.__dict__[attr_name] = getattr(raw_module, attr_name, None)
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self.__dict__["__raw_module__"], name)
+        if isinstance(value, ModuleType):
+            return get_safe_module(value, self.__dict__["__authorized_imports__"])
+        return value
 
-    visited.add(module_id)
+    def __setattr__(self, name: str, value: Any):
+        raise InterpreterError(f"Cannot set attribute '{name}' of module {self.__name__}")
 
-    # Create new module for actual modules
-    safe_module = ModuleType(raw_module.__name__)
+    def __delattr__(self, name: str):
+        raise InterpreterError(f"Cannot delete attribute '{name}' of module {self.__name__}")
 
-    # Copy all attributes by reference, recursively checking modules
-    for attr_name in dir(raw_module):
-        try:
-            attr_value = getattr(raw_module, attr_name)
-        except (ImportError, AttributeError) as e:
-            # lazy / dynamic loading module -> INFO log and skip
-            logger.info(
-                f"Skipping import error while copying {raw_module.__name__}.{attr_name}: {type(e).__name__} - {e}"
-            )
-            continue
-        # Recursively process nested modules, passing visited set
-        if isinstance(attr_value, ModuleType):
-            attr_value = get_safe_module(attr_value, authorized_imports, visited=visited)
+    def __dir__(self) -> list[str]:
+        return dir(self.__dict__["__raw_module__"])
+
+    def __repr__(self) -> str:
+        return repr(self.__dict__["__raw_module__"])
 
-        setattr(safe_module, attr_name, attr_value)
 
+_safe_modules: dict[tuple[ModuleType, AuthorizedImports], SafeModule] = {}
+
+
+def get_safe_module(raw_module, authorized_imports):
+    """Returns a safe view of a module, cached per module and authorized imports, or the original if it's a function"""
+    # If it's a function or non-module object, return it directly
+    if not isinstance(raw_module, ModuleType) or isinstance(raw_module, SafeModule):
+        return raw_module
+    if not isinstance(authorized_imports, AuthorizedImports):
+        authorized_imports = AuthorizedImports(authorized_imports)
+    key = (raw_module, authorized_imports)
+    safe_module = _safe_modules.get(key)
+    if safe_module is None:
+        safe_module = _safe_modules.setdefault(key, SafeModule(raw_module, authorized_imports))
     return safe_module
 
 
+@lru_cache(maxsize=None)
 def _configure_matplotlib_backend():
-    """Configure matplotlib to use a non-GUI backend to avoid threading issues."""
+    """Configure matplotlib to use a non-GUI backend to avoid threading issues. Only runs once per process."""
     try:
         import matplotlib
         matplotlib.use('Agg')  # Use non-GUI backend
@@ -1240,12 +1481,17 @@ def evaluate_import(expression, state, authorized_imports):
             module = get_safe_module(raw_module, authorized_imports)
             if expression.names[0].name == "*":  # Handle "from module import *"
                 if hasattr(module, "__all__"):  # If module has __all__, import only those names
-                    for name in module.__all__:
-                        state[name] = getattr(module, name)
+                    names = module.__all__
                 else:  # If no __all__, import all public names (those not starting with '_')
-                    for name in dir(module):
-                        if not name.startswith("_"):
-                            state[name] = getattr(module, name)
+                    names = [name for name in dir(module) if not name.startswith("_")]
+                for name in names:
+                    try:
+                        state[name] = getattr(module, name)
+                    except (ImportError, AttributeError) as e:
+                        # lazy / dynamic loading module -> INFO log and skip
+                        logger.info(
+                            f"Skipping import error while importing {expression.module}.{name}: {type(e).__name__} - {e}"
+                        )
             else:  # regular from imports
                 for alias in expression.names:
                     if hasattr(module, alias.name):
@@ -1270,7 +1516,7 @@ def evaluate_dictcomp(
     for gen in dictcomp.generators:
         iter_value = evaluate_ast(gen.iter, state, static_tools, custom_tools, authorized_imports)
         for value in iter_value:
-            new_state = state.copy()
+            new_state = Scope(state)
             set_value(
                 gen.target,
                 value,
@@ -1329,6 +1575,7 @@ def evaluate_delete(
             # Handle index/key deletion (del x[y])
             obj = evaluate_ast(target.value, state, static_tools, custom_tools, authorized_imports)
             index = evaluate_ast(target.slice, state, static_tools, custom_tools, authorized_imports)
+            record_mutation(target.value, state)
             try:
                 del obj[index]
             except (TypeError, KeyError, IndexError) as e:
@@ -1337,7 +1584,156 @@ def evaluate_delete(
             raise InterpreterError(f"Deletion of {type(target).__name__} targets is not supported")
 
 
-@safer_eval
+class OperationsCounter:
+    """Counts the AST nodes evaluated by a code action, to stop infinite loops and to check for cancellation."""
+
+    __slots__ = ("count", "next_check", "cancellation_token")
+
+    def __init__(self, cancellation_token=None):
+        self.count = 0
+        self.next_check = CANCELLATION_CHECK_INTERVAL
+        self.cancellation_token = cancellation_token
+
+    def check(self):
+        """Called every `CANCELLATION_CHECK_INTERVAL` operations, so that the hot path only compares two integers."""
+        if self.count > MAX_OPERATIONS:
+            raise InterpreterError(
+                f"Reached the max number of operations of {MAX_OPERATIONS}. Maybe there is an infinite loop somewhere in the code, or you're just asking too many calculations."
+            )
+        if self.cancellation_token is not None:
+            self.cancellation_token.raise_if_cancelled()
+        self.next_check = min(self.count + CANCELLATION_CHECK_INTERVAL, MAX_OPERATIONS + 1)
+
+
+def _evaluate_tuple(expression, state, static_tools, custom_tools, authorized_imports):
+    return tuple(evaluate_ast(elt, state, static_tools, custom_tools, authorized_imports) for elt in expression.elts)
+
+
+def _evaluate_list(expression, state, static_tools, custom_tools, authorized_imports):
+    return [evaluate_ast(elt, state, static_tools, custom_tools, authorized_imports) for elt in expression.elts]
+
+
+def _evaluate_set(expression, state, static_tools, custom_tools, authorized_imports):
+    return {evaluate_ast(elt, state, static_tools, custom_tools, authorized_imports) for elt in expression.elts}
+
+
+def _evaluate_dict(expression, state, static_tools, custom_tools, authorized_imports):
+    keys = (evaluate_ast(k, state, static_tools, custom_tools, authorized_imports) for k in expression.keys)
+    values = (evaluate_ast(v, state, static_tools, custom_tools, authorized_imports) for v in expression.values)
+    return dict(zip(keys, values))
+
+
+def _evaluate_value(expression, state, static_tools, custom_tools, authorized_imports):
+    # Expression statements, starred expressions and (on older Python versions) indexes wrap a single value
+    return evaluate_ast(expression.value, state, static_tools, custom_tools, authorized_imports)
+
+
+def _evaluate_formatted_value(expression, state, static_tools, custom_tools, authorized_imports):
+    # Formatted value (part of f-string) -> evaluate the content and format it
+    value = evaluate_ast(expression.value, state, static_tools, custom_tools, authorized_imports)
+    # Early return if no format spec
+    if not expression.format_spec:
+        return value
+    # Apply format specification
+    format_spec = evaluate_ast(expression.format_spec, state, static_tools, custom_tools, authorized_imports)
+    return format(value, format_spec)
+
+
+def _evaluate_joined_str(expression, state, static_tools, custom_tools, authorized_imports):
+    return "".join(
+        [str(evaluate_ast(v, state, static_tools, custom_tools, authorized_imports)) for v in expression.values]
+    )
+
+
+def _evaluate_ifexp(expression, state, static_tools, custom_tools, authorized_imports):
+    if evaluate_ast(expression.test, state, static_tools, custom_tools, authorized_imports):
+        return evaluate_ast(expression.body, state, static_tools, custom_tools, authorized_imports)
+    return evaluate_ast(expression.orelse, state, static_tools, custom_tools, authorized_imports)
+
+
+def _evaluate_slice(expression, state, static_tools, custom_tools, authorized_imports):
+    common_params = (state, static_tools, custom_tools, authorized_imports)
+    return slice(
+        evaluate_ast(expression.lower, *common_params) if expression.lower is not None else None,
+        evaluate_ast(expression.upper, *common_params) if expression.upper is not None else None,
+        evaluate_ast(expression.step, *common_params) if expression.step is not None else None,
+    )
+
+
+def _evaluate_import(expression, state, static_tools, custom_tools, authorized_imports):
+    return evaluate_import(expression, state, authorized_imports)
+
+
+def _evaluate_break(expression, state, static_tools, custom_tools, authorized_imports):
+    raise BreakException()
+
+
+def _evaluate_continue(expression, state, static_tools, custom_tools, authorized_imports):
+    raise ContinueException()
+
+
+def _evaluate_return(expression, state, static_tools, custom_tools, authorized_imports):
+    raise ReturnException(
+        evaluate_ast(expression.value, state, static_tools, custom_tools, authorized_imports)
+        if expression.value
+        else None
+    )
+
+
+def _evaluate_pass(expression, state, static_tools, custom_tools, authorized_imports):
+    return None
+
+
+# Evaluation function of each supported node type, all called with (node, state, static_tools, custom_tools,
+# authorized_imports). Name, Constant, Attribute, Call and BinOp nodes have fast paths in `evaluate_ast`.
+NODE_EVALUATORS: dict[type, Callable] = {
+    ast.Assign: evaluate_assign,
+    ast.AnnAssign: evaluate_annassign,
+    ast.AugAssign: evaluate_augassign,
+    ast.Call: evaluate_call,
+    ast.Tuple: _evaluate_tuple,
+    ast.ListComp: evaluate_listcomp,
+    ast.GeneratorExp: evaluate_listcomp,
+    ast.DictComp: evaluate_dictcomp,
+    ast.SetComp: evaluate_setcomp,
+    ast.UnaryOp: evaluate_unaryop,
+    ast.Starred: _evaluate_value,
+    ast.BoolOp: evaluate_boolop,
+    ast.Break: _evaluate_break,
+    ast.Continue: _evaluate_continue,
+    ast.BinOp: evaluate_binop,
+    ast.Compare: evaluate_condition,
+    ast.Lambda: evaluate_lambda,
+    ast.FunctionDef: evaluate_function_def,
+    ast.Dict: _evaluate_dict,
+    ast.Expr: _evaluate_value,
+    ast.For: evaluate_for,
+    ast.FormattedValue: _evaluate_formatted_value,
+    ast.If: evaluate_if,
+    ast.JoinedStr: _evaluate_joined_str,
+    ast.List: _evaluate_list,
+    ast.Name: evaluate_name,
+    ast.Subscript: evaluate_subscript,
+    ast.IfExp: _evaluate_ifexp,
+    ast.Attribute: evaluate_attribute,
+    ast.Slice: _evaluate_slice,
+    ast.While: evaluate_while,
+    ast.Import: _evaluate_import,
+    ast.ImportFrom: _evaluate_import,
+    ast.ClassDef: evaluate_class_def,
+    ast.Try: evaluate_try,
+    ast.Raise: evaluate_raise,
+    ast.Assert: evaluate_assert,
+    ast.With: evaluate_with,
+    ast.Set: _evaluate_set,
+    ast.Return: _evaluate_return,
+    ast.Pass: _evaluate_pass,
+    ast.Delete: evaluate_delete,
+}
+if hasattr(ast, "Index"):
+    NODE_EVALUATORS[ast.Index] = _evaluate_value
+
+
 def evaluate_ast(
     expression: ast.AST,
     state: dict[str, Any],
@@ -1365,130 +1761,47 @@ def evaluate_ast(
             The list of modules that can be imported by the code. By default, only a few safe modules are allowed.
             If it contains "*", it will authorize any import. Use this at your own risk!
     """
-    if state.setdefault("_operations_count", {"counter": 0})["counter"] >= MAX_OPERATIONS:
-        raise InterpreterError(
-            f"Reached the max number of operations of {MAX_OPERATIONS}. Maybe there is an infinite loop somewhere in the code, or you're just asking too many calculations."
-        )
-    state["_operations_count"]["counter"] += 1
-    common_params = (state, static_tools, custom_tools, authorized_imports)
-    if isinstance(expression, ast.Assign):
-        # Assignment -> we evaluate the assignment which should update the state
-        # We return the variable assigned as it may be used to determine the final result.
-        return evaluate_assign(expression, *common_params)
-    elif isinstance(expression, ast.AnnAssign):
-        return evaluate_annassign(expression, *common_params)
-    elif isinstance(expression, ast.AugAssign):
-        return evaluate_augassign(expression, *common_params)
-    elif isinstance(expression, ast.Call):
-        # Function call -> we return the value of the function call
-        return evaluate_call(expression, *common_params)
-    elif isinstance(expression, ast.Constant):
-        # Constant -> just return the value
+    try:
+        operations = state["_operations_count"]
+    except KeyError:
+        operations = state["_operations_count"] = OperationsCounter()
+    operations.count += 1
+    if operations.count >= operations.next_check:
+        operations.check()
+
+    expression_type = type(expression)
+    if expression_type is ast.Constant:
+        # Constants cannot be modules or functions: no need to check the result
         return expression.value
-    elif isinstance(expression, ast.Tuple):
-        return tuple((evaluate_ast(elt, *common_params) for elt in expression.elts))
-    elif isinstance(expression, (ast.ListComp, ast.GeneratorExp)):
-        return evaluate_listcomp(expression, *common_params)
-    elif isinstance(expression, ast.DictComp):
-        return evaluate_dictcomp(expression, *common_params)
-    elif isinstance(expression, ast.SetComp):
-        return evaluate_setcomp(expression, *common_params)
-    elif isinstance(expression, ast.UnaryOp):
-        return evaluate_unaryop(expression, *common_params)
-    elif isinstance(expression, ast.Starred):
-        return evaluate_ast(expression.value, *common_params)
-    elif isinstance(expression, ast.BoolOp):
-        # Boolean operation -> evaluate the operation
-        return evaluate_boolop(expression, *common_params)
-    elif isinstance(expression, ast.Break):
-        raise BreakException()
-    elif isinstance(expression, ast.Continue):
-        raise ContinueException()
-    elif isinstance(expression, ast.BinOp):
-        # Binary operation -> execute operation
-        return evaluate_binop(expression, *common_params)
-    elif isinstance(expression, ast.Compare):
-        # Comparison -> evaluate the comparison
-        return evaluate_condition(expression, *common_params)
-    elif isinstance(expression, ast.Lambda):
-        return evaluate_lambda(expression, *common_params)
-    elif isinstance(expression, ast.FunctionDef):
-        return evaluate_function_def(expression, *common_params)
-    elif isinstance(expression, ast.Dict):
-        # Dict -> evaluate all keys and values
-        keys = (evaluate_ast(k, *common_params) for k in expression.keys)
-        values = (evaluate_ast(v, *common_params) for v in expression.values)
-        return dict(zip(keys, values))
-    elif isinstance(expression, ast.Expr):
-        # Expression -> evaluate the content
-        return evaluate_ast(expression.value, *common_params)
-    elif isinstance(expression, ast.For):
-        # For loop -> execute the loop
-        return evaluate_for(expression, *common_params)
-    elif isinstance(expression, ast.FormattedValue):
-        # Formatted value (part of f-string) -> evaluate the content and format it
-        value = evaluate_ast(expression.value, *common_params)
-        # Early return if no format spec
-        if not expression.format_spec:
-            return value
-        # Apply format specification
-        format_spec = evaluate_ast(expression.format_spec, *common_params)
-        return format(value, format_spec)
-    elif isinstance(expression, ast.If):
-        # If -> execute the right branch
-        return evaluate_if(expression, *common_params)
-    elif hasattr(ast, "Index") and isinstance(expression, ast.Index):
-        return evaluate_ast(expression.value, *common_params)
-    elif isinstance(expression, ast.JoinedStr):
-        return "".join([str(evaluate_ast(v, *common_params)) for v in expression.values])
-    elif isinstance(expression, ast.List):
-        # List -> evaluate all elements
-        return [evaluate_ast(elt, *common_params) for elt in expression.elts]
-    elif isinstance(expression, ast.Name):
+    elif expression_type is ast.Name:
         # Name -> pick up the value in the state
-        return evaluate_name(expression, *common_params)
-    elif isinstance(expression, ast.Subscript):
-        # Subscript -> return the value of the indexing
-        return evaluate_subscript(expression, *common_params)
-    elif isinstance(expression, ast.IfExp):
-        test_val = evaluate_ast(expression.test, *common_params)
-        if test_val:
-            return evaluate_ast(expression.body, *common_params)
-        else:
-            return evaluate_ast(expression.orelse, *common_params)
-    elif isinstance(expression, ast.Attribute):
-        return evaluate_attribute(expression, *common_params)
-    elif isinstance(expression, ast.Slice):
-        return slice(
-            evaluate_ast(expression.lower, *common_params) if expression.lower is not None else None,
-            evaluate_ast(expression.upper, *common_params) if expression.upper is not None else None,
-            evaluate_ast(expression.step, *common_params) if expression.step is not None else None,
-        )
-    elif isinstance(expression, ast.While):
-        return evaluate_while(expression, *common_params)
-    elif isinstance(expression, (ast.Import, ast.ImportFrom)):
-        return evaluate_import(expression, state, authorized_imports)
-    elif isinstance(expression, ast.ClassDef):
-        return evaluate_class_def(expression, *common_params)
-    elif isinstance(expression, ast.Try):
-        return evaluate_try(expression, *common_params)
-    elif isinstance(expression, ast.Raise):
-        return evaluate_raise(expression, *common_params)
-    elif isinstance(expression, ast.Assert):
-        return evaluate_assert(expression, *common_params)
-    elif isinstance(expression, ast.With):
-        return evaluate_with(expression, *common_params)
-    elif isinstance(expression, ast.Set):
-        return set((evaluate_ast(elt, *common_params) for elt in expression.elts))
-    elif isinstance(expression, ast.Return):
-        raise ReturnException(evaluate_ast(expression.value, *common_params) if expression.value else None)
-    elif isinstance(expression, ast.Pass):
-        return None
-    elif isinstance(expression, ast.Delete):
-        return evaluate_delete(expression, *common_params)
+        try:
+            result = state[expression.id]
+        except KeyError:
+            result = evaluate_name(expression, state, static_tools, custom_tools, authorized_imports)
+    elif expression_type is ast.Attribute:
+        result = evaluate_attribute(expression, state, static_tools, custom_tools, authorized_imports)
+    elif expression_type is ast.Call:
+        # Function call -> we return the value of the function call
+        result = evaluate_call(expression, state, static_tools, custom_tools, authorized_imports)
+    elif expression_type is ast.BinOp:
+        # Binary operation -> execute operation
+        operation = BINARY_OPERATORS.get(type(expression.op))
+        if operation is None:
+            return evaluate_binop(expression, state, static_tools, custom_tools, authorized_imports)
+        left_val = evaluate_ast(expression.left, state, static_tools, custom_tools, authorized_imports)
+        right_val = evaluate_ast(expression.right, state, static_tools, custom_tools, authorized_imports)
+        result = operation(left_val, right_val)
     else:
-        # For now we refuse anything else. Let's add things as we need them.
-        raise InterpreterError(f"{expression.__class__.__name__} is not supported.")
+        evaluator = NODE_EVALUATORS.get(expression_type)
+        if evaluator is None:
+            # For now we refuse anything else. Let's add things as we need them.
+            raise InterpreterError(f"{expression.__class__.__name__} is not supported.")
+        result = evaluator(expression, state, static_tools, custom_tools, authorized_imports)
+    # Same check as `safer_eval`, inlined since it runs on every node, and skipped for plain values
+    if type(result) not in PLAIN_VALUE_TYPES:
+        check_safer_result(result, static_tools, authorized_imports)
+    return result
 
 
 class FinalAnswerException(Exception):
@@ -1496,13 +1809,52 @@ class FinalAnswerException(Exception):
         self.value = value
 
 
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_code(code: str) -> ast.Module:
+    """Parse a code action, reusing the tree of an identical code action: the evaluation never modifies it."""
+    return ast.parse(code)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _code_names(code: str) -> frozenset[str]:
+    """Names of the variables used by a code action."""
+    try:
+        tree = _parse_code(code)
+    except SyntaxError:
+        return frozenset()
+    return frozenset(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _mutated_names(code: str) -> frozenset[str]:
+    """Names of the variables that a code action may mutate, in the cases where the interpreter records mutations."""
+    try:
+        tree = _parse_code(code)
+    except SyntaxError:
+        return frozenset()
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            target = node.value
+        elif isinstance(node, ast.AugAssign):
+            target = node.target
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in MUTATING_METHODS:
+            target = node.func.value
+        else:
+            continue
+        if isinstance(target, ast.Name):
+            names.add(target.id)
+    return frozenset(names)
+
+
 def evaluate_python_code(
     code: str,
     static_tools: dict[str, Callable] | None = None,
     custom_tools: dict[str, Callable] | None = None,
     state: dict[str, Any] | None = None,
-    authorized_imports: list[str] = BASE_BUILTIN_MODULES,
+    authorized_imports: list[str] | AuthorizedImports = BASE_BUILTIN_MODULES,
     max_print_outputs_length: int = DEFAULT_MAX_LEN_OUTPUT,
+    artifact_store: ArtifactStore | None = None,
 ):
     """
     Evaluate a python expression using the content of the variables stored in a state and only evaluating a given set
@@ -1523,9 +1875,17 @@ def evaluate_python_code(
             A dictionary mapping variable names to values. The `state` should contain the initial inputs but will be
             updated by this function to contain all variables as they are evaluated.
             The print outputs will be stored in the state under the key "_print_outputs".
+        authorized_imports (`list[str]` or `AuthorizedImports`):
+            The imports the code is allowed to make. Pass an [`AuthorizedImports`] to reuse its compiled import tree
+            across calls.
+        max_print_outputs_length (`int`):
+            Maximum length of the print outputs, which are truncated beyond it.
+        artifact_store (`ArtifactStore`, *optional*):
+            If given, print outputs longer than `max_print_outputs_length` are stored in it instead of being
+            truncated, and only a preview mentioning the artifact handle is kept.
     """
     try:
-        expression = ast.parse(code)
+        expression = _parse_code(code)
     except SyntaxError as e:
         raise InterpreterError(
             f"Code parsing failed on line {e.lineno} due to: {type(e).__name__}\n"
@@ -1536,11 +1896,14 @@ def evaluate_python_code(
 
     if state is None:
         state = {}
+    if not isinstance(authorized_imports, AuthorizedImports):
+        authorized_imports = AuthorizedImports(authorized_imports)
     static_tools = static_tools.copy() if static_tools is not None else {}
     custom_tools = custom_tools if custom_tools is not None else {}
     result = None
-    state["_print_outputs"] = PrintContainer()
-    state["_operations_count"] = {"counter": 0}
+    state["_print_outputs"] = PrintContainer(max_print_outputs_length, artifact_store)
+    # The cancellation token of the agent run, if any, is checked periodically to stop long computations
+    state["_operations_count"] = OperationsCounter(cancellation_token=get_cancellation_token())
 
     if "final_answer" in static_tools:
         previous_final_answer = static_tools["final_answer"]
@@ -1553,26 +1916,150 @@ def evaluate_python_code(
     try:
         for node in expression.body:
             result = evaluate_ast(node, state, static_tools, custom_tools, authorized_imports)
-        state["_print_outputs"].value = truncate_content(
-            str(state["_print_outputs"]), max_length=max_print_outputs_length
-        )
+        state["_print_outputs"].finalize()
         is_final_answer = False
         return result, is_final_answer
     except FinalAnswerException as e:
-        state["_print_outputs"].value = truncate_content(
-            str(state["_print_outputs"]), max_length=max_print_outputs_length
-        )
+        state["_print_outputs"].finalize()
         is_final_answer = True
         return e.value, is_final_answer
     except Exception as e:
-        state["_print_outputs"].value = truncate_content(
-            str(state["_print_outputs"]), max_length=max_print_outputs_length
-        )
+        state["_print_outputs"].finalize()
         raise InterpreterError(
             f"Code execution failed at line '{ast.get_source_segment(code, node)}' due to: {type(e).__name__}: {e}"
         )
 
 
+COMPILED_CODE_FILENAME = "<code action>"
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _compile_code(code: str) -> tuple[Any, Any, str | None]:
+    """Compile a code action for `exec`, splitting off its last statement to return its value like the interpreter.
+
+    Returns the code object of the statements, the code object evaluating the value of the last statement if it is an
+    expression, and the name of the variable holding that value if the last statement assigns a single name.
+    """
+    module = _parse_code(code)
+    body = module.body
+    last_expression, result_name = None, None
+    if body and isinstance(body[-1], ast.Expr):
+        last_expression = compile(ast.Expression(body[-1].value), COMPILED_CODE_FILENAME, "eval")
+        body = body[:-1]
+    elif body and isinstance(body[-1], ast.Assign) and len(body[-1].targets) == 1:
+        if isinstance(body[-1].targets[0], ast.Name):
+            result_name = body[-1].targets[0].id
+    statements = compile(ast.Module(body=body, type_ignores=[]), COMPILED_CODE_FILENAME, "exec")
+    return statements, last_expression, result_name
+
+
+def _failing_line(code: str, error: BaseException) -> str | None:
+    line_number = None
+    for frame, frame_line_number in traceback.walk_tb(error.__traceback__):
+        if frame.f_code.co_filename == COMPILED_CODE_FILENAME:
+            line_number = frame_line_number
+    if line_number is None:
+        return None
+    lines = code.splitlines()
+    return lines[line_number - 1].strip() if 0 < line_number <= len(lines) else None
+
+
+def execute_compiled_code(
+    code: str,
+    static_tools: dict[str, Callable] | None = None,
+    custom_tools: dict[str, Callable] | None = None,
+    state: dict[str, Any] | None = None,
+    authorized_imports: list[str] | AuthorizedImports = BASE_BUILTIN_MODULES,
+    max_print_outputs_length: int = DEFAULT_MAX_LEN_OUTPUT,
+    artifact_store: ArtifactStore | None = None,
+):
+    """
+    Execute python code compiled to bytecode, with the same tools, state, print capture and `final_answer` semantics as
+    [`evaluate_python_code`], at native CPython speed.
+
+    Only imports are restricted, to `authorized_imports`: the code can use every builtin, dunder attribute and module
+    attribute, and there is no limit on the number of operations. Only use it for trusted agents.
+
+    Args:
+        code (`str`):
+            The code to execute.
+        static_tools (`Dict[str, Callable]`):
+            The functions that may be called during the execution, made available as builtins.
+        custom_tools (`Dict[str, Callable]`):
+            Functions defined by earlier interpreted code actions, made available as builtins.
+        state (`Dict[str, Any]`):
+            The global variables of the code, updated by the execution. The print outputs will be stored in the state
+            under the key "_print_outputs".
+        authorized_imports (`list[str]` or `AuthorizedImports`):
+            The imports the code is allowed to make. Pass `["*"]` to skip the check.
+        max_print_outputs_length (`int`):
+            Maximum length of the print outputs, which are truncated beyond it.
+        artifact_store (`ArtifactStore`, *optional*):
+            If given, print outputs longer than `max_print_outputs_length` are stored in it instead of being
+            truncated, and only a preview mentioning the artifact handle is kept.
+    """
+    try:
+        statements, last_expression, result_name = _compile_code(code)
+    except SyntaxError as e:
+        raise InterpreterError(
+            f"Code parsing failed on line {e.lineno} due to: {type(e).__name__}\n"
+            f"{e.text}"
+            f"{' ' * (e.offset or 0)}^\n"
+            f"Error: {str(e)}"
+        )
+
+    if state is None:
+        state = {}
+    if not isinstance(authorized_imports, AuthorizedImports):
+        authorized_imports = AuthorizedImports(authorized_imports)
+    static_tools = static_tools.copy() if static_tools is not None else {}
+    state["_print_outputs"] = PrintContainer(max_print_outputs_length, artifact_store)
+    state["_operations_count"] = OperationsCounter(cancellation_token=get_cancellation_token())
+
+    if "final_answer" in static_tools:
+        previous_final_answer = static_tools["final_answer"]
+
+        def final_answer(*args, **kwargs):  # Allow arbitrary arguments to be passed
+            raise FinalAnswerException(previous_final_answer(*args, **kwargs))
+
+        static_tools["final_answer"] = final_answer
+
+    def captured_print(*args, sep=" ", end="\n", file=None, flush=False):
+        if file is not None:
+            return builtins.print(*args, sep=sep, end=end, file=file, flush=flush)
+        # Looked up at call time, so that functions defined in earlier steps print to the current step
+        state["_print_outputs"] += sep.join(map(str, args)) + end
+
+    def authorized_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and not authorized_imports.is_authorized(name):
+            raise ImportError(f"Import of {name} is not allowed. Please try to use other libraries.")
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    # Tools are injected as builtins rather than globals, so that they are not saved in the state
+    code_builtins = {**vars(builtins), **(custom_tools or {}), **static_tools, "print": captured_print}
+    if "*" not in authorized_imports:
+        code_builtins["__import__"] = authorized_import
+    state["__builtins__"] = code_builtins
+    try:
+        exec(statements, state)
+        if last_expression is not None:
+            result = eval(last_expression, state)
+        else:
+            result = state.get(result_name) if result_name is not None else None
+        state["_print_outputs"].finalize()
+        return result, False
+    except FinalAnswerException as e:
+        state["_print_outputs"].finalize()
+        return e.value, True
+    except Exception as e:
+        state["_print_outputs"].finalize()
+        raise InterpreterError(
+            f"Code execution failed at line '{_failing_line(code, e)}' due to: {type(e).__name__}: {e}"
+        )
+    finally:
+        state.pop("__builtins__", None)
+
+
 @dataclass
 class CodeOutput:
     output: Any
@@ -1584,6 +2071,15 @@ class PythonExecutor:
     pass
 
 
+def _run_clone(clone: Callable, *args, **kwargs) -> Any:
+    """Run a clone of a managed agent made for a single call, then release its resources, e.g. its executor."""
+    try:
+        return clone(*args, **kwargs)
+    finally:
+        if hasattr(clone, "cleanup"):
+            clone.cleanup()
+
+
 class LocalPythonExecutor(PythonExecutor):
     """
     Executor of Python code in a local environment.
@@ -1600,6 +2096,31 @@ class LocalPythonExecutor(PythonExecutor):
             Maximum length of the print outputs.
         additional_functions (`dict[str, Callable]`, *optional*):
             Additional Python functions to be added to the executor.
+        max_parallel_calls (`int`, default `4`):
+            Maximum number of tool or managed agent calls run concurrently through `submit`.
+        spill_large_outputs (`bool`, default `True`):
+            Whether to store print outputs longer than `max_print_outputs_length` in an artifact store instead of
+            truncating them. The code can then page through or search them with `read_artifact` and `grep_artifact`.
+        artifact_store (`ArtifactStore`, *optional*):
+            Artifact store used if `spill_large_outputs` is set, which the caller removes. Defaults to a store in a new
+            temporary directory, removed by `cleanup`.
+        compiled (`bool`, default `False`):
+            Whether to compile code actions to bytecode and run them at native speed with [`execute_compiled_code`]
+            instead of interpreting them. This only restricts imports: only use it for trusted agents.
+        memory_budget (`int`, *optional*):
+            Memory in bytes that the variables of the state may use before large variables that the last code action
+            did not use are spilled to disk. They are reloaded when code reads them, see [`ExecutorState`]. If
+            neither `memory_budget` nor `rollback_on_error` is set, the state is a plain dict.
+        spill_threshold (`int`, default `1 MiB`):
+            Variables smaller than this number of bytes are never spilled.
+        rollback_on_error (`bool`, default `False`):
+            Whether to undo the changes of a failing code action to the variables, so that the next one does not run
+            on a half-updated state. Rebinding, deletion and mutation of variables are rolled back, except for
+            mutations of nested values or through unknown methods. `rolled_back_steps` counts the code actions
+            rolled back.
+        artifact_parent_directory (`str`, *optional*):
+            Directory in which the default artifact store creates its temporary directory, e.g. the workspace of a
+            task. Defaults to the system's temporary directory.
     """
 
     def __init__(
@@ -1607,9 +2128,22 @@ class LocalPythonExecutor(PythonExecutor):
         additional_authorized_imports: list[str],
         max_print_outputs_length: int | None = None,
         additional_functions: dict[str, Callable] | None = None,
+        max_parallel_calls: int = 4,
+        spill_large_outputs: bool = True,
+        artifact_store: ArtifactStore | None = None,
+        compiled: bool = False,
+        memory_budget: int | None = None,
+        spill_threshold: int = DEFAULT_SPILL_THRESHOLD,
+        rollback_on_error: bool = False,
+        artifact_parent_directory: str | None = None,
     ):
         self.custom_tools = {}
-        self.state = {"__name__": "__main__"}
+        if memory_budget is not None or rollback_on_error:
+            self.state = ExecutorState(memory_budget=memory_budget, spill_threshold=spill_threshold)
+        else:
+            # Compiled code looks up the variables of a plain dict much faster than those of a dict subclass
+            self.state = {}
+        self.state["__name__"] = "__main__"
         self.max_print_outputs_length = max_print_outputs_length
         if max_print_outputs_length is None:
             self.max_print_outputs_length = DEFAULT_MAX_LEN_OUTPUT
@@ -1618,28 +2152,191 @@ class LocalPythonExecutor(PythonExecutor):
         # TODO: assert self.authorized imports are all installed locally
         self.static_tools = None
         self.additional_functions = additional_functions or {}
+        self.max_parallel_calls = max_parallel_calls
+        self._submittable_tools: dict[str, Callable] = {}
+        self._call_pool: ThreadPoolExecutor | None = None
+        self._pending_calls: set[Future] = set()
+        self.artifact_store = (
+            (artifact_store or ArtifactStore(parent_directory=artifact_parent_directory)) if spill_large_outputs else None
+        )
+        self._owns_artifact_store = artifact_store is None
+        self.compiled = compiled
+        self.rollback_on_error = rollback_on_error
+        self.rolled_back_steps = 0
+        # Globals of compiled code when the state is an `ExecutorState`, only filled while a code action runs
+        self._code_globals: dict[str, Any] = {}
         
         # Configure matplotlib to use non-GUI backend to prevent threading issues
         _configure_matplotlib_backend()
 
+    @property
+    def authorized_imports(self) -> AuthorizedImports:
+        return self._authorized_imports
+
+    @authorized_imports.setter
+    def authorized_imports(self, authorized_imports: Iterable[str]):
+        # Compiled once here instead of on every import: assign a new list to change the authorized imports
+        self._authorized_imports = AuthorizedImports(authorized_imports)
+
     def __call__(self, code_action: str) -> CodeOutput:
-        output, is_final_answer = evaluate_python_code(
-            code_action,
-            static_tools=self.static_tools,
-            custom_tools=self.custom_tools,
-            state=self.state,
-            authorized_imports=self.authorized_imports,
-            max_print_outputs_length=self.max_print_outputs_length,
-        )
+        execute = execute_compiled_code if self.compiled else evaluate_python_code
+        if not isinstance(self.state, ExecutorState):
+            output, is_final_answer = execute(
+                code_action,
+                static_tools=self.static_tools,
+                custom_tools=self.custom_tools,
+                state=self.state,
+                authorized_imports=self.authorized_imports,
+                max_print_outputs_length=self.max_print_outputs_length,
+                artifact_store=self.artifact_store,
+            )
+            logs = str(self.state["_print_outputs"])
+            return CodeOutput(output=output, logs=logs, is_final_answer=is_final_answer)
+        names = _code_names(code_action)
+        # Compiled code reads variables directly from the dict: reload the spilled ones it uses beforehand
+        self.state.begin_step(names, journal=self.rollback_on_error)
+        if self.compiled and self.rollback_on_error:
+            # Compiled code mutates variables without the interpreter seeing it: copy the ones it may mutate upfront
+            for name in _mutated_names(code_action):
+                self.state.record_mutation(name)
+        # Compiled code runs against a plain dict filled with the variables, which it looks up much faster, and its
+        # changes are moved back to the state after it ran. The dict is kept since it is the globals of the functions
+        # that the code defines, but emptied between steps so that it does not keep spilled variables in memory
+        state = self.state
+        if self.compiled:
+            state = self._code_globals
+            state.update(dict.items(self.state))
+        try:
+            try:
+                output, is_final_answer = execute(
+                    code_action,
+                    static_tools=self.static_tools,
+                    custom_tools=self.custom_tools,
+                    state=state,
+                    authorized_imports=self.authorized_imports,
+                    max_print_outputs_length=self.max_print_outputs_length,
+                    artifact_store=self.artifact_store,
+                )
+            finally:
+                if state is not self.state:
+                    self.state.update_from(state)
+                    state.clear()
+        except InterpreterError as e:
+            if not self.state.rollback():
+                raise
+            self.rolled_back_steps += 1
+            raise InterpreterError(
+                f"{e}\nThe changes of this code to the variables were undone: they have their values from before it ran."
+            ) from e
+        finally:
+            self.state.end_step(names, function_globals=self._code_globals if self.compiled else None)
         logs = str(self.state["_print_outputs"])
         return CodeOutput(output=output, logs=logs, is_final_answer=is_final_answer)
 
+    def memory_report(self) -> dict[str, Any] | None:
+        """Estimated memory used by the variables, as of the last code action, if the state accounts for it."""
+        return self.state.memory_report() if isinstance(self.state, ExecutorState) else None
+
+    def share_artifact_store(self, artifact_store: ArtifactStore):
+        """Store outputs in the artifact store of another executor, which removes them when it is cleaned up."""
+        if self.artifact_store is not None and self._owns_artifact_store:
+            self.artifact_store.cleanup()
+        self.artifact_store = artifact_store
+        self._owns_artifact_store = False
+
     def send_variables(self, variables: dict):
         self.state.update(variables)
 
     def send_tools(self, tools: dict[str, Tool]):
+        self._submittable_tools = dict(tools)
         # Combine agent tools, base Python tools, and additional Python functions
-        self.static_tools = {**tools, **BASE_PYTHON_TOOLS.copy(), **self.additional_functions}
-
+        self.static_tools = {
+            **tools,
+            **BASE_PYTHON_TOOLS.copy(),
+            "submit": self.submit,
+            "gather": self.gather,
+            **self.additional_functions,
+        }
+        if self.artifact_store is not None:
+            self.static_tools["read_artifact"] = self.read_artifact
+            self.static_tools["grep_artifact"] = self.grep_artifact
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Start a call to a tool or a managed agent in the background, and return a future to pass to `gather`.
+
+        Managed agents keep state between calls: each submitted call runs on a clone of the agent, so that several
+        delegations to the same agent can run concurrently. Its outputs are stored in the artifact store of this
+        executor. Agents running code in a remote sandbox can't be submitted.
+        """
+        fn = inspect.unwrap(fn)  # Tools are wrapped by `safer_func` when evaluated
+        if not any(fn is tool for tool in self._submittable_tools.values()):
+            raise InterpreterError("submit() only accepts a tool or a team member as first argument.")
+        if hasattr(fn, "clone"):
+            try:
+                clone = fn.clone()
+            except ValueError as e:
+                raise InterpreterError(str(e))
+            # The answer of the clone may cite its artifacts, which must stay readable after the clone is cleaned up
+            artifact_store = self.artifact_store or getattr(getattr(fn, "python_executor", None), "artifact_store", None)
+            clone_executor = getattr(clone, "python_executor", None)
+            if artifact_store is not None and hasattr(clone_executor, "share_artifact_store"):
+                clone_executor.share_artifact_store(artifact_store)
+            fn = partial(_run_clone, clone)
+        if self._call_pool is None:
+            self._call_pool = ThreadPoolExecutor(max_workers=self.max_parallel_calls, thread_name_prefix="submit")
+        # Run in a copy of the caller's context, so that the call is recorded by the active tracer
+        future = self._call_pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        self._pending_calls.add(future)
+        future.add_done_callback(self._pending_calls.discard)
+        return future
+
+    def wait_for_submitted_calls(self):
+        """Wait for the calls started by `submit` to finish, including the ones the code did not gather."""
+        wait(list(self._pending_calls))
+
+    def gather(self, *futures: Future, return_exceptions: bool = False) -> list:
+        """Wait for futures returned by `submit` and return their results, in the same order.
+
+        If `return_exceptions` is True, exceptions are returned in place of the results of the failed calls instead of
+        being raised.
+        """
+        if len(futures) == 1 and isinstance(futures[0], (list, tuple)):
+            futures = tuple(futures[0])
+        if not all(isinstance(future, Future) for future in futures):
+            raise InterpreterError("gather() only accepts the results of submit().")
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    def read_artifact(self, handle: str, offset: int = 0, length: int = 10000) -> str:
+        """Return `length` characters of a stored output, starting at character `offset`."""
+        try:
+            return self.artifact_store.read(handle, offset=offset, length=length)
+        except ValueError as e:
+            raise InterpreterError(str(e))
 
-__all__ = ["evaluate_python_code", "LocalPythonExecutor"]
+    def grep_artifact(self, handle: str, pattern: str, context: int = 0, max_matches: int = 50) -> str:
+        """Return the lines of a stored output matching a regular expression, with `context` lines around them."""
+        try:
+            return self.artifact_store.grep(handle, pattern, context=context, max_matches=max_matches)
+        except (ValueError, re.error) as e:
+            raise InterpreterError(str(e))
+
+    def cleanup(self):
+        """Shut down the pool running submitted calls and remove the stored outputs and spilled variables."""
+        if self._call_pool is not None:
+            self._call_pool.shutdown(wait=False, cancel_futures=True)
+            self._call_pool = None
+        if self.artifact_store is not None and self._owns_artifact_store:
+            self.artifact_store.cleanup()
+        if isinstance(self.state, ExecutorState):
+            self.state.cleanup()
+
+
+__all__ = ["AuthorizedImports", "evaluate_python_code", "execute_compiled_code", "LocalPythonExecutor"]
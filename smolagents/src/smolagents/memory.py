@@ -1,4 +1,5 @@
 import inspect
+from collections.abc import Sequence
 from dataclasses import asdict, dataclass
 from logging import getLogger
 from typing import TYPE_CHECKING, Any, Callable, Type
@@ -15,7 +16,7 @@ if TYPE_CHECKING:
     from smolagents.monitoring import AgentLogger
 
 
-__all__ = ["AgentMemory"]
+__all__ = ["AgentMemory", "MemoryPolicy", "WindowMemoryPolicy", "DigestMemoryPolicy", "SummarizeMemoryPolicy"]
 
 
 logger = getLogger(__name__)
@@ -38,6 +39,114 @@ class ToolCall:
         }
 
 
+def _message_key(message: ChatMessage) -> tuple:
+    """Hashable key identifying the content of a message."""
+    if isinstance(message.content, list):
+        content = tuple(
+            element.get("text") if element.get("type") == "text" else id(element.get("image", element))
+            for element in message.content
+        )
+    else:
+        content = message.content
+    tool_calls = tuple(id(tool_call) for tool_call in message.tool_calls) if message.tool_calls else None
+    return (str(message.role), content, tool_calls)
+
+
+class MessageLog:
+    """Append-only log of all the messages sent to the model during a run.
+
+    Steps reference their input messages as spans of this log instead of holding their own copy, so that the history
+    shared by consecutive model inputs is stored only once.
+    Messages are matched by identity first, then by content.
+    """
+
+    def __init__(self):
+        self.messages: list[ChatMessage] = []
+        self._positions_by_id: dict[int, int] = {}
+        self._positions_by_key: dict[tuple, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def _find(self, message: ChatMessage, cursor: int) -> int | None:
+        if cursor < len(self.messages) and self.messages[cursor] is message:
+            return cursor
+        position = self._positions_by_id.get(id(message))
+        if position is not None and self.messages[position] is message:
+            return position
+        key = _message_key(message)
+        if cursor < len(self.messages) and _message_key(self.messages[cursor]) == key:
+            return cursor
+        return self._positions_by_key.get(key)
+
+    def _append(self, message: ChatMessage) -> int:
+        position = len(self.messages)
+        self.messages.append(message)
+        self._positions_by_id[id(message)] = position
+        self._positions_by_key.setdefault(_message_key(message), position)
+        return position
+
+    def reference(self, messages: list[ChatMessage]) -> "MessageReference":
+        """Record `messages` in the log, appending only the ones not already logged, and return their reference."""
+        spans: list[list[int]] = []
+        cursor = 0
+        for message in messages:
+            position = self._find(message, cursor)
+            if position is None:
+                position = self._append(message)
+            if spans and spans[-1][1] == position:
+                spans[-1][1] += 1
+            else:
+                spans.append([position, position + 1])
+            cursor = position + 1
+        return MessageReference(self, [(start, end) for start, end in spans])
+
+    def dict(self) -> list[dict]:
+        return [message.dict() for message in self.messages]
+
+
+class MessageReference(Sequence):
+    """Read-only list of messages, stored as spans `(start, end)` of a [`MessageLog`] and expanded on access."""
+
+    def __init__(self, log: MessageLog, spans: list[tuple[int, int]]):
+        self.log = log
+        self.spans = spans
+
+    def __len__(self) -> int:
+        return sum(end - start for start, end in self.spans)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_list()[index]
+        if index < 0:
+            index += len(self)
+        for start, end in self.spans:
+            if index < end - start:
+                return self.log.messages[start + index]
+            index -= end - start
+        raise IndexError("MessageReference index out of range")
+
+    def __iter__(self):
+        for start, end in self.spans:
+            yield from self.log.messages[start:end]
+
+    def __repr__(self) -> str:
+        return f"MessageReference(spans={self.spans})"
+
+    def to_list(self) -> list[ChatMessage]:
+        """Expand the reference into a new list of messages."""
+        return list(self)
+
+    def dict(self) -> dict:
+        return {"message_log_spans": [list(span) for span in self.spans]}
+
+
+def _serialize_input_messages(messages: "MessageReference | list[ChatMessage] | None") -> dict | list | None:
+    if isinstance(messages, MessageReference):
+        return messages.dict()
+    return messages
+
+
 @dataclass
 class MemoryStep:
     def dict(self):
@@ -51,7 +160,7 @@ class MemoryStep:
 class ActionStep(MemoryStep):
     step_number: int
     timing: Timing
-    model_input_messages: list[ChatMessage] | None = None
+    model_input_messages: "MessageReference | list[ChatMessage] | None" = None
     tool_calls: list[ToolCall] | None = None
     error: AgentError | None = None
     model_output_message: ChatMessage | None = None
@@ -62,13 +171,15 @@ class ActionStep(MemoryStep):
     action_output: Any = None
     token_usage: TokenUsage | None = None
     is_final_answer: bool = False
+    estimated_input_tokens: int | None = None
+    token_usage_estimated: bool = False
 
     def dict(self):
         # We overwrite the method to parse the tool_calls and action_output manually
         return {
             "step_number": self.step_number,
             "timing": self.timing.dict(),
-            "model_input_messages": self.model_input_messages,
+            "model_input_messages": _serialize_input_messages(self.model_input_messages),
             "tool_calls": [tc.dict() for tc in self.tool_calls] if self.tool_calls else [],
             "error": self.error.dict() if self.error else None,
             "model_output_message": self.model_output_message.dict() if self.model_output_message else None,
@@ -81,6 +192,8 @@ class ActionStep(MemoryStep):
             "action_output": make_json_serializable(self.action_output),
             "token_usage": asdict(self.token_usage) if self.token_usage else None,
             "is_final_answer": self.is_final_answer,
+            "estimated_input_tokens": self.estimated_input_tokens,
+            "token_usage_estimated": self.token_usage_estimated,
         }
 
     def to_messages(self, summary_mode: bool = False) -> list[ChatMessage]:
@@ -146,11 +259,25 @@ class ActionStep(MemoryStep):
 
 @dataclass
 class PlanningStep(MemoryStep):
-    model_input_messages: list[ChatMessage]
+    model_input_messages: "MessageReference | list[ChatMessage]"
     model_output_message: ChatMessage
     plan: str
     timing: Timing
     token_usage: TokenUsage | None = None
+    estimated_input_tokens: int | None = None
+    token_usage_estimated: bool = False
+
+    def dict(self):
+        # We overwrite the method to avoid deep-copying the message log referenced by the input messages
+        return {
+            "model_input_messages": _serialize_input_messages(self.model_input_messages),
+            "model_output_message": self.model_output_message.dict(),
+            "plan": self.plan,
+            "timing": self.timing.dict(),
+            "token_usage": asdict(self.token_usage) if self.token_usage else None,
+            "estimated_input_tokens": self.estimated_input_tokens,
+            "token_usage_estimated": self.token_usage_estimated,
+        }
 
     def to_messages(self, summary_mode: bool = False) -> list[ChatMessage]:
         if summary_mode:
@@ -177,6 +304,27 @@ class TaskStep(MemoryStep):
         return [ChatMessage(role=MessageRole.USER, content=content)]
 
 
+@dataclass
+class SummaryStep(MemoryStep):
+    """Summary replacing the oldest steps of the memory, including any previous summary."""
+
+    summary: str
+    summarized_steps: int
+
+    def to_messages(self, summary_mode: bool = False) -> list[ChatMessage]:
+        return [
+            ChatMessage(
+                role=MessageRole.USER,
+                content=[
+                    {
+                        "type": "text",
+                        "text": f"Summary of the {self.summarized_steps} earlier steps:\n{self.summary}",
+                    }
+                ],
+            )
+        ]
+
+
 @dataclass
 class SystemPromptStep(MemoryStep):
     system_prompt: str
@@ -192,6 +340,36 @@ class FinalAnswerStep(MemoryStep):
     output: Any
 
 
+class _RenderedMessages:
+    """Messages rendered from the first `len(rendered_steps)` steps of a memory, extended as steps are appended."""
+
+    def __init__(self, system_prompt: "SystemPromptStep", steps: list, summary_mode: bool):
+        self.system_prompt = system_prompt
+        self.steps = steps
+        self.summary_mode = summary_mode
+        self.rendered_count = 0
+        self.last_step = None
+        self.messages: list[ChatMessage] = system_prompt.to_messages(summary_mode=summary_mode)
+        # Index of the end of the messages of the system prompt, and of each rendered step
+        self.system_prompt_end = len(self.messages)
+        self.step_ends: list[int] = []
+
+    def is_valid_for(self, memory: "AgentMemory") -> bool:
+        return (
+            memory.system_prompt is self.system_prompt
+            and memory.steps is self.steps
+            and self.rendered_count <= len(memory.steps)
+            and (self.rendered_count == 0 or memory.steps[self.rendered_count - 1] is self.last_step)
+        )
+
+    def extend(self, steps: list):
+        for step in steps[self.rendered_count :]:
+            self.messages.extend(step.to_messages(summary_mode=self.summary_mode))
+            self.step_ends.append(len(self.messages))
+        self.rendered_count = len(steps)
+        self.last_step = steps[-1] if steps else None
+
+
 class AgentMemory:
     """Memory for the agent, containing the system prompt and all steps taken by the agent.
 
@@ -204,15 +382,88 @@ class AgentMemory:
     **Attributes**:
         - **system_prompt** (`SystemPromptStep`) -- System prompt step for the agent.
         - **steps** (`list[TaskStep | ActionStep | PlanningStep]`) -- List of steps taken by the agent, which can include tasks, actions, and planning steps.
+        - **message_log** (`MessageLog`) -- Append-only log of the messages sent to the model, referenced by the steps' input messages.
     """
 
     def __init__(self, system_prompt: str):
         self.system_prompt: SystemPromptStep = SystemPromptStep(system_prompt=system_prompt)
         self.steps: list[TaskStep | ActionStep | PlanningStep] = []
+        self.message_log = MessageLog()
+        self._rendered_messages: dict[bool, _RenderedMessages] = {}
+        # Messages of steps rendered by other means than `to_messages`, by `(id(step), summary_mode)`
+        self._step_renderings: dict[tuple[int, bool], tuple[MemoryStep, Callable, list[ChatMessage]]] = {}
 
     def reset(self):
         """Reset the agent's memory, clearing all steps and keeping the system prompt."""
         self.steps = []
+        self.message_log = MessageLog()
+        self.invalidate_rendered_messages()
+
+    def invalidate_rendered_messages(self):
+        """Drop the cache of rendered messages.
+
+        Appending steps, replacing the system prompt or reassigning `steps` are detected automatically: this must only
+        be called after modifying steps that were already in memory, e.g. removing old screenshots in a step callback.
+        """
+        self._rendered_messages = {}
+        self._step_renderings = {}
+
+    def _rendered(self, summary_mode: bool) -> _RenderedMessages:
+        rendered = self._rendered_messages.get(summary_mode)
+        if rendered is None or not rendered.is_valid_for(self):
+            rendered = _RenderedMessages(self.system_prompt, self.steps, summary_mode)
+            self._rendered_messages[summary_mode] = rendered
+            # Steps were replaced: drop the renderings of the ones that may be gone
+            self._step_renderings = {}
+        rendered.extend(self.steps)
+        return rendered
+
+    def to_messages(self, summary_mode: bool = False) -> list[ChatMessage]:
+        """Render the system prompt and all steps as messages for the model.
+
+        Rendered messages are cached and only the steps appended since the last call are rendered, so that the cost
+        does not grow with the number of steps. The returned list is a new list, but the messages are shared with the
+        cache and must not be modified.
+
+        Args:
+            summary_mode (`bool`, default `False`): Whether to render the steps in summary mode.
+        """
+        return list(self._rendered(summary_mode).messages)
+
+    def to_step_messages(self, summary_mode: bool = False) -> tuple[list[ChatMessage], list[list[ChatMessage]]]:
+        """Return the messages of the system prompt and the messages of each step, as cached by `to_messages`.
+
+        Memory policies assemble their messages from these, so that the messages of the steps they render in full are
+        the same objects from one call to the next.
+        """
+        rendered = self._rendered(summary_mode)
+        starts = [rendered.system_prompt_end] + rendered.step_ends[:-1]
+        return (
+            rendered.messages[: rendered.system_prompt_end],
+            [rendered.messages[start:end] for start, end in zip(starts, rendered.step_ends)],
+        )
+
+    def render_step(
+        self, step: MemoryStep, render: Callable[[MemoryStep, bool], list[ChatMessage]], summary_mode: bool = False
+    ) -> list[ChatMessage]:
+        """Return the messages rendered by `render` for a step of the memory, rendering them only once.
+
+        The rendering is cached until the step leaves the memory or `invalidate_rendered_messages` is called.
+        """
+        key = (id(step), summary_mode)
+        cached = self._step_renderings.get(key)
+        if cached is None or cached[0] is not step or cached[1] != render:
+            cached = (step, render, render(step, summary_mode))
+            self._step_renderings[key] = cached
+        return cached[2]
+
+    def reference_messages(self, messages: list[ChatMessage]) -> MessageReference:
+        """Record model input messages in the message log and return a reference to them, to be stored in a step."""
+        return self.message_log.reference(messages)
+
+    def get_message_log(self) -> list[dict]:
+        """Return the messages of the message log, referenced by index in the steps' `model_input_messages` spans."""
+        return self.message_log.dict()
 
     def get_succinct_steps(self) -> list[dict]:
         """Return a succinct representation of the agent's steps, excluding model input messages."""
@@ -258,6 +509,128 @@ class AgentMemory:
         )
 
 
+class MemoryPolicy:
+    """
+    Policy deciding how the memory is rendered as messages for the model. The base policy renders every step in full.
+
+    Policies are applied when the messages are assembled, and never modify the memory itself. Use the constructors
+    `MemoryPolicy.window(k)`, `MemoryPolicy.digest_older(k)` and `MemoryPolicy.summarize()` to create one.
+    """
+
+    @staticmethod
+    def window(k: int = 3) -> "WindowMemoryPolicy":
+        """Keep the tasks, the latest plan and the last `k` action steps, and drop older steps."""
+        return WindowMemoryPolicy(k)
+
+    @staticmethod
+    def digest_older(k: int = 3, digest_length: int = 200) -> "DigestMemoryPolicy":
+        """Like `window`, but reduce older action steps to their code and a one-line digest of their observation."""
+        return DigestMemoryPolicy(k, digest_length=digest_length)
+
+    @staticmethod
+    def summarize(memory_token_limit: int | None = None, summary_model=None) -> "SummarizeMemoryPolicy":
+        """Keep every step, and let the agent summarize the oldest ones with a model once the memory grows too large."""
+        return SummarizeMemoryPolicy(memory_token_limit=memory_token_limit, summary_model=summary_model)
+
+    def to_messages(self, memory: "AgentMemory", summary_mode: bool = False) -> list[ChatMessage]:
+        return memory.to_messages(summary_mode=summary_mode)
+
+    def to_step_messages(self, memory: "AgentMemory", summary_mode: bool = False) -> list[list[ChatMessage]]:
+        """Render the same messages as `to_messages`, grouped by step: the system prompt, then each rendered step."""
+        system_prompt_messages, step_messages = memory.to_step_messages(summary_mode=summary_mode)
+        return [system_prompt_messages] + step_messages
+
+
+class WindowMemoryPolicy(MemoryPolicy):
+    """Render the tasks, summaries, the latest plan and the last `k` action steps, and drop older steps.
+
+    Steps rendered in full reuse the messages cached by the memory, and older steps are rendered once with
+    `render_older_step`, so that consecutive model inputs share their messages.
+
+    Args:
+        k (`int`, default `3`): Number of most recent action steps rendered in full.
+    """
+
+    def __init__(self, k: int = 3):
+        self.k = k
+
+    def render_older_step(self, step: ActionStep, summary_mode: bool) -> list[ChatMessage]:
+        return []
+
+    def to_messages(self, memory: "AgentMemory", summary_mode: bool = False) -> list[ChatMessage]:
+        return [message for group in self.to_step_messages(memory, summary_mode=summary_mode) for message in group]
+
+    def to_step_messages(self, memory: "AgentMemory", summary_mode: bool = False) -> list[list[ChatMessage]]:
+        steps = memory.steps
+        action_indices = [i for i, step in enumerate(steps) if isinstance(step, ActionStep)]
+        recent_actions = set(action_indices[-self.k :]) if self.k > 0 else set()
+        last_plan = max((i for i, step in enumerate(steps) if isinstance(step, PlanningStep)), default=None)
+        system_prompt_messages, step_messages = memory.to_step_messages(summary_mode=summary_mode)
+        groups = [system_prompt_messages]
+        for i, step in enumerate(steps):
+            if isinstance(step, ActionStep) and i not in recent_actions:
+                groups.append(memory.render_step(step, self.render_older_step, summary_mode=summary_mode))
+            elif isinstance(step, PlanningStep) and i != last_plan:
+                continue
+            else:
+                groups.append(step_messages[i])
+        return groups
+
+
+class DigestMemoryPolicy(WindowMemoryPolicy):
+    """Like [`WindowMemoryPolicy`], but render older action steps as their code and a one-line observation digest.
+
+    Args:
+        k (`int`, default `3`): Number of most recent action steps rendered in full.
+        digest_length (`int`, default `200`): Maximum number of characters of an observation digest.
+    """
+
+    def __init__(self, k: int = 3, digest_length: int = 200):
+        super().__init__(k)
+        self.digest_length = digest_length
+
+    def _digest(self, text: str) -> str:
+        lines = [line.strip() for line in text.splitlines()]
+        lines = [line for line in lines if line and line not in ("Execution logs:", "Last output from code snippet:")]
+        digest = " | ".join(lines)
+        if len(digest) > self.digest_length:
+            digest = digest[: self.digest_length] + f"... ({len(text)} characters)"
+        return digest
+
+    def render_older_step(self, step: ActionStep, summary_mode: bool) -> list[ChatMessage]:
+        messages = []
+        if not summary_mode:
+            if step.code_action is not None:
+                action = f"Step {step.step_number} code:\n{step.code_action.strip()}"
+            elif step.tool_calls:
+                action = f"Step {step.step_number} called tools:\n" + str([tc.dict() for tc in step.tool_calls])
+            else:
+                action = None
+            if action is not None:
+                messages.append(ChatMessage(role=MessageRole.ASSISTANT, content=[{"type": "text", "text": action}]))
+        if step.error is not None:
+            digest = f"Error digest: {self._digest(str(step.error))}"
+        elif step.observations is not None:
+            digest = f"Observation digest: {self._digest(step.observations)}"
+        else:
+            return messages
+        messages.append(ChatMessage(role=MessageRole.TOOL_RESPONSE, content=[{"type": "text", "text": digest}]))
+        return messages
+
+
+class SummarizeMemoryPolicy(MemoryPolicy):
+    """Render every step in full, and enable the agent's summarization of the oldest steps.
+
+    Args:
+        memory_token_limit (`int`, *optional*): Overrides the agent's `memory_token_limit`.
+        summary_model (`Model`, *optional*): Overrides the agent's `summary_model`.
+    """
+
+    def __init__(self, memory_token_limit: int | None = None, summary_model=None):
+        self.memory_token_limit = memory_token_limit
+        self.summary_model = summary_model
+
+
 class CallbackRegistry:
     """Registry for callbacks that are called at each step of the agent's execution.
 
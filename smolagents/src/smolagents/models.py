@@ -11,22 +11,37 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import contextvars
 import json
 import logging
 import os
+import random
 import re
+import time
 import uuid
 import warnings
-from collections.abc import Generator
+from collections import deque
+from collections.abc import Callable, Generator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import closing
 from copy import deepcopy
 from dataclasses import asdict, dataclass
 from enum import Enum
-from threading import Thread
+from threading import Lock, Thread
+from types import SimpleNamespace
 from typing import TYPE_CHECKING, Any
 
 from .monitoring import TokenUsage
 from .tools import Tool
-from .utils import RateLimiter, _is_package_available, encode_image_base64, make_image_url, parse_json_blob
+from .utils import (
+    OperationCancelledError,
+    RateLimiter,
+    _is_package_available,
+    encode_image_base64,
+    get_cancellation_token,
+    make_image_url,
+    parse_json_blob,
+)
 
 
 if TYPE_CHECKING:
@@ -236,6 +251,80 @@ def agglomerate_stream_deltas(
     )
 
 
+class TokenEstimator:
+    """Fast local estimate of the number of input tokens of a list of messages.
+
+    Text is counted with a `tiktoken` encoding when the package is installed, otherwise with a bytes-per-token
+    ratio. The raw estimate is then multiplied by a correction factor calibrated, with an EWMA, against the input token
+    counts reported by the API, so that the estimate converges towards the tokenizer of the model actually in use.
+
+    Args:
+        encoding_name (`str`, default `"o200k_base"`): Name of the `tiktoken` encoding to use if available.
+        bytes_per_token (`float`, default `4.0`): Ratio used when `tiktoken` is not installed.
+        tokens_per_message (`int`, default `4`): Overhead of the chat template for each message.
+        tokens_per_image (`int`, default `1000`): Estimated cost of an image.
+        ewma_alpha (`float`, default `0.3`): Smoothing factor of the calibration.
+    """
+
+    def __init__(
+        self,
+        encoding_name: str = "o200k_base",
+        bytes_per_token: float = 4.0,
+        tokens_per_message: int = 4,
+        tokens_per_image: int = 1000,
+        ewma_alpha: float = 0.3,
+    ):
+        self.bytes_per_token = bytes_per_token
+        self.tokens_per_message = tokens_per_message
+        self.tokens_per_image = tokens_per_image
+        self.ewma_alpha = ewma_alpha
+        self.correction = 1.0
+        self._encoding = None
+        if _is_package_available("tiktoken"):
+            try:
+                import tiktoken
+
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:  # The encoding files may not be downloadable
+                logger.warning(f"Could not load tiktoken encoding {encoding_name}, falling back to byte ratio: {e}")
+
+    def count_text(self, text: str) -> float:
+        """Return the uncalibrated number of tokens of a text."""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text.encode("utf-8")) / self.bytes_per_token
+
+    def estimate(self, messages: list[ChatMessage]) -> int:
+        """Return the calibrated number of input tokens of a list of messages."""
+        total = 0.0
+        for message in messages:
+            total += self.tokens_per_message
+            if isinstance(message.content, str):
+                total += self.count_text(message.content)
+            elif isinstance(message.content, list):
+                for element in message.content:
+                    if element.get("type") == "text":
+                        total += self.count_text(element.get("text", ""))
+                    elif element.get("type") in ("image", "image_url"):
+                        total += self.tokens_per_image
+            if message.tool_calls:
+                total += self.count_text(str([asdict(tool_call) for tool_call in message.tool_calls]))
+        return int(total * self.correction)
+
+    def estimate_text(self, text: str) -> int:
+        """Return the calibrated number of tokens of a text, e.g. of a model output whose usage was not reported."""
+        return int(self.count_text(text) * self.correction)
+
+    def calibrate(self, estimated_tokens: int, actual_tokens: int):
+        """Update the correction factor from the actual input token count reported by the API for an estimate."""
+        if estimated_tokens <= 0 or actual_tokens <= 0:
+            return
+        raw_estimate = estimated_tokens / self.correction
+        self.correction += self.ewma_alpha * (actual_tokens / raw_estimate - self.correction)
+
+
 tool_role_conversions = {
     MessageRole.TOOL_CALL: MessageRole.ASSISTANT,
     MessageRole.TOOL_RESPONSE: MessageRole.USER,
@@ -1029,6 +1118,95 @@ class TransformersModel(Model):
         self._last_output_token_count = count_generated_tokens
 
 
+class RequestHedgingPolicy:
+    """Adaptive request hedging policy for API models.
+
+    When a request has not completed after an adaptive delay (by default the observed p95 latency) from when it
+    started, not counting the time it waited for a worker, a duplicate request is fired and whichever finishes first
+    is returned. The losing request is cancelled if it has not started
+    yet, otherwise its result is discarded once it completes: its own per-request timeout bounds how long it can run.
+
+    A single policy can be shared between several models, for instance all the models of an agent team, so that
+    latency statistics and hedge counters are aggregated.
+
+    Parameters:
+        quantile (`float`, default `0.95`):
+            Latency quantile used as hedging delay.
+        min_delay (`float`, default `2.0`):
+            Lower bound for the hedging delay, in seconds.
+        max_delay (`float`, default `120.0`):
+            Upper bound for the hedging delay, in seconds.
+        initial_delay (`float`, default `30.0`):
+            Hedging delay used until `min_samples` latencies have been observed.
+        min_samples (`int`, default `10`):
+            Number of observed latencies required before using the latency quantile.
+        window_size (`int`, default `200`):
+            Number of most recent latencies kept to compute the quantile.
+        max_workers (`int`, default `8`):
+            Maximum number of concurrent requests issued through this policy.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        min_delay: float = 2.0,
+        max_delay: float = 120.0,
+        initial_delay: float = 30.0,
+        min_samples: int = 10,
+        window_size: int = 200,
+        max_workers: int = 8,
+    ):
+        if not 0 < quantile < 1:
+            raise ValueError(f"quantile should be between 0 and 1, got {quantile}")
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self._latencies: deque[float] = deque(maxlen=window_size)
+        self._lock = Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self.stats = {
+            "requests": 0,
+            "hedged_requests": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+        }
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedged-request")
+            return self._executor
+
+    def hedge_delay(self) -> float:
+        """Return the delay after which a duplicate request should be fired."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                delay = self.initial_delay
+            else:
+                latencies = sorted(self._latencies)
+                delay = latencies[min(len(latencies) - 1, int(self.quantile * len(latencies)))]
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def record_latency(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def record(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def shutdown(self):
+        """Release the worker threads. Pending hedged requests are not awaited."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
 class ApiModel(Model):
     """
     Base class for API-based language models.
@@ -1046,6 +1224,12 @@ class ApiModel(Model):
             Pre-configured API client instance. If not provided, a default client will be created. Defaults to None.
         requests_per_minute (`float`, **optional**):
             Rate limit in requests per minute.
+        hedging_policy ([`RequestHedgingPolicy`], **optional**):
+            If provided, slow requests are duplicated after an adaptive delay and the fastest response is used.
+        deadline (`float`, **optional**):
+            Absolute deadline (as returned by `time.time()`) for all the requests of this model, e.g. the end of the
+            task budget. Each request timeout is capped by the remaining time. Can also be passed per call with the
+            `deadline` keyword argument.
         **kwargs: Additional keyword arguments to pass to the parent class.
     """
 
@@ -1055,12 +1239,16 @@ class ApiModel(Model):
         custom_role_conversions: dict[str, str] | None = None,
         client: Any | None = None,
         requests_per_minute: float | None = None,
+        hedging_policy: RequestHedgingPolicy | None = None,
+        deadline: float | None = None,
         **kwargs,
     ):
         super().__init__(model_id=model_id, **kwargs)
         self.custom_role_conversions = custom_role_conversions or {}
         self.client = client or self.create_client()
         self.rate_limiter = RateLimiter(requests_per_minute)
+        self.hedging_policy = hedging_policy
+        self.deadline = deadline
 
     def create_client(self):
         """Create the API client for the specific service."""
@@ -1070,6 +1258,129 @@ class ApiModel(Model):
         """Apply rate limiting before making API calls."""
         self.rate_limiter.throttle()
 
+    def set_deadline(self, deadline: float | None):
+        """Set the absolute deadline (as returned by `time.time()`) applied to all subsequent requests."""
+        self.deadline = deadline
+
+    def _pop_deadline(self, kwargs: dict[str, Any]) -> float | None:
+        """Pop the per-call `deadline` from generation kwargs, bounded by the model deadline and the deadline of the
+        active cancellation token."""
+        cancellation_token = get_cancellation_token()
+        deadlines = [
+            deadline
+            for deadline in (
+                kwargs.pop("deadline", None),
+                self.deadline,
+                cancellation_token.deadline if cancellation_token is not None else None,
+            )
+            if deadline is not None
+        ]
+        return min(deadlines) if deadlines else None
+
+    def _request_timeout(self, deadline: float | None, default_timeout: float | None = None) -> float | None:
+        """Compute the timeout of a request from the remaining time before `deadline`."""
+        if deadline is None:
+            return default_timeout
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            if self.hedging_policy is not None:
+                self.hedging_policy.record("deadline_exceeded")
+            raise TimeoutError(f"Deadline exceeded before calling model {self.model_id}.")
+        return remaining if default_timeout is None else min(remaining, default_timeout)
+
+    @staticmethod
+    def _timeout_kwargs(timeout: float | None, default_timeout: float | None) -> dict[str, float]:
+        """Return the `timeout` request kwarg, omitted when neither a deadline nor a default timeout applies."""
+        if timeout is None:
+            return {} if default_timeout is None else {"timeout": default_timeout}
+        return {"timeout": timeout if default_timeout is None else min(timeout, default_timeout)}
+
+    def _call_with_hedging(self, request_fn: Callable[[float | None], Any], deadline: float | None = None) -> Any:
+        """Run `request_fn(timeout)`, hedging it with a duplicate request if it is slower than the hedging delay.
+
+        Args:
+            request_fn (`Callable[[float | None], Any]`): Function issuing one API request with the given timeout.
+            deadline (`float`, *optional*): Absolute deadline for the call.
+        """
+        cancellation_token = get_cancellation_token()
+        policy = self.hedging_policy
+        if policy is None:
+            self._apply_rate_limit()
+            if cancellation_token is not None:
+                cancellation_token.raise_if_cancelled()
+            # The request timeout is bounded by the deadline of the cancellation token, see `_pop_deadline`
+            return request_fn(self._request_timeout(deadline))
+
+        def timed_request(started: Future | None = None) -> Any:
+            start_time = time.time()
+            if started is not None:
+                started.set_result(start_time)
+            timeout = self._request_timeout(deadline)
+            result = request_fn(timeout)
+            policy.record_latency(time.time() - start_time)
+            return result
+
+        policy.record("requests")
+        self._apply_rate_limit()
+        if cancellation_token is not None:
+            cancellation_token.raise_if_cancelled()
+        # Requests may wait for a worker of the shared pool: the hedging delay only runs once the primary has started
+        primary_started = Future()
+        primary = policy.executor.submit(contextvars.copy_context().run, timed_request, primary_started)
+        # Completed when the run is cancelled, to stop waiting for the requests
+        cancelled = Future()
+        unregister = (
+            cancellation_token.on_cancel(lambda: cancelled.done() or cancelled.set_result(None))
+            if cancellation_token is not None
+            else None
+        )
+        try:
+            hedge_delay = policy.hedge_delay()
+            timeout = None if deadline is None else max(deadline - time.time(), 0)
+            done, _ = wait([primary, primary_started, cancelled], timeout=timeout, return_when=FIRST_COMPLETED)
+            if primary_started.done() and not cancelled.done():
+                timeout = max(primary_started.result() + hedge_delay - time.time(), 0)
+                if deadline is not None:
+                    timeout = min(timeout, max(deadline - time.time(), 0))
+                done, _ = wait([primary, cancelled], timeout=timeout, return_when=FIRST_COMPLETED)
+            if primary in done:
+                return primary.result()
+
+            pending = {primary}
+            if deadline is None or deadline > time.time():
+                self._apply_rate_limit()
+                pending.add(policy.executor.submit(contextvars.copy_context().run, timed_request))
+                policy.record("hedged_requests")
+                logger.info(f"Request to {self.model_id} is slower than {hedge_delay:.1f}s: firing a hedged request.")
+
+            first_error = None
+            while pending and not cancelled.done():
+                timeout = None if deadline is None else max(deadline - time.time(), 0)
+                done, pending = wait(pending | {cancelled}, timeout=timeout, return_when=FIRST_COMPLETED)
+                pending.discard(cancelled)
+                done.discard(cancelled)
+                if not done and not cancelled.done():
+                    policy.record("deadline_exceeded")
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        for loser in pending:
+                            loser.cancel()
+                        if future is not primary:
+                            policy.record("hedge_wins")
+                        return future.result()
+                    first_error = first_error or future.exception()
+            for loser in pending:
+                loser.cancel()
+            if cancelled.done():
+                raise OperationCancelledError(cancellation_token.reason)
+            if first_error is not None:
+                raise first_error
+            raise TimeoutError(f"Deadline exceeded while waiting for model {self.model_id}.")
+        finally:
+            if unregister is not None:
+                unregister()
+
 
 class LiteLLMModel(ApiModel):
     """Model to use [LiteLLM Python SDK](https://docs.litellm.ai/docs/#litellm-python-sdk) to access hundreds of LLMs.
@@ -1140,6 +1451,7 @@ class LiteLLMModel(ApiModel):
         tools_to_call_from: list[Tool] | None = None,
         **kwargs,
     ) -> ChatMessage:
+        deadline = self._pop_deadline(kwargs)
         completion_kwargs = self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
@@ -1152,8 +1464,12 @@ class LiteLLMModel(ApiModel):
             custom_role_conversions=self.custom_role_conversions,
             **kwargs,
         )
-        self._apply_rate_limit()
-        response = self.client.completion(**completion_kwargs)
+        default_timeout = completion_kwargs.pop("timeout", None)
+
+        def request(timeout: float | None):
+            return self.client.completion(**completion_kwargs, **self._timeout_kwargs(timeout, default_timeout))
+
+        response = self._call_with_hedging(request, deadline)
 
         self._last_input_token_count = response.usage.prompt_tokens
         self._last_output_token_count = response.usage.completion_tokens
@@ -1174,6 +1490,7 @@ class LiteLLMModel(ApiModel):
         tools_to_call_from: list[Tool] | None = None,
         **kwargs,
     ) -> Generator[ChatMessageStreamDelta]:
+        deadline = self._pop_deadline(kwargs)
         completion_kwargs = self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
@@ -1186,6 +1503,9 @@ class LiteLLMModel(ApiModel):
             convert_images_to_image_urls=True,
             **kwargs,
         )
+        completion_kwargs.update(
+            self._timeout_kwargs(self._request_timeout(deadline), completion_kwargs.pop("timeout", None))
+        )
         self._apply_rate_limit()
         for event in self.client.completion(**completion_kwargs, stream=True, stream_options={"include_usage": True}):
             if getattr(event, "usage", None):
@@ -1569,6 +1889,7 @@ class OpenAIServerModel(ApiModel):
         tools_to_call_from: list[Tool] | None = None,
         **kwargs,
     ) -> Generator[ChatMessageStreamDelta]:
+        deadline = self._pop_deadline(kwargs)
         completion_kwargs = self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
@@ -1579,45 +1900,58 @@ class OpenAIServerModel(ApiModel):
             convert_images_to_image_urls=True,
             **kwargs,
         )
+        completion_kwargs.update(
+            self._timeout_kwargs(self._request_timeout(deadline), completion_kwargs.pop("timeout", None))
+        )
         self._apply_rate_limit()
         request_id = "smolagent-"+str(uuid.uuid4())  # Generate a UUID if no request_id is provided
         # Add the request_id to headers
         completion_kwargs['extra_headers'] = {
             'x-ms-client-request-id': request_id,
         }        
-        for event in self.client.chat.completions.create(
+        response = self.client.chat.completions.create(
             **completion_kwargs, stream=True, stream_options={"include_usage": True}
-        ):
-            if event.usage:
-                self._last_input_token_count = event.usage.prompt_tokens
-                self._last_output_token_count = event.usage.completion_tokens
-                yield ChatMessageStreamDelta(
-                    content="",
-                    token_usage=TokenUsage(
-                        input_tokens=event.usage.prompt_tokens,
-                        output_tokens=event.usage.completion_tokens,
-                    ),
-                )
-            if event.choices:
-                choice = event.choices[0]
-                if choice.delta:
-                    yield ChatMessageStreamDelta(
-                        content=choice.delta.content,
-                        tool_calls=[
-                            ChatMessageToolCallStreamDelta(
-                                index=delta.index,
-                                id=delta.id,
-                                type=delta.type,
-                                function=delta.function,
+        )
+        # Closing the response aborts the generation server-side when the consumer stops iterating early, or when the
+        # run is cancelled while the server is slow to send the next event
+        cancellation_token = get_cancellation_token()
+        unregister = cancellation_token.on_cancel(response.close) if cancellation_token is not None else None
+        try:
+            with closing(response):
+                for event in response:
+                    if event.usage:
+                        self._last_input_token_count = event.usage.prompt_tokens
+                        self._last_output_token_count = event.usage.completion_tokens
+                        yield ChatMessageStreamDelta(
+                            content="",
+                            token_usage=TokenUsage(
+                                input_tokens=event.usage.prompt_tokens,
+                                output_tokens=event.usage.completion_tokens,
+                            ),
+                        )
+                    if event.choices:
+                        choice = event.choices[0]
+                        if choice.delta:
+                            yield ChatMessageStreamDelta(
+                                content=choice.delta.content,
+                                tool_calls=[
+                                    ChatMessageToolCallStreamDelta(
+                                        index=delta.index,
+                                        id=delta.id,
+                                        type=delta.type,
+                                        function=delta.function,
+                                    )
+                                    for delta in choice.delta.tool_calls
+                                ]
+                                if choice.delta.tool_calls
+                                else None,
                             )
-                            for delta in choice.delta.tool_calls
-                        ]
-                        if choice.delta.tool_calls
-                        else None,
-                    )
-                else:
-                    if not getattr(choice, "finish_reason", None):
-                        raise ValueError(f"No content or tool calls in event: {event}")
+                        else:
+                            if not getattr(choice, "finish_reason", None):
+                                raise ValueError(f"No content or tool calls in event: {event}")
+        finally:
+            if unregister is not None:
+                unregister()
 
     def generate(
         self,
@@ -1627,6 +1961,7 @@ class OpenAIServerModel(ApiModel):
         tools_to_call_from: list[Tool] | None = None,
         **kwargs,
     ) -> ChatMessage:
+        deadline = self._pop_deadline(kwargs)
         completion_kwargs = self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
@@ -1637,13 +1972,20 @@ class OpenAIServerModel(ApiModel):
             convert_images_to_image_urls=True,
             **kwargs,
         )
-        self._apply_rate_limit()
-        request_id = "smolagent-"+str(uuid.uuid4())  # Generate a UUID if no request_id is provided
-        # Add the request_id to headers
-        completion_kwargs['extra_headers'] = {
-            'x-ms-client-request-id': request_id,
-        }        
-        response = self.client.chat.completions.create(**completion_kwargs)
+        default_timeout = completion_kwargs.pop("timeout", None)
+
+        def request(timeout: float | None):
+            request_id = "smolagent-"+str(uuid.uuid4())  # Generate a UUID if no request_id is provided
+            # Add the request_id to headers
+            extra_headers = {
+                'x-ms-client-request-id': request_id,
+            }
+            response = self.client.chat.completions.create(
+                **completion_kwargs, **self._timeout_kwargs(timeout, default_timeout), extra_headers=extra_headers
+            )
+            return response, request_id
+
+        response, request_id = self._call_with_hedging(request, deadline)
 
         # Reported that `response.usage` can be None in some cases when using OpenRouter: see GH-1401
         self._last_input_token_count = getattr(response.usage, "prompt_tokens", 0)
@@ -1663,6 +2005,278 @@ class OpenAIServerModel(ApiModel):
 OpenAIModel = OpenAIServerModel
 
 
+@dataclass
+class EndpointHealth:
+    """Live health statistics of an OpenAI-compatible endpoint, used by [`OpenAIServerRouterModel`]."""
+
+    name: str
+    # Full latency of non-streamed requests, and time to the first event of streamed ones
+    latency_ewma: float | None = None
+    first_event_latency_ewma: float | None = None
+    error_ewma: float = 0.0
+    consecutive_failures: int = 0
+    circuit_open_until: float = 0.0
+    trial_in_flight: bool = False
+    requests: int = 0
+    failures: int = 0
+
+    @property
+    def circuit_open(self) -> bool:
+        return self.circuit_open_until > 0
+
+    def is_available(self, now: float) -> bool:
+        if not self.circuit_open:
+            return True
+        # Once the cooldown is over, the circuit is half-open: the endpoint gets a single trial request, until it
+        # succeeds and closes the circuit or fails and opens it again
+        return now >= self.circuit_open_until and not self.trial_in_flight
+
+    def latency(self, stream: bool) -> float | None:
+        return self.first_event_latency_ewma if stream else self.latency_ewma
+
+    def score(self, default_latency: float, stream: bool = False) -> float:
+        """Expected cost of a request, the lower the better."""
+        latency = self.latency(stream)
+        if latency is None:
+            latency = default_latency
+        return latency * (1.0 + 10.0 * self.error_ewma)
+
+
+class _OpenAIEndpointRouter:
+    """Client exposing `chat.completions.create` that dispatches each request to the healthiest endpoint."""
+
+    def __init__(
+        self,
+        endpoints: list[dict[str, Any]],
+        ewma_alpha: float,
+        failure_threshold: int,
+        cooldown: float,
+        max_attempts: int,
+    ):
+        try:
+            import openai
+        except ModuleNotFoundError as e:
+            raise ModuleNotFoundError(
+                "Please install 'openai' extra to use OpenAIServerRouterModel: `pip install 'smolagents[openai]'`"
+            ) from e
+
+        if not endpoints:
+            raise ValueError("OpenAIServerRouterModel requires at least one endpoint.")
+        self._connection_errors = (openai.APIConnectionError, TimeoutError, ConnectionError)
+        self.clients = {}
+        self.model_ids = {}
+        self.health = {}
+        for i, endpoint in enumerate(endpoints):
+            name = endpoint.get("name", endpoint.get("api_base") or f"endpoint-{i}")
+            client_kwargs = {
+                # Retries are handled by the router, on a different endpoint
+                "max_retries": 0,
+                **endpoint.get("client_kwargs", {}),
+                "api_key": endpoint.get("api_key"),
+                "base_url": endpoint.get("api_base"),
+            }
+            self.clients[name] = openai.OpenAI(**client_kwargs)
+            self.model_ids[name] = endpoint.get("model_id")
+            self.health[name] = EndpointHealth(name=name)
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts
+        self._lock = Lock()
+        self._random = random.Random()
+        self.chat = SimpleNamespace(completions=self)
+
+    def is_retryable(self, error: Exception) -> bool:
+        status_code = getattr(error, "status_code", None)
+        if status_code is not None:
+            return status_code == 429 or status_code >= 500
+        return isinstance(error, self._connection_errors)
+
+    def select_endpoint(self, exclude: set[str], stream: bool = False) -> str | None:
+        """Pick an endpoint with probability inversely proportional to its expected cost.
+
+        A request sent to an endpoint whose circuit is open is its trial request: no other request is sent to it until
+        the trial ends.
+        """
+        with self._lock:
+            now = time.time()
+            candidates = [h for name, h in self.health.items() if name not in exclude and h.is_available(now)]
+            if not candidates:
+                # All circuits are open: fall back to the endpoint whose circuit closes first
+                candidates = sorted(
+                    (h for name, h in self.health.items() if name not in exclude and not h.trial_in_flight),
+                    key=lambda h: h.circuit_open_until,
+                )[:1]
+            if not candidates:
+                return None
+            known_latencies = [h.latency(stream) for h in candidates if h.latency(stream) is not None]
+            default_latency = min(known_latencies) if known_latencies else 1.0
+            weights = [1.0 / max(h.score(default_latency, stream=stream), 1e-3) for h in candidates]
+            health = self._random.choices(candidates, weights=weights)[0]
+            if health.circuit_open:
+                health.trial_in_flight = True
+            return health.name
+
+    def record_success(self, name: str, latency: float, stream: bool = False):
+        """Record a request that succeeded after `latency` seconds, or received its first event if `stream` is set."""
+        with self._lock:
+            health = self.health[name]
+            health.requests += 1
+            health.consecutive_failures = 0
+            health.circuit_open_until = 0.0
+            health.trial_in_flight = False
+            health.error_ewma *= 1 - self.ewma_alpha
+            if stream:
+                health.first_event_latency_ewma = self._update_ewma(health.first_event_latency_ewma, latency)
+            else:
+                health.latency_ewma = self._update_ewma(health.latency_ewma, latency)
+
+    def _update_ewma(self, ewma: float | None, value: float) -> float:
+        return value if ewma is None else ewma + self.ewma_alpha * (value - ewma)
+
+    def end_trial(self, name: str):
+        """End the trial request of an endpoint that answered with an error that says nothing about its health."""
+        with self._lock:
+            self.health[name].trial_in_flight = False
+
+    def record_failure(self, name: str, error: Exception):
+        with self._lock:
+            health = self.health[name]
+            health.requests += 1
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.error_ewma += self.ewma_alpha * (1.0 - health.error_ewma)
+            health.trial_in_flight = False
+            if health.consecutive_failures >= self.failure_threshold:
+                health.circuit_open_until = time.time() + self.cooldown
+                logger.warning(f"Opening circuit breaker of endpoint {name} for {self.cooldown:.0f}s after: {error}")
+
+    def create(self, **kwargs):
+        tried = set()
+        last_error = None
+        stream = bool(kwargs.get("stream"))
+        for _ in range(self.max_attempts):
+            name = self.select_endpoint(exclude=tried, stream=stream)
+            if name is None:
+                break
+            tried.add(name)
+            request_kwargs = {**kwargs, "model": self.model_ids[name] or kwargs.get("model")}
+            start_time = time.time()
+            try:
+                response = self.clients[name].chat.completions.create(**request_kwargs)
+                if stream:
+                    # Streams can only be retried before the first event has been handed to the caller
+                    events = iter(response)
+                    first_event = next(events, None)
+                    self.record_success(name, time.time() - start_time, stream=True)
+                    return self._stream_events(response, first_event, events)
+            except BaseException as e:
+                if not isinstance(e, Exception) or not self.is_retryable(e):
+                    self.end_trial(name)
+                    raise
+                self.record_failure(name, e)
+                last_error = e
+                logger.info(f"Request to endpoint {name} failed ({e}), retrying on another endpoint.")
+                continue
+            self.record_success(name, time.time() - start_time)
+            return response
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("No endpoint available.")
+
+    @staticmethod
+    def _stream_events(response, first_event, events) -> Generator:
+        try:
+            if first_event is not None:
+                yield first_event
+            yield from events
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+
+
+class OpenAIServerRouterModel(OpenAIServerModel):
+    """Router over several OpenAI-compatible endpoints serving the same model.
+
+    Each request is sent to an endpoint chosen with a probability inversely proportional to its live latency EWMA,
+    penalized by its error EWMA. Latencies are tracked separately for streamed requests, up to their first event, and
+    for other requests, up to their full response. An endpoint failing `failure_threshold` times in a row with a 5xx,
+    429 or connection error has its circuit breaker opened for `cooldown` seconds; it then gets a single trial request,
+    which closes the circuit if it succeeds and opens it again if it fails. Failed requests are retried on a different
+    endpoint; streamed requests are only retried until their first event has been received.
+
+    Parameters:
+        model_id (`str`):
+            The model identifier to use on the servers, unless overridden per endpoint.
+        endpoints (`list[dict[str, Any]]`):
+            Endpoint configurations, with keys `api_base`, `api_key` and optionally `name`, `model_id` and
+            `client_kwargs` (passed to the `openai.OpenAI` client, whose own `max_retries` defaults to 0).
+        ewma_alpha (`float`, default `0.3`):
+            Smoothing factor of the latency and error EWMAs.
+        failure_threshold (`int`, default `3`):
+            Number of consecutive retryable failures opening the circuit breaker of an endpoint.
+        cooldown (`float`, default `30.0`):
+            Duration in seconds during which an endpoint with an open circuit is skipped.
+        max_attempts (`int`, *optional*):
+            Maximum number of endpoints tried per request. Defaults to the number of endpoints.
+        custom_role_conversions (`dict[str, str]`, *optional*):
+            Custom role conversion mapping to convert message roles in others.
+        flatten_messages_as_text (`bool`, default `False`):
+            Whether to flatten messages as text.
+        **kwargs:
+            Additional keyword arguments to pass to the OpenAI API.
+
+    Example:
+    ```python
+    >>> model = OpenAIServerRouterModel(
+    ...     model_id="gpt-4o",
+    ...     endpoints=[
+    ...         {"api_base": "https://gateway-a.example.com/v1", "api_key": os.getenv("GATEWAY_A_KEY")},
+    ...         {"api_base": "https://gateway-b.example.com/v1", "api_key": os.getenv("GATEWAY_B_KEY")},
+    ...     ],
+    ... )
+    ```
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        endpoints: list[dict[str, Any]],
+        ewma_alpha: float = 0.3,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_attempts: int | None = None,
+        custom_role_conversions: dict[str, str] | None = None,
+        flatten_messages_as_text: bool = False,
+        **kwargs,
+    ):
+        self.endpoints = endpoints
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts or len(endpoints)
+        super().__init__(
+            model_id=model_id,
+            custom_role_conversions=custom_role_conversions,
+            flatten_messages_as_text=flatten_messages_as_text,
+            **kwargs,
+        )
+
+    def create_client(self):
+        return _OpenAIEndpointRouter(
+            self.endpoints,
+            ewma_alpha=self.ewma_alpha,
+            failure_threshold=self.failure_threshold,
+            cooldown=self.cooldown,
+            max_attempts=self.max_attempts,
+        )
+
+    @property
+    def endpoint_health(self) -> dict[str, EndpointHealth]:
+        """Live health statistics of each endpoint."""
+        return self.client.health
+
+
 class AzureOpenAIServerModel(OpenAIServerModel):
     """This model connects to an Azure OpenAI deployment.
 
@@ -1919,15 +2533,18 @@ __all__ = [
     "MLXModel",
     "TransformersModel",
     "ApiModel",
+    "RequestHedgingPolicy",
     "InferenceClientModel",
     "LiteLLMModel",
     "LiteLLMRouterModel",
     "OpenAIServerModel",
     "OpenAIModel",
+    "OpenAIServerRouterModel",
     "VLLMModel",
     "AzureOpenAIServerModel",
     "AzureOpenAIModel",
     "AmazonBedrockServerModel",
     "AmazonBedrockModel",
     "ChatMessage",
+    "TokenEstimator",
 ]
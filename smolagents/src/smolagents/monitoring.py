@@ -15,11 +15,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import json
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from dataclasses import dataclass, field
 from enum import IntEnum
 from typing import Any, Callable
 import time
 from datetime import datetime
+from pathlib import Path
 
 from rich import box
 from rich.console import Console, Group
@@ -35,7 +40,7 @@ from rich.align import Align
 from smolagents.utils import escape_code_brackets
 
 
-__all__ = ["AgentLogger", "LogLevel", "Monitor", "TokenUsage", "Timing"]
+__all__ = ["AgentLogger", "LogLevel", "Monitor", "TokenUsage", "Timing", "Tracer", "get_active_tracer", "trace_span"]
 
 
 @dataclass
@@ -83,6 +88,116 @@ class Timing:
         return f"Timing(start_time={self.start_time}, end_time={self.end_time}, duration={self.duration})"
 
 
+class Tracer:
+    """
+    Records nested timing spans, e.g. model calls, code parsing and execution, tool and managed agent calls, and
+    exports them in the Chrome trace event format, which can be opened in Perfetto or `chrome://tracing`.
+
+    A tracer records the spans of the code running in its `activate` block, including in threads started with
+    `contextvars.copy_context()`. Spans nest by time on each thread, so calls across the agent hierarchy nest too.
+
+    Example:
+        ```py
+        tracer = Tracer()
+        with tracer.activate():
+            agent.run(task)
+        tracer.export("trace.json")
+        ```
+    """
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self._origin = time.time()
+        self._pid = os.getpid()
+        self._thread_ids: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Make this tracer record the spans of the code run in the block."""
+        token = _current_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _current_tracer.reset(token)
+
+    def _timestamp(self, wall_time: float) -> float:
+        return (wall_time - self._origin) * 1e6
+
+    def _thread_id(self) -> int:
+        ident = threading.get_ident()
+        with self._lock:
+            if ident not in self._thread_ids:
+                self._thread_ids[ident] = len(self._thread_ids) + 1
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": self._pid,
+                        "tid": self._thread_ids[ident],
+                        "args": {"name": threading.current_thread().name},
+                    }
+                )
+            return self._thread_ids[ident]
+
+    def add_span(self, name: str, category: str, start: float, end: float, **args):
+        """Record a span between two `time.time()` times."""
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self._timestamp(start),
+            "dur": (end - start) * 1e6,
+            "pid": self._pid,
+            "tid": self._thread_id(),
+        }
+        if args:
+            event["args"] = {key: str(value) for key, value in args.items()}
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        """Record the time spent in the block as a span."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, category, start, time.time(), **args)
+
+    def summary(self) -> dict[str, float]:
+        """Total seconds spent in spans of each category. Nested spans are counted in each of their categories."""
+        totals: dict[str, float] = {}
+        with self._lock:
+            for event in self.events:
+                if event["ph"] == "X":
+                    totals[event["cat"]] = totals.get(event["cat"], 0.0) + event["dur"] / 1e6
+        return {category: round(seconds, 3) for category, seconds in sorted(totals.items())}
+
+    def export(self, path: str | Path):
+        """Write the spans to a Chrome trace event JSON file."""
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+_current_tracer: ContextVar[Tracer | None] = ContextVar("smolagents_tracer", default=None)
+
+
+def trace_span(name: str, category: str, **args):
+    """Context manager recording a span with the active [`Tracer`], if any. Does nothing otherwise."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, category, **args)
+
+
+def get_active_tracer() -> Tracer | None:
+    """Return the [`Tracer`] recording the current code, if any."""
+    return _current_tracer.get()
+
+
 class Monitor:
     def __init__(self, tracked_model, logger):
         self.step_durations = []
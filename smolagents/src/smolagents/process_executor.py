@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from collections.abc import Callable
+from importlib import import_module
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+from .artifacts import ArtifactStore
+from .local_python_executor import (
+    CodeOutput,
+    InterpreterError,
+    LocalPythonExecutor,
+    PrintContainer,
+    PythonExecutor,
+    _configure_matplotlib_backend,
+)
+from .tools import Tool
+from .utils import OperationCancelledError, get_cancellation_token
+
+
+__all__ = ["ExecutorProcessPool", "ProcessExecutor"]
+
+logger = logging.getLogger(__name__)
+
+# How often the parent checks the time limit, the cancellation token and the child's liveness while waiting
+PROCESS_POLL_INTERVAL = 0.1
+SHUTDOWN_TIMEOUT = 5
+# Modules that are slow to import and commonly used for data analysis
+DEFAULT_PRELOAD_MODULES = ("numpy", "pandas", "matplotlib.pyplot", "scipy", "Bio.PDB")
+
+
+class _ToolProxy:
+    """Stands for a tool or a managed agent in the child process: calls are sent to the parent, which runs them."""
+
+    def __init__(self, name: str, connection: Connection, lock: threading.Lock):
+        self.name = name
+        self._connection = connection
+        self._lock = lock
+
+    def __call__(self, *args, **kwargs):
+        # Calls from threads started by `submit` share the pipe, so they are sent one at a time
+        with self._lock:
+            self._connection.send(("call", self.name, args, kwargs))
+            succeeded, value = self._connection.recv()
+        if succeeded:
+            return value
+        raise value
+
+
+def _picklable(value: Any) -> Any:
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
+
+
+def _picklable_exception(error: BaseException) -> BaseException:
+    try:
+        return pickle.loads(pickle.dumps(error))
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+def _preload(modules: tuple[str, ...]):
+    if any(module == "matplotlib" or module.startswith("matplotlib.") for module in modules):
+        _configure_matplotlib_backend()
+    for module in modules:
+        try:
+            import_module(module)
+        except ImportError as e:
+            logger.debug(f"Could not preload module {module}: {e}")
+
+
+def _serve(connection: Connection, preload_modules: tuple[str, ...] = ()):
+    """
+    Main loop of the child process: imports `preload_modules`, waits for the settings of the executor it is
+    assigned to, then runs the code actions sent by the parent in a `LocalPythonExecutor`.
+    """
+    _preload(preload_modules)
+    try:
+        _, authorized_imports, memory_limit, artifact_directory, cwd, executor_kwargs = connection.recv()
+    except EOFError:
+        return
+    # Pool processes are started before the executor they are assigned to knows its working directory
+    os.chdir(cwd)
+    if memory_limit is not None:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    if artifact_directory is not None:
+        # The child writes its artifacts where the parent can read them
+        executor_kwargs = {**executor_kwargs, "artifact_store": ArtifactStore(directory=artifact_directory)}
+    executor = LocalPythonExecutor(authorized_imports, **executor_kwargs)
+    executor.send_tools({})
+    lock = threading.Lock()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        kind = message[0]
+        if kind == "execute":
+            try:
+                code_output = executor(message[1])
+                reply = (
+                    "result",
+                    _picklable(code_output.output),
+                    code_output.logs,
+                    code_output.is_final_answer,
+                    _executor_stats(executor),
+                )
+            except MemoryError:
+                # The process may not recover from it: report it and let the parent start a new one
+                connection.send(("error", "MemoryError: the code exceeded the memory limit.", "", True, None))
+                return
+            except Exception as e:
+                reply = ("error", str(e), str(executor.state.get("_print_outputs", "")), False, _executor_stats(executor))
+            # Calls submitted but not gathered by the code read their results from the pipe: once the parent has the
+            # reply it stops answering them, and they could read its next message instead
+            executor.wait_for_submitted_calls()
+            connection.send(reply)
+        elif kind == "send_tools":
+            executor.send_tools({name: _ToolProxy(name, connection, lock) for name in message[1]})
+        elif kind == "send_variables":
+            executor.send_variables(message[1])
+        elif kind == "shutdown":
+            executor.cleanup()
+            return
+
+
+def _executor_stats(executor: LocalPythonExecutor) -> dict[str, Any]:
+    """Statistics of the executor of the child process, sent back with the outcome of each code action."""
+    return {"memory_report": executor.memory_report(), "rolled_back_steps": executor.rolled_back_steps}
+
+
+def _start_process(context, preload_modules: tuple[str, ...] = ()) -> tuple[BaseProcess, Connection]:
+    parent_connection, child_connection = context.Pipe()
+    process = context.Process(
+        target=_serve, args=(child_connection, preload_modules), daemon=True, name="smolagents-executor"
+    )
+    process.start()
+    child_connection.close()
+    return process, parent_connection
+
+
+class ExecutorProcessPool:
+    """
+    Pool of warm child processes for [`ProcessExecutor`], with heavy modules already imported.
+
+    The pool keeps `size` idle processes that have imported `preload_modules`, so that the first code action importing
+    them in a step does not pay their import time. A process is handed to an executor when it starts, and never
+    returns to the pool: a new one is started in its place. With the `"forkserver"` start method, the modules are also
+    imported once in the fork server, so that new processes start warm instead of importing them again. The fork
+    server and its preloaded modules are shared by the whole program.
+
+    Args:
+        size (`int`, default `2`): Number of idle processes kept ready.
+        preload_modules (`tuple[str, ...]`, *optional*): Modules imported by the processes when they start. Modules
+            that are not installed are skipped. Defaults to `DEFAULT_PRELOAD_MODULES`.
+        start_method (`str`, *optional*): Start method of the processes, see `multiprocessing.get_context`. Defaults
+            to `"forkserver"` where available, else `"spawn"`.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        preload_modules: tuple[str, ...] = DEFAULT_PRELOAD_MODULES,
+        start_method: str | None = None,
+    ):
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.size = size
+        self.preload_modules = tuple(preload_modules)
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            self._context.set_forkserver_preload([__name__, *self.preload_modules])
+        self._idle: list[tuple[BaseProcess, Connection]] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        with self._lock:
+            self._fill()
+
+    def _start_process(self) -> tuple[BaseProcess, Connection]:
+        return _start_process(self._context, self.preload_modules)
+
+    def _fill(self):
+        while len(self._idle) < self.size:
+            self._idle.append(self._start_process())
+
+    def acquire(self) -> tuple[BaseProcess, Connection]:
+        """Take a warm process out of the pool, or start a new one if none is left, and start its replacement."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The executor process pool is shut down.")
+            while self._idle:
+                process, connection = self._idle.pop(0)
+                if process.is_alive():
+                    break
+                connection.close()
+            else:
+                process, connection = self._start_process()
+            self._fill()
+        return process, connection
+
+    def shutdown(self):
+        """Stop the idle processes. Processes handed to executors are stopped by the executors."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for process, connection in idle:
+            connection.close()
+            process.join(SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+class ProcessExecutor(PythonExecutor):
+    """
+    Executor of Python code in a persistent child process, with a time limit per code action and a memory limit.
+
+    The code runs in a [`LocalPythonExecutor`] in a child process, so that its variables persist between code actions.
+    Tools and managed agents stay in the parent process: calls from the code are sent back to the parent, which runs
+    them and sends back the result, so their arguments and results must be picklable. Calls made concurrently with
+    `submit` run one at a time, and a code action only returns once the calls it submitted are done, even if it did not
+    gather them.
+
+    If a code action exceeds the time limit or the memory limit, or the run is cancelled, the child process is killed
+    and a new one is started on the next code action: the variables sent with `send_variables` are sent again, but
+    the ones defined by earlier code actions are lost.
+
+    The child process reports the memory accounting of its variables and its count of rolled back code actions with the
+    outcome of each code action, which `memory_report` and `rolled_back_steps` return.
+
+    Args:
+        additional_authorized_imports (`list[str]`):
+            Additional authorized imports for the executor.
+        max_print_outputs_length (`int`, *optional*):
+            Maximum length of the print outputs.
+        timeout (`float`, *optional*, default `300`):
+            Time limit of a code action in seconds, not counting the time spent in tool and managed agent calls.
+            `None` disables it.
+        memory_limit (`int`, *optional*):
+            Limit of the address space of the child process in bytes, enforced with `RLIMIT_AS` on Unix systems.
+        spill_large_outputs (`bool`, default `True`):
+            Whether to store print outputs longer than `max_print_outputs_length` in an artifact store instead of
+            truncating them.
+        start_method (`str`, default `"spawn"`):
+            Start method of the child process, see `multiprocessing.get_context`. Ignored if `pool` is set.
+        pool ([`ExecutorProcessPool`], *optional*):
+            Pool of warm processes to take the child process from, e.g. shared by the agents of a program.
+        cwd (`str`, *optional*):
+            Working directory of the child process. Defaults to the working directory of the parent when the child
+            process starts, which is racy if threads of the parent change directory: pass it explicitly then.
+        artifact_parent_directory (`str`, *optional*):
+            Directory in which the artifact store creates its temporary directory, e.g. the workspace of a task.
+            Defaults to the system's temporary directory.
+        **executor_kwargs:
+            Additional arguments of the `LocalPythonExecutor` of the child process, e.g. `compiled=True`.
+    """
+
+    def __init__(
+        self,
+        additional_authorized_imports: list[str],
+        max_print_outputs_length: int | None = None,
+        timeout: float | None = 300,
+        memory_limit: int | None = None,
+        spill_large_outputs: bool = True,
+        start_method: str = "spawn",
+        pool: "ExecutorProcessPool | None" = None,
+        cwd: str | None = None,
+        artifact_parent_directory: str | None = None,
+        **executor_kwargs,
+    ):
+        self.additional_authorized_imports = additional_authorized_imports
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.artifact_store = ArtifactStore(parent_directory=artifact_parent_directory) if spill_large_outputs else None
+        self._owns_artifact_store = True
+        self.executor_kwargs = {
+            "max_print_outputs_length": max_print_outputs_length,
+            "spill_large_outputs": spill_large_outputs,
+            **executor_kwargs,
+        }
+        self.pool = pool
+        self.cwd = cwd
+        self._context = multiprocessing.get_context(start_method)
+        self._process: BaseProcess | None = None
+        self._connection: Connection | None = None
+        self._lock = threading.Lock()
+        self.tools: dict[str, Callable] = {}
+        self.variables: dict[str, Any] = {}
+        # Only holds the print outputs of the last code action, so that agents can report them when it fails
+        self.state: dict[str, Any] = {"_print_outputs": PrintContainer()}
+        self._memory_report: dict[str, Any] | None = None
+        # Code actions whose changes to the variables were rolled back, over all the processes started so far
+        self.rolled_back_steps = 0
+        self._rolled_back_steps_offset = 0
+
+    def _start_process(self):
+        if self.pool is not None:
+            self._process, self._connection = self.pool.acquire()
+        else:
+            self._process, self._connection = _start_process(self._context)
+        # The count of a new process starts from zero
+        self._rolled_back_steps_offset = self.rolled_back_steps
+        artifact_directory = str(self.artifact_store.directory) if self.artifact_store is not None else None
+        cwd = self.cwd if self.cwd is not None else os.getcwd()
+        self._connection.send(
+            ("init", self.additional_authorized_imports, self.memory_limit, artifact_directory, cwd, self.executor_kwargs)
+        )
+        self._connection.send(("send_tools", list(self.tools)))
+        if self.variables:
+            self._connection.send(("send_variables", self.variables))
+
+    def _stop_process(self, kill: bool = False):
+        if self._process is None:
+            return
+        if kill:
+            self._process.kill()
+        else:
+            try:
+                self._connection.send(("shutdown",))
+            except (BrokenPipeError, OSError):
+                pass
+            self._process.join(SHUTDOWN_TIMEOUT)
+            if self._process.is_alive():
+                self._process.kill()
+        self._process.join()
+        self._connection.close()
+        self._process, self._connection = None, None
+
+    def _call_tool(self, name: str, args: tuple, kwargs: dict):
+        try:
+            result = (True, _picklable(self.tools[name](*args, **kwargs)))
+        except Exception as e:
+            result = (False, _picklable_exception(e))
+        self._connection.send(result)
+
+    def __call__(self, code_action: str) -> CodeOutput:
+        with self._lock:
+            if self._process is None:
+                self._start_process()
+            self.state["_print_outputs"] = PrintContainer()
+            self._connection.send(("execute", code_action))
+            cancellation_token = get_cancellation_token()
+            # Time spent in the code itself, excluding tool calls run by the parent
+            execution_time = 0.0
+            while True:
+                wait = PROCESS_POLL_INTERVAL
+                if self.timeout is not None:
+                    wait = min(wait, max(self.timeout - execution_time, 0.0))
+                start_time = time.monotonic()
+                ready = self._connection.poll(wait)
+                execution_time += time.monotonic() - start_time
+                if ready:
+                    try:
+                        message = self._connection.recv()
+                    except EOFError:
+                        message = None
+                    if message is None:
+                        exit_code = self._process.exitcode
+                        self._stop_process(kill=True)
+                        raise InterpreterError(
+                            f"The Python process running the code died (exit code {exit_code}), for instance because "
+                            "it exceeded its memory limit. It was restarted: variables defined by earlier code are lost."
+                        )
+                    if message[0] == "call":
+                        self._call_tool(*message[1:])
+                    elif message[0] == "result":
+                        _, output, logs, is_final_answer, stats = message
+                        self._update_stats(stats)
+                        self.state["_print_outputs"].value = logs
+                        return CodeOutput(output=output, logs=logs, is_final_answer=is_final_answer)
+                    else:
+                        _, error, logs, restart, stats = message
+                        self._update_stats(stats)
+                        self.state["_print_outputs"].value = logs
+                        if restart:
+                            self._stop_process(kill=True)
+                            error += " The Python process was restarted: variables defined by earlier code are lost."
+                        raise InterpreterError(error)
+                elif not self._process.is_alive():
+                    exit_code = self._process.exitcode
+                    self._stop_process(kill=True)
+                    raise InterpreterError(
+                        f"The Python process running the code died (exit code {exit_code}), for instance because it "
+                        "exceeded its memory limit. It was restarted: variables defined by earlier code are lost."
+                    )
+                elif self.timeout is not None and execution_time >= self.timeout:
+                    self._stop_process(kill=True)
+                    raise InterpreterError(
+                        f"Code execution exceeded the time limit of {self.timeout} seconds. The Python process was "
+                        "restarted: variables defined by earlier code are lost."
+                    )
+                elif cancellation_token is not None and cancellation_token.cancelled:
+                    self._stop_process(kill=True)
+                    raise OperationCancelledError(cancellation_token.reason)
+
+    def _update_stats(self, stats: dict[str, Any] | None):
+        if stats is None:
+            return
+        self._memory_report = stats["memory_report"]
+        self.rolled_back_steps = self._rolled_back_steps_offset + stats["rolled_back_steps"]
+
+    def memory_report(self) -> dict[str, Any] | None:
+        """Estimated memory used by the variables of the child process, as of the last code action it reported."""
+        return self._memory_report
+
+    def share_artifact_store(self, artifact_store: ArtifactStore):
+        """
+        Store outputs in the artifact store of another executor, which removes them when it is cleaned up. The child
+        process uses it from the next time it is started.
+        """
+        if self.artifact_store is not None and self._owns_artifact_store:
+            self.artifact_store.cleanup()
+        self.artifact_store = artifact_store
+        self._owns_artifact_store = False
+
+    def send_variables(self, variables: dict):
+        picklable_variables = {}
+        for name, value in variables.items():
+            try:
+                pickle.dumps(value)
+                picklable_variables[name] = value
+            except Exception as e:
+                logger.warning(f"Variable '{name}' cannot be sent to the Python process: {type(e).__name__}: {e}")
+        self.variables.update(picklable_variables)
+        with self._lock:
+            if self._process is not None:
+                self._connection.send(("send_variables", picklable_variables))
+
+    def send_tools(self, tools: dict[str, Tool]):
+        self.tools = dict(tools)
+        with self._lock:
+            if self._process is not None:
+                self._connection.send(("send_tools", list(self.tools)))
+
+    def cleanup(self):
+        """Stop the child process and remove the artifacts."""
+        with self._lock:
+            self._stop_process()
+        if self.artifact_store is not None and self._owns_artifact_store:
+            self.artifact_store.cleanup()
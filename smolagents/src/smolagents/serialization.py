@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import io
+import sys
+import zlib
+from collections.abc import Generator, Iterator
+from dataclasses import fields, is_dataclass
+from enum import Enum
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Literal
+
+from .memory import AgentMemory, MessageReference
+from .utils import AgentError, _is_package_available, make_json_serializable
+
+
+if TYPE_CHECKING:
+    import PIL.Image
+
+
+__all__ = ["write_memory", "iter_memory_records", "read_memory"]
+
+
+MAGIC = b"SMOLMEM"
+FORMAT_VERSION = 1
+CODECS = {b"z": "zstd", b"d": "zlib"}
+# Fields that are not worth storing: raw API responses are large and can be rebuilt from the messages
+EXCLUDED_FIELDS = {"raw"}
+READ_CHUNK_SIZE = 1 << 16
+
+
+def _require_msgpack():
+    if not _is_package_available("msgpack"):
+        raise ModuleNotFoundError(
+            "Please install 'serialization' extra to serialize agent memory: `pip install 'smolagents[serialization]'`"
+        )
+    import msgpack
+
+    return msgpack
+
+
+class _Compressor:
+    def __init__(self, codec: str, fp: IO[bytes]):
+        self.fp = fp
+        self._zstd_writer = None
+        self._zlib_compressor = None
+        if codec == "zstd":
+            import zstandard
+
+            self._zstd_writer = zstandard.ZstdCompressor(level=10).stream_writer(fp, closefd=False)
+        else:
+            self._zlib_compressor = zlib.compressobj(9)
+
+    def write(self, data: bytes):
+        if self._zstd_writer is not None:
+            self._zstd_writer.write(data)
+        else:
+            self.fp.write(self._zlib_compressor.compress(data))
+
+    def close(self):
+        if self._zstd_writer is not None:
+            self._zstd_writer.close()
+        else:
+            self.fp.write(self._zlib_compressor.flush())
+
+
+def _decompressed_chunks(codec: str, fp: IO[bytes]) -> Iterator[bytes]:
+    if codec == "zstd":
+        if not _is_package_available("zstandard"):
+            raise ModuleNotFoundError(
+                "Please install 'serialization' extra to read zstd-compressed memory: "
+                "`pip install 'smolagents[serialization]'`"
+            )
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(fp, closefd=False)
+        while chunk := reader.read(READ_CHUNK_SIZE):
+            yield chunk
+    else:
+        decompressobj = zlib.decompressobj()
+        while chunk := fp.read(READ_CHUNK_SIZE):
+            yield decompressobj.decompress(chunk)
+        yield decompressobj.flush()
+
+
+class _MemoryEncoder:
+    """Converts memory objects to msgpack-compatible values, storing each distinct image once as a PNG blob."""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self._image_hashes: dict[int, tuple[Any, str]] = {}
+        self._written_hashes: set[str] = set()
+
+    def image_ref(self, image: "PIL.Image.Image") -> dict:
+        cached = self._image_hashes.get(id(image))
+        if cached is not None and cached[0] is image:
+            return {"__image__": cached[1]}
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        data = buffer.getvalue()
+        image_hash = hashlib.sha256(data).hexdigest()[:32]
+        if image_hash not in self._written_hashes:
+            self.emit({"t": "blob", "hash": image_hash, "format": "png", "data": data})
+            self._written_hashes.add(image_hash)
+        # The image is kept referenced so that its id is not reused by another image
+        self._image_hashes[id(image)] = (image, image_hash)
+        return {"__image__": image_hash}
+
+    def encode(self, obj: Any) -> Any:
+        if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+            return obj
+        if isinstance(obj, Enum):
+            return obj.value
+        if isinstance(obj, MessageReference):
+            return {"__spans__": [list(span) for span in obj.spans]}
+        if isinstance(obj, AgentError):
+            return obj.dict()
+        if isinstance(obj, (list, tuple)):
+            return [self.encode(item) for item in obj]
+        if isinstance(obj, dict):
+            return {str(key): self.encode(value) for key, value in obj.items()}
+        if is_dataclass(obj) and not isinstance(obj, type):
+            return {
+                field.name: self.encode(getattr(obj, field.name))
+                for field in fields(obj)
+                if field.name not in EXCLUDED_FIELDS
+            }
+        # Images can only exist if PIL was imported already
+        pil_image_module = sys.modules.get("PIL.Image")
+        if pil_image_module is not None and isinstance(obj, pil_image_module.Image):
+            return self.image_ref(obj)
+        return make_json_serializable(obj)
+
+
+def write_memory(
+    memory: AgentMemory, path: str | Path, compression: Literal["zstd", "zlib"] | None = None
+) -> None:
+    """
+    Write an agent memory to a compact binary transcript.
+
+    The transcript is a stream of msgpack records, compressed with zstd, or zlib if `zstandard` is not installed.
+    Images are stored once as PNG blobs referenced by their hash, and the model input messages of the steps are stored
+    as spans of the memory's message log instead of copies.
+
+    Args:
+        memory (`AgentMemory`): Memory to write.
+        path (`str | Path`): Path of the transcript.
+        compression (`str`, *optional*): `"zstd"` or `"zlib"`. Defaults to zstd if available.
+    """
+    msgpack = _require_msgpack()
+    if compression is None:
+        compression = "zstd" if _is_package_available("zstandard") else "zlib"
+    codec_byte = next(byte for byte, name in CODECS.items() if name == compression)
+    with open(path, "wb") as fp:
+        fp.write(MAGIC + bytes([FORMAT_VERSION]) + codec_byte)
+        compressor = _Compressor(compression, fp)
+        packer = msgpack.Packer(use_bin_type=True)
+
+        def emit(record: dict):
+            compressor.write(packer.pack(record))
+
+        encoder = _MemoryEncoder(emit)
+        emit({"t": "header", "version": FORMAT_VERSION, "system_prompt": memory.system_prompt.system_prompt})
+        for index, message in enumerate(memory.message_log.messages):
+            emit({"t": "message", "index": index, "message": encoder.encode(message)})
+        for step in memory.steps:
+            emit({"t": "step", "kind": type(step).__name__, "step": encoder.encode(step)})
+        compressor.close()
+
+
+def iter_memory_records(path: str | Path) -> Generator[dict]:
+    """
+    Stream the records of a transcript written by [`write_memory`], without loading it whole.
+
+    Records are dicts with a `"t"` key: `"header"`, then `"blob"` (an image), `"message"` (an entry of the message
+    log) and `"step"` (a memory step) records, in the order they were written.
+    """
+    msgpack = _require_msgpack()
+    with open(path, "rb") as fp:
+        header = fp.read(len(MAGIC) + 2)
+        if not header.startswith(MAGIC):
+            raise ValueError(f"{path} is not a serialized agent memory.")
+        if header[len(MAGIC)] > FORMAT_VERSION:
+            raise ValueError(f"Unsupported memory format version {header[len(MAGIC)]}.")
+        codec = CODECS[header[len(MAGIC) + 1 :]]
+        unpacker = msgpack.Unpacker(raw=False, max_buffer_size=0)
+        for chunk in _decompressed_chunks(codec, fp):
+            unpacker.feed(chunk)
+            yield from unpacker
+
+
+def read_memory(path: str | Path, decode_images: bool = False) -> dict:
+    """
+    Read a transcript written by [`write_memory`].
+
+    Returns a dict with the `system_prompt`, the `messages` of the message log, the `steps` as dicts, with their
+    model input messages expanded from the message log, and the `images` by hash, as PNG bytes or PIL images if
+    `decode_images` is set. Image references in messages and steps are `{"__image__": hash}` dicts.
+    """
+    transcript = {"system_prompt": None, "messages": [], "steps": [], "images": {}}
+    for record in iter_memory_records(path):
+        if record["t"] == "header":
+            transcript["system_prompt"] = record["system_prompt"]
+        elif record["t"] == "blob":
+            data = record["data"]
+            if decode_images:
+                import PIL.Image
+
+                data = PIL.Image.open(io.BytesIO(data))
+            transcript["images"][record["hash"]] = data
+        elif record["t"] == "message":
+            transcript["messages"].append(record["message"])
+        elif record["t"] == "step":
+            step = dict(record["step"], kind=record["kind"])
+            input_messages = step.get("model_input_messages")
+            if isinstance(input_messages, dict) and "__spans__" in input_messages:
+                step["model_input_messages"] = [
+                    message for start, end in input_messages["__spans__"] for message in transcript["messages"][start:end]
+                ]
+            transcript["steps"].append(step)
+    return transcript
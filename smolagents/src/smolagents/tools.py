@@ -49,10 +49,12 @@ from ._function_type_hints_utils import (
     get_json_schema,
 )
 from .agent_types import AgentAudio, AgentImage, handle_agent_input_types, handle_agent_output_types
+from .monitoring import trace_span
 from .tool_validation import MethodChecker, validate_tool_attributes
 from .utils import (
     BASE_BUILTIN_MODULES,
     _is_package_available,
+    get_cancellation_token,
     get_source,
     instance_to_source,
     is_valid_name,
@@ -224,7 +226,11 @@ class Tool:
 
         if sanitize_inputs_outputs:
             args, kwargs = handle_agent_input_types(*args, **kwargs)
-        outputs = self.forward(*args, **kwargs)
+        cancellation_token = get_cancellation_token()
+        if cancellation_token is not None:
+            cancellation_token.raise_if_cancelled()
+        with trace_span(f"tool:{self.name}", "tool"):
+            outputs = self.forward(*args, **kwargs)
         if sanitize_inputs_outputs:
             outputs = handle_agent_output_types(outputs, self.output_type)
         return outputs
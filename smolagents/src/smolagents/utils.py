@@ -23,8 +23,13 @@ import json
 import keyword
 import os
 import re
+import threading
 import time
 import types
+import weakref
+from collections.abc import Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
@@ -36,7 +41,7 @@ if TYPE_CHECKING:
     from smolagents.memory import AgentLogger
 
 
-__all__ = ["AgentError"]
+__all__ = ["AgentError", "CancellationToken", "get_cancellation_token"]
 
 
 @lru_cache
@@ -124,6 +129,125 @@ class AgentGenerationError(AgentError):
     pass
 
 
+class AgentCancelledError(AgentError):
+    """Exception raised when the run of an agent is cancelled through its cancellation token"""
+
+    pass
+
+
+class OperationCancelledError(Exception):
+    """Exception raised by a model call or a tool when the active cancellation token is cancelled"""
+
+    pass
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation shared by an agent run, its managed agents, its tools and its model calls.
+
+    An agent activates its token for the duration of its run, so that managed agents called from its code, tools and
+    model calls find it with `get_cancellation_token()`. The token is cancelled explicitly with `cancel`, or once its
+    `deadline` has passed.
+
+    Args:
+        deadline (`float`, *optional*): Absolute time, as given by `time.time()`, after which the token is cancelled.
+    """
+
+    def __init__(self, deadline: float | None = None):
+        self.deadline = deadline
+        self.reason: str | None = None
+        self._event = threading.Event()
+        self._callbacks: list[Callable[[], None]] = []
+        # Held weakly, so that the tokens of finished runs do not pile up on a long-lived parent
+        self._children: weakref.WeakSet[CancellationToken] = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = "Cancelled."):
+        """Cancel the token and run the callbacks registered with `on_cancel`. Cancelling again has no effect."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+            children = list(self._children)
+            self._children.clear()
+        for child in children:
+            child.cancel(reason)
+        for callback in callbacks:
+            callback()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.time() >= self.deadline:
+            self.cancel("Time budget exhausted.")
+        return self._event.is_set()
+
+    def remaining(self) -> float | None:
+        """Seconds left before the deadline, or None if there is no deadline."""
+        return None if self.deadline is None else max(self.deadline - time.time(), 0.0)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise OperationCancelledError(self.reason)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Register a callback run when the token is cancelled, or immediately if it already is.
+
+        Returns a function unregistering the callback, to call once it is no longer needed, e.g. in a `finally`, so
+        that a long-lived token does not keep one callback per call.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Wait until the token is cancelled or its deadline passes, for at most `timeout` seconds."""
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.cancelled
+
+    def child(self) -> "CancellationToken":
+        """Return a token with the same deadline, cancelled with this one but that can be cancelled on its own."""
+        child = CancellationToken(deadline=self.deadline)
+        with self._lock:
+            if not self._event.is_set():
+                self._children.add(child)
+                return child
+        child.cancel(self.reason)
+        return child
+
+    @contextmanager
+    def activate(self):
+        """Make this token the one returned by `get_cancellation_token` in the block."""
+        token = _current_cancellation_token.set(self)
+        try:
+            yield self
+        finally:
+            _current_cancellation_token.reset(token)
+
+
+CANCELLATION_POLL_INTERVAL = 0.1
+_current_cancellation_token: ContextVar[CancellationToken | None] = ContextVar(
+    "smolagents_cancellation_token", default=None
+)
+
+
+def get_cancellation_token() -> CancellationToken | None:
+    """Return the [`CancellationToken`] of the agent run in progress, if any."""
+    return _current_cancellation_token.get()
+
+
 def make_json_serializable(obj: Any) -> Any:
     """Recursive function to make objects JSON serializable"""
     if obj is None:
@@ -237,6 +361,68 @@ Thoughts: [Your thoughts]
 )
 
 
+class StreamingCodeBlockParser:
+    """Incremental parser detecting when a streamed LLM output has completed its code block.
+
+    Chunks are accumulated as they arrive and only the newly received text (plus a small overlap, to catch tags split
+    across chunks) is scanned, so the cost of each update does not grow with the length of the output.
+    The output is considered complete once the closing tag follows the opening tag, or once a stop sequence appears:
+    this lets the caller abort the stream client-side when the server ignores stop sequences.
+
+    Args:
+        code_block_tags (`tuple[str, str]`): Opening and closing tags for code blocks (regex strings).
+        stop_sequences (`list[str]`, *optional*): Sequences ending the output, excluded from the parsed text.
+    """
+
+    def __init__(self, code_block_tags: tuple[str, str], stop_sequences: list[str] | None = None):
+        self.opening_pattern = re.compile(code_block_tags[0])
+        self.closing_pattern = re.compile(code_block_tags[1])
+        self.stop_sequences = [sequence for sequence in (stop_sequences or []) if sequence]
+        self.overlap = max([len(tag) for tag in code_block_tags] + [len(s) for s in self.stop_sequences]) + 16
+        self.done = False
+        self._chunks: list[str] = []
+        self._length = 0
+        self._tail = ""
+        self._code_start: int | None = None
+        self._cut: int | None = None
+
+    def feed(self, chunk: str | None) -> bool:
+        """Add a chunk of streamed text, and return whether the output is complete."""
+        if self.done or not chunk:
+            return self.done
+        offset = self._length - len(self._tail)
+        window = self._tail + chunk
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        self._tail = window[-self.overlap :]
+
+        cut = None
+        for sequence in self.stop_sequences:
+            position = window.find(sequence)
+            if position != -1 and (cut is None or offset + position < cut):
+                cut = offset + position
+        if self._code_start is None:
+            match = self.opening_pattern.search(window)
+            if match and (cut is None or offset + match.start() < cut):
+                self._code_start = offset + match.end()
+        if self._code_start is not None:
+            match = self.closing_pattern.search(window, max(0, self._code_start - offset))
+            if match and (cut is None or offset + match.start() < cut):
+                cut = offset + match.end()
+        if cut is not None:
+            self._cut = cut
+            self.done = True
+        return self.done
+
+    @property
+    def text(self) -> str:
+        """Accumulated text, cut after the closing tag or before the stop sequence if the output is complete."""
+        text = "".join(self._chunks)
+        if len(self._chunks) > 1:
+            self._chunks = [text]
+        return text[: self._cut] if self._cut is not None else text
+
+
 MAX_LENGTH_TRUNCATE_CONTENT = 20000
 
 
@@ -70,7 +70,9 @@ def save_screenshot(memory_step: ActionStep, agent: CodeAgent) -> None:
     if driver is not None:
         for previous_memory_step in agent.memory.steps:  # Remove previous screenshots from logs for lean processing
             if isinstance(previous_memory_step, ActionStep) and previous_memory_step.step_number <= current_step - 2:
-                previous_memory_step.observations_images = None
+                if previous_memory_step.observations_images is not None:
+                    previous_memory_step.observations_images = None
+                    agent.memory.invalidate_rendered_messages()
         png_bytes = driver.get_screenshot_as_png()
         image = PIL.Image.open(BytesIO(png_bytes))
         print(f"Captured a browser screenshot: {image.size} pixels")
@@ -1,6 +1,7 @@
 # Shamelessly stolen from Microsoft Autogen team: thanks to them for this great resource!
 # https://github.com/microsoft/autogen/blob/gaia_multiagent_v01_march_1st/autogen/browser_utils.py
 import copy
+import hashlib
 import json
 import logging
 from pathlib import Path
@@ -21,7 +22,7 @@ from smolagents.models import OpenAIServerModel, MessageRole, Model, ChatMessage
 from tqdm import tqdm
 
 
-def extract_answer(original_task: str, prediction: str, model: Model) -> str:
+def build_extract_messages(original_task: str, prediction: str) -> list[ChatMessage]:
     messages = [
         {
             "role": MessageRole.SYSTEM,
@@ -108,85 +109,237 @@ correct_answer: Java
         }
     )
     
-    messages = [ChatMessage.from_dict(msg) for msg in messages]
+    return [ChatMessage.from_dict(msg) for msg in messages]
+
+
+def parse_final_answer(content: str) -> str:
+    return content.split("FINAL ANSWER: ")[-1].strip()
+
 
+def extract_answer(original_task: str, prediction: str, model: Model) -> str:
+    messages = build_extract_messages(original_task, prediction)
     response = model(messages)
-    final_answer = response.content.split("FINAL ANSWER: ")[-1].strip()
-    return final_answer
+    return parse_final_answer(response.content)
 
 
-def run_extract(target_path: str, model_id: str="gpt-4.1", conv_num: int=4, max_workers: int = 10):
-    """
+EXTRACT_MAX_TOKENS = 13000
+EXTRACT_TEMPERATURE = 0.2
 
-    Args:
-        target_path (str): 
-        model_id (str): 
-        conv_num (int): 提取答案时所使用的对话轮次[-conv_num-3: -3]
-        max_workers (int): Maximum number of threads for parallel execution.
-    """
-    model = OpenAIServerModel(
-        api_base="http://gpt-proxy.jd.com/gateway/common",
-        api_key="64268e2b-188f-4e86-9b2a-8542ba3849c8",
-        max_tokens=13000,
+
+def create_extract_model(model_id: str, api_base: str | None = None, api_key: str | None = None) -> OpenAIServerModel:
+    return OpenAIServerModel(
+        api_base=api_base or "http://gpt-proxy.jd.com/gateway/common",
+        api_key=api_key or "64268e2b-188f-4e86-9b2a-8542ba3849c8",
+        max_tokens=EXTRACT_MAX_TOKENS,
         model_id=model_id,
-        temperature=0.2,
+        temperature=EXTRACT_TEMPERATURE,
         # reasoning_effort="high"
         )
 
-    file_path = Path(target_path)
-    source_path = file_path  # Use the provided path directly
+
+def load_records(target_path: str) -> list[dict]:
     records=[]
-    with open(source_path, "r", encoding="utf8") as file:
+    with open(target_path, "r", encoding="utf8") as file:
         for line in file:
             records.append(json.loads(line))
-    print("===========================================================")
-    print("-------------------- Extracted Results --------------------")
-    print("===========================================================\n")
-    
-    def process_record(record):
-        answer_attempt=0
-        error_attempt=0
-        while True:
-            try:
-                final_result = extract_answer(
-                    record['question'], 
-                    record['prediction'],
-                    model=model, 
-                    conv_num=conv_num
-                )
-                record['prediction'] = final_result
-                record['parsing_error'] = False
-
-                if answer_attempt==0 and final_result == "Unable to determine" and not final_result.startswith("Thought:"): # 如果第一次没有明确答案则再次尝试
-                    # print(f"Unable to parse {record['task_id']}, retry extraction again")
-                    answer_attempt+=1
-                    continue
-                break
-            except Exception as e:
-                # traceback.print_exc()
-                if error_attempt == 0: # 如果第一次尝试出现错误
-                    # print("\n===============================================================")
-                    # print(f"An error occurred while executing `extract_answer` for {record['task_id']}. Retrying...")
-                    # print("===============================================================\n") 
-                    error_attempt+=1
-                    sleep(30)
-                    continue                   
-                else:
-                    logging.error(f"Error: `extract_answer()` still failed after 2 attempts for {record['task_id']}: {e}")
-                    record['prediction'] = None
-                    record['parsing_error'] = str(e)
-                break
-        return record
+    return records
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        processed_records = list(tqdm(executor.map(process_record, records), total=len(records)))
 
-    for record in processed_records:
+def save_records(records: list[dict], target_path: str):
+    file_path = Path(target_path)
+    for record in records:
         print(f"task_id: {record['task_id']} > : {record.get('prediction')}")
 
     file_path.parent.mkdir(parents=True, exist_ok=True)
     with open(file_path, "w", encoding="utf-8") as f:
-        for record in processed_records:
+        for record in records:
             line = json.dumps(record, ensure_ascii=False)
-            f.write(line + "\n")     
-    print(f"\n\n答案保存到路径: {file_path.resolve()}\n\n")
\ No newline at end of file
+            f.write(line + "\n")
+    print(f"\n\n答案保存到路径: {file_path.resolve()}\n\n")
+
+
+def process_record(record: dict, model: Model) -> dict:
+    answer_attempt=0
+    error_attempt=0
+    while True:
+        try:
+            final_result = extract_answer(
+                record['question'],
+                record['prediction'],
+                model=model,
+            )
+            record['prediction'] = final_result
+            record['parsing_error'] = False
+
+            if answer_attempt==0 and final_result == "Unable to determine" and not final_result.startswith("Thought:"): # 如果第一次没有明确答案则再次尝试
+                # print(f"Unable to parse {record['task_id']}, retry extraction again")
+                answer_attempt+=1
+                continue
+            break
+        except Exception as e:
+            # traceback.print_exc()
+            if error_attempt == 0: # 如果第一次尝试出现错误
+                error_attempt+=1
+                sleep(30)
+                continue
+            else:
+                logging.error(f"Error: `extract_answer()` still failed after 2 attempts for {record['task_id']}: {e}")
+                record['prediction'] = None
+                record['parsing_error'] = str(e)
+            break
+    return record
+
+
+def process_records(records: list[dict], model: Model, max_workers: int = 10) -> list[dict]:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(tqdm(executor.map(lambda record: process_record(record, model), records), total=len(records)))
+
+
+def run_extract(target_path: str, model_id: str="gpt-4.1", conv_num: int=4, max_workers: int = 10):
+    """
+
+    Args:
+        target_path (str): JSONL file of the records, overwritten with the extracted answers.
+        model_id (str): Extraction model.
+        conv_num (int): 提取答案时所使用的对话轮次[-conv_num-3: -3]
+        max_workers (int): Maximum number of threads for parallel execution.
+    """
+    model = create_extract_model(model_id)
+    records = load_records(target_path)
+    print("===========================================================")
+    print("-------------------- Extracted Results --------------------")
+    print("===========================================================\n")
+
+    processed_records = process_records(records, model, max_workers=max_workers)
+
+    save_records(processed_records, target_path)
+
+
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def build_batch_request(record: dict, model_id: str) -> dict:
+    """Chat completion request of the batch extracting the answer of a record, with the settings of the sync path."""
+    messages = build_extract_messages(record['question'], record['prediction'])
+    body = {
+        "model": model_id,
+        "messages": [{"role": message.role.value, "content": message.content} for message in messages],
+        "max_tokens": EXTRACT_MAX_TOKENS,
+        "temperature": EXTRACT_TEMPERATURE,
+    }
+    return {"custom_id": record["task_id"], "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+
+def hash_record_ids(records: list[dict]) -> str:
+    return hashlib.sha256("\n".join(record["task_id"] for record in records).encode("utf-8")).hexdigest()
+
+
+def run_extract_batch(
+    target_path: str,
+    model_id: str="gpt-4.1",
+    api_base: str | None = None,
+    api_key: str | None = None,
+    completion_window: str = "24h",
+    poll_interval: float = 10,
+    max_poll_interval: float = 300,
+    wait: bool = True,
+    max_workers: int = 10,
+):
+    """Extract the answers of all records through the Batch API of an OpenAI-compatible server.
+
+    All extraction requests are written to a JSONL batch file (one request per record, `custom_id` = `task_id`),
+    uploaded and submitted as a single batch. The batch id is saved next to `target_path` with a hash of the task ids,
+    so that a later call on the same records resumes polling the same batch instead of submitting a new one. Results
+    are merged back into the records by `task_id`, and records whose batch request failed are extracted synchronously
+    in parallel.
+
+    Args:
+        target_path (str): JSONL file of the records, overwritten with the extracted answers.
+        model_id (str): Extraction model.
+        api_base (str, optional): Base URL of the OpenAI-compatible server.
+        api_key (str, optional): API key of the server.
+        completion_window (str): Completion window requested for the batch.
+        poll_interval (float): Initial delay between two status checks, doubled up to `max_poll_interval`.
+        max_poll_interval (float): Maximum delay between two status checks.
+        wait (bool): If False, submit the batch (or check its status) and return without waiting for completion.
+        max_workers (int): Maximum number of threads extracting the records whose batch request failed.
+
+    Returns:
+        str: Final status of the batch, or its current status if `wait` is False and it is not finished.
+    """
+    model = create_extract_model(model_id, api_base=api_base, api_key=api_key)
+    records = load_records(target_path)
+    file_path = Path(target_path)
+    batch_input_path = file_path.with_suffix(".batch_input.jsonl")
+    batch_state_path = file_path.with_suffix(".batch.json")
+
+    records_hash = hash_record_ids(records)
+
+    batch_id = None
+    if batch_state_path.exists():
+        batch_state = json.loads(batch_state_path.read_text())
+        if batch_state.get("records_hash") == records_hash:
+            batch_id = batch_state["batch_id"]
+            print(f"Resuming extraction batch {batch_id}")
+        else:
+            # The records changed since the batch was submitted: its results would not match them
+            print(f"Discarding extraction batch {batch_state.get('batch_id')}, submitted for other records")
+            batch_state_path.unlink()
+    if batch_id is None:
+        with open(batch_input_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(build_batch_request(record, model.model_id), ensure_ascii=False) + "\n")
+        with open(batch_input_path, "rb") as f:
+            input_file = model.client.files.create(file=f, purpose="batch")
+        batch = model.client.batches.create(
+            input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window=completion_window
+        )
+        batch_id = batch.id
+        batch_state_path.write_text(
+            json.dumps({"batch_id": batch_id, "input_file_id": input_file.id, "records_hash": records_hash})
+        )
+        print(f"Submitted extraction batch {batch_id} with {len(records)} requests")
+
+    delay = poll_interval
+    while True:
+        batch = model.client.batches.retrieve(batch_id)
+        if batch.status in BATCH_FINAL_STATUSES or not wait:
+            break
+        sleep(delay)
+        delay = min(delay * 2, max_poll_interval)
+    if batch.status not in BATCH_FINAL_STATUSES:
+        print(f"Extraction batch {batch_id} is {batch.status}, call again later to collect the results")
+        return batch.status
+
+    answers, errors = {}, {}
+    if batch.output_file_id:
+        for line in model.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code", 200) != 200:
+                errors[result["custom_id"]] = str(result.get("error") or response.get("body"))
+                continue
+            answers[result["custom_id"]] = parse_final_answer(response["body"]["choices"][0]["message"]["content"] or "")
+    if batch.error_file_id:
+        for line in model.client.files.content(batch.error_file_id).text.splitlines():
+            if line.strip():
+                result = json.loads(line)
+                errors[result["custom_id"]] = str(result.get("error") or result.get("response"))
+
+    failed_records = []
+    for record in records:
+        if record["task_id"] in answers:
+            record['prediction'] = answers[record["task_id"]]
+            record['parsing_error'] = False
+        else:
+            logging.error(f"Batch extraction failed for {record['task_id']}: {errors.get(record['task_id'], batch.status)}, extracting synchronously")
+            failed_records.append(record)
+    # process_record updates the records in place
+    process_records(failed_records, model, max_workers=max_workers)
+
+    save_records(records, target_path)
+    batch_state_path.unlink()
+    batch_input_path.unlink(missing_ok=True)
+    return batch.status
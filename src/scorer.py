@@ -126,3 +126,19 @@ def normalize_str(input_str, remove_punct=True) -> str:
         return no_spaces.lower().translate(translator)
     else:
         return no_spaces.lower()
+
+
+def normalize_answer(answer: str) -> str | float | tuple:
+    """
+    Normalize a model answer into a key, so that answers the scorer would consider equal get the same key.
+    Numbers are converted to floats, lists to tuples of normalized elements, and other strings with `normalize_str`.
+    """
+    answer = str(answer).strip()
+    if is_float(answer.replace("$", "").replace("%", "").replace(",", "")):
+        return normalize_number_str(answer)
+    if any(char in answer for char in [",", ";"]):
+        return tuple(
+            float(elem) if is_float(elem.strip()) else normalize_str(elem, remove_punct=False)
+            for elem in split_string(answer)
+        )
+    return normalize_str(answer)
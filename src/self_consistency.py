@@ -0,0 +1,153 @@
+import contextvars
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from smolagents.agents import MultiStepAgent
+from smolagents.utils import CancellationToken, get_cancellation_token
+from src.scorer import normalize_answer
+
+
+@dataclass
+class Attempt:
+    index: int
+    answer: Any = None
+    key: Any = None
+    intermediate_steps: list = field(default_factory=list)
+    error: str | None = None
+    duration: float | None = None
+    # Agent that ran the attempt, already cleaned up, e.g. to save its memory
+    agent: MultiStepAgent | None = None
+
+
+@dataclass
+class SelfConsistencyResult:
+    answer: Any
+    attempt: Attempt | None
+    attempts: list[Attempt]
+    votes: dict
+    consensus: bool
+
+    def dict(self) -> dict:
+        return {
+            "consensus": self.consensus,
+            "votes": {str(key): count for key, count in self.votes.items()},
+            "attempts": [
+                {"index": a.index, "answer": str(a.answer), "error": a.error, "duration": a.duration}
+                for a in self.attempts
+            ],
+        }
+
+
+def run_self_consistency(
+    build_agent: Callable[[int], MultiStepAgent],
+    task: str,
+    n_attempts: int = 3,
+    quorum: int | None = None,
+    time_budget: float | None = None,
+    logger=None,
+    cleanup_agent: Callable[[MultiStepAgent], None] | None = None,
+) -> SelfConsistencyResult:
+    """Run `n_attempts` independent agents on the same task concurrently, and vote on their answers.
+
+    Answers are compared after `normalize_answer`, so that answers the scorer would consider equal count as the same
+    vote. Each attempt runs with its own cancellation token, a child of the caller's one if any. As soon as `quorum`
+    attempts agree, or once `time_budget` seconds have passed, the tokens of the remaining attempts are cancelled, which
+    stops their whole agent tree, and the most voted answer is returned without waiting for them to stop.
+
+    Args:
+        build_agent: Function building the agent of an attempt from its index, e.g. with a different temperature.
+        task: Task given to every attempt.
+        n_attempts: Number of attempts.
+        quorum: Number of agreeing answers needed to stop early. Defaults to a strict majority of `n_attempts`.
+        time_budget: Time budget in seconds shared by all the attempts.
+        logger: Optional `AgentLogger` to report the votes.
+        cleanup_agent: Function releasing the resources of the agent of an attempt once it stopped. Defaults to
+            `agent.cleanup()`.
+    """
+    quorum = quorum or n_attempts // 2 + 1
+    deadline = time.time() + time_budget if time_budget else None
+    parent_token = get_cancellation_token()
+    tokens: list[CancellationToken] = []
+    for _ in range(n_attempts):
+        token = parent_token.child() if parent_token is not None else CancellationToken()
+        if deadline is not None:
+            token.deadline = deadline if token.deadline is None else min(token.deadline, deadline)
+        tokens.append(token)
+
+    def run_attempt(index: int) -> Attempt:
+        start_time = time.time()
+        agent = None
+        try:
+            agent = build_agent(index)
+            answer = agent.run(task, cancellation_token=tokens[index])
+            return Attempt(
+                index=index,
+                answer=answer,
+                key=normalize_answer(answer) if answer is not None else None,
+                intermediate_steps=agent.write_memory_to_messages(),
+                duration=time.time() - start_time,
+                agent=agent,
+            )
+        except Exception as e:
+            if logger is not None:
+                logger.log_error(traceback.format_exc())
+            return Attempt(index=index, error=str(e), duration=time.time() - start_time)
+        finally:
+            # Stops the executors of the attempt's agent tree, whether it finished, failed or was cancelled
+            if agent is not None:
+                if cleanup_agent is not None:
+                    cleanup_agent(agent)
+                else:
+                    agent.cleanup()
+
+    executor = ThreadPoolExecutor(max_workers=n_attempts, thread_name_prefix="self-consistency")
+    # Each attempt runs in a copy of the caller's context, so that it is recorded by the active tracer
+    pending = {executor.submit(contextvars.copy_context().run, run_attempt, index) for index in range(n_attempts)}
+    attempts: list[Attempt] = []
+    votes: Counter = Counter()
+    consensus = False
+    try:
+        while pending:
+            timeout = max(deadline - time.time(), 0.0) if deadline is not None else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                attempt = future.result()
+                attempts.append(attempt)
+                if attempt.key is not None:
+                    votes[attempt.key] += 1
+            if votes and votes.most_common(1)[0][1] >= quorum:
+                consensus = True
+                break
+    finally:
+        if pending:
+            for token in tokens:
+                token.cancel("Self-consistency vote is over.")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    best_attempt = None
+    if votes:
+        best_key = votes.most_common(1)[0][0]
+        best_attempt = next(attempt for attempt in attempts if attempt.key == best_key)
+    if logger is not None:
+        logger.log_metrics(
+            {
+                "attempts finished": len(attempts),
+                "attempts interrupted": n_attempts - len(attempts),
+                "consensus": consensus,
+                **{f"votes for {key!r}": count for key, count in votes.most_common()},
+            },
+            title="Self-consistency",
+        )
+    return SelfConsistencyResult(
+        answer=best_attempt.answer if best_attempt else None,
+        attempt=best_attempt,
+        attempts=sorted(attempts, key=lambda attempt: attempt.index),
+        votes=dict(votes),
+        consensus=consensus,
+    )
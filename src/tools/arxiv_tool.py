@@ -3,6 +3,7 @@ import requests
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Union
 from smolagents import Tool
+from src.utils import http_request
 from dataclasses import dataclass
 from bs4 import BeautifulSoup
 import re
@@ -154,7 +155,7 @@ class ArxivWebSearchTool(Tool):
             )
             
             # Perform search
-            response = self.session.get(search_url, timeout=30)
+            response = http_request("GET", search_url, session=self.session, timeout=30)
             response.raise_for_status()
             
             # Parse results
@@ -271,7 +272,7 @@ class ArxivWebSearchTool(Tool):
         """Get accurate submission date from paper's detailed page"""
         try:
             # Request the paper's detailed page
-            response = self.session.get(abs_url, timeout=10)
+            response = http_request("GET", abs_url, session=self.session, timeout=10)
             response.raise_for_status()
             
             # Parse the HTML
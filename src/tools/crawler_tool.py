@@ -16,7 +16,7 @@ from crawl4ai import AsyncWebCrawler, CacheMode, CrawlerRunConfig, DefaultMarkdo
 from smolagents import Tool
 
 from src.tools.download_tool import download_file
-from src.utils import clean_references
+from src.utils import cancellable, clean_references, http_request
 
 
 # 使用线程本地存储来避免全局变量竞争
@@ -160,11 +160,11 @@ class CrawlerArchiveWebpageTool(Tool):
             no_timestamp_url = f"https://archive.org/wayback/available?url={url}"
             archive_url = no_timestamp_url + f"&timestamp={date}"
             
-            response = requests.get(archive_url, timeout=30)
+            response = http_request("GET", archive_url, timeout=30)
             response.raise_for_status()
             response_data = response.json()
             
-            response_notimestamp = requests.get(no_timestamp_url, timeout=30)
+            response_notimestamp = http_request("GET", no_timestamp_url, timeout=30)
             response_notimestamp.raise_for_status()
             response_notimestamp_data = response_notimestamp.json()
             
@@ -413,12 +413,12 @@ class SimpleCrawler:
             'X-Timeout': '10',
             'X-Token-Budget': '50000'
         }
-        response = requests.get(jina_url, headers=headers)
+        response = http_request("GET", jina_url, headers=headers)
         return response.text
 
     def crawl_page(self, url, return_html: bool=False):
         header = self._check_history(url)
-        pages = asyncio.run(self._crawl_page(url=url, return_html=return_html))
+        pages = asyncio.run(cancellable(self._crawl_page(url=url, return_html=return_html)))
         return header + pages
 
 
@@ -6,10 +6,13 @@ import threading
 from typing import Optional
 from urllib.parse import urlparse
 from smolagents import tool
+from smolagents.utils import get_cancellation_token
 import requests
 from requests.adapters import HTTPAdapter, Retry
 import textwrap
 
+from src.utils import http_request
+
 _thread_local = threading.local()
 
 def get_link_pool():
@@ -75,7 +78,7 @@ def download_file(url: str) -> dict:
         session.mount("https://", HTTPAdapter(max_retries=retries))
         
         # Download the file
-        response = session.get(url, timeout=TIMEOUT, stream=True)
+        response = http_request("GET", url, session=session, timeout=TIMEOUT, stream=True)
         response.raise_for_status()
         
         # Determine filename
@@ -105,11 +108,30 @@ def download_file(url: str) -> dict:
             dest = DOWNLOAD_DIR / f"{original_stem}_{counter}{ext}"
             counter += 1
         
-        # Download and save file
-        with open(dest, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        # Download and save file, stopping between chunks if the task is cancelled. Closing the response on
+        # cancellation also interrupts a read stalled on a slow server
+        token = get_cancellation_token()
+        unregister = token.on_cancel(response.close) if token is not None else None
+        try:
+            with open(dest, "wb") as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    if token is not None and token.cancelled:
+                        break
+                    if chunk:
+                        f.write(chunk)
+        except Exception:
+            if token is None or not token.cancelled:
+                raise
+        finally:
+            if unregister is not None:
+                unregister()
+            response.close()
+        if token is not None and token.cancelled:
+            dest.unlink(missing_ok=True)
+            return {
+                "success":False,
+                "error":f"Download cancelled: {token.reason}"
+            }
         
         file_size = dest.stat().st_size
         return {
@@ -8,6 +8,7 @@ from urllib.parse import quote, urljoin
 import re
 from datetime import datetime
 from smolagents import Tool
+from src.utils import http_request
 
 
 def _build_headers(ua_suffix: str) -> Dict[str, str]:
@@ -77,7 +78,8 @@ class GitHubRepoSearchTool(Tool):
         try:
             # First, get total count to calculate total pages
             count_params = {"q": search_query, "per_page": 1, "page": 1}
-            count_resp = requests.get(
+            count_resp = http_request(
+                "GET",
                 f"{self.base_url}/search/repositories",
                 headers=self.headers,
                 params=count_params,
@@ -96,7 +98,8 @@ class GitHubRepoSearchTool(Tool):
                 items = []
             else:
                 params = {"q": search_query, "per_page": per_page, "page": target_page}
-                resp = requests.get(
+                resp = http_request(
+                    "GET",
                     f"{self.base_url}/search/repositories",
                     headers=self.headers,
                     params=params,
@@ -194,7 +197,8 @@ class GitHubIssueSearchTool(Tool):
         try:
             # First, get total count to calculate total pages
             count_params = {"q": search_q, "per_page": 1, "page": 1}
-            count_resp = requests.get(
+            count_resp = http_request(
+                "GET",
                 f"{self.base_url}/search/issues",
                 headers=self.headers,
                 params=count_params,
@@ -212,7 +216,8 @@ class GitHubIssueSearchTool(Tool):
                 items = []
             else:
                 params = {"q": search_q, "per_page": per_page, "page": target_page}
-                resp = requests.get(
+                resp = http_request(
+                    "GET",
                     f"{self.base_url}/search/issues",
                     headers=self.headers,
                     params=params,
@@ -307,7 +312,8 @@ class GitHubPullRequestSearchTool(Tool):
         try:
             # First, get total count to calculate total pages
             count_params = {"q": search_q, "per_page": 1, "page": 1}
-            count_resp = requests.get(
+            count_resp = http_request(
+                "GET",
                 f"{self.base_url}/search/issues",
                 headers=self.headers,
                 params=count_params,
@@ -325,7 +331,8 @@ class GitHubPullRequestSearchTool(Tool):
                 items = []
             else:
                 params = {"q": search_q, "per_page": per_page, "page": target_page}
-                resp = requests.get(
+                resp = http_request(
+                    "GET",
                     f"{self.base_url}/search/issues",
                     headers=self.headers,
                     params=params,
@@ -395,7 +402,8 @@ class GitHubReleaseSearchTool(Tool):
     def forward(self, repo: str, per_page: int = 10, page: Optional[int] = None, tag: Optional[str] = None ) -> Dict[str, Any]:
         if tag:
             try:
-                resp = requests.get(
+                resp = http_request(
+                    "GET",
                     f"{self.base_url}/repos/{repo}/releases/tags/{tag}",
                     headers=self.headers,
                     timeout=30,
@@ -426,7 +434,8 @@ class GitHubReleaseSearchTool(Tool):
 
         try:
             # HEAD request to get total item count from Link header with per_page=1
-            head_resp = requests.head(
+            head_resp = http_request(
+                "HEAD",
                 f"{self.base_url}/repos/{repo}/releases",
                 headers=self.headers,
                 params={"per_page": 1, "page": 1},
@@ -445,7 +454,8 @@ class GitHubReleaseSearchTool(Tool):
             
             target_page = max(1, min(page, total_pages)) if total_pages > 0 else 1
 
-            resp = requests.get(
+            resp = http_request(
+                "GET",
                 f"{self.base_url}/repos/{repo}/releases",
                 headers=self.headers,
                 params={"per_page": per_page, "page": target_page},
@@ -1,10 +1,10 @@
 from typing import Optional
 from smolagents import tool
 import base64
-import requests
 import os
 import textwrap
 from src.tools.download_tool import download_file
+from src.utils import http_request
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
@@ -108,7 +108,7 @@ Please analyze the image carefully and provide accurate caption based on followi
             "Content-Type": "application/json",
             "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"
         }
-        response = requests.post(os.getenv("OPENAI_BASE_URL"), headers=headers, json=payload)
+        response = http_request("POST", os.getenv("OPENAI_BASE_URL"), headers=headers, json=payload)
         response.raise_for_status()
         
         response_json = response.json()
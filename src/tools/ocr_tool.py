@@ -1,9 +1,9 @@
 import base64
-import requests
 import os
 import textwrap
 from smolagents import tool
 from src.tools.download_tool import download_file
+from src.utils import http_request
 
 @tool
 def ocr_tool(file_path: str) -> str:
@@ -70,7 +70,7 @@ If there is no such text content, only return: "There isn't any text in the pict
             "Content-Type": "application/json",
             "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"
         }
-        response = requests.post(os.getenv("OPENAI_BASE_URL"), headers=headers, json=payload)
+        response = http_request("POST", os.getenv("OPENAI_BASE_URL"), headers=headers, json=payload)
         response.raise_for_status() # Raise an exception for bad status codes
         
         response_json = response.json()
@@ -12,7 +12,7 @@ import os
 import shutil
 import zipfile
 from src.tools.download_tool import download_file
-from src.utils import clean_references
+from src.utils import clean_references, http_request
 import pymupdf4llm
 
 load_dotenv()
@@ -106,7 +106,7 @@ class PDFParseTool(Tool):
             "formats":["markdown"]
         }
         try:
-            response = requests.post(apply_url,headers=self.headers,json=body)
+            response = http_request("POST", apply_url,headers=self.headers,json=body)
             if response.status_code == 200:
                 result = response.json()
                 if result["code"] == 0:
@@ -130,7 +130,7 @@ class PDFParseTool(Tool):
         query_url=f"{self.base_url}/extract-results/batch/{batch_id}"
         time.sleep(30)
         for _ in range(10):
-            response=requests.get(query_url,headers=self.headers)
+            response=http_request("GET", query_url,headers=self.headers)
             if response.status_code == 200:
                 result=response.json()
                 if result["code"] == 0:
@@ -150,7 +150,7 @@ class PDFParseTool(Tool):
     
     def _fetch_result(self, remote_url:str, file_name:str):    
         try:
-            response = requests.get(remote_url)
+            response = http_request("GET", remote_url)
             if response.status_code != 200:
                 raise Exception(f"Failed to download ZIP file: {response.status_code}")
             
@@ -8,6 +8,7 @@ from typing import Literal, Optional, Tuple, List, Dict, Union
 from typing_extensions import deprecated
 from uuid import uuid4
 from smolagents import Tool
+from src.utils import http_request
 import requests
 from ddgs import DDGS
 from urllib.parse import unquote
@@ -187,7 +188,7 @@ class GoogleSearchTool(Tool):
         base_url = "https://serpapi.com/search.json"
         
         try:
-            response = requests.get(base_url, params=params)
+            response = http_request("GET", base_url, params=params)
             response.raise_for_status()
             results = response.json()
         except requests.RequestException as e:
@@ -305,7 +306,8 @@ class BingSearchTool(Tool):
         request_body["requestId"] = str(uuid4())
         
         try:
-            response = requests.post(
+            response = http_request(
+                "POST",
                 self.bing_url, 
                 headers=self.bing_header, 
                 data=json.dumps(request_body),
@@ -6,6 +6,8 @@ from bs4 import BeautifulSoup, Tag
 from bs4.element import NavigableString
 import threading
 
+from src.utils import http_request
+
 # 使用线程本地存储来获取link_pool
 _thread_local = threading.local()
 
@@ -68,7 +70,7 @@ class WikiSearchTool(Tool):
         }
         
         try:
-            response = requests.get(base_url, params=search_params, timeout=10)
+            response = http_request("GET", base_url, params=search_params, timeout=10)
             response.raise_for_status()
             data = response.json()
 
@@ -110,7 +112,7 @@ class WikiSearchTool(Tool):
                 "inprop": "url"
             }
             
-            info_response = requests.get(base_url, params=info_params, timeout=10)
+            info_response = http_request("GET", base_url, params=info_params, timeout=10)
             info_response.raise_for_status()
             info_data = info_response.json()
             
@@ -225,7 +227,7 @@ class WikiPageTool(Tool):
         }
         
         try:
-            response = requests.get(base_url, params=params, timeout=15)
+            response = http_request("GET", base_url, params=params, timeout=15)
             response.raise_for_status()
             data = response.json()
 
@@ -1,3 +1,4 @@
+import asyncio
 import importlib
 import json
 import os
@@ -12,7 +13,7 @@ from smolagents.models import ChatMessage
 import pandas as pd
 import yaml
 from os import path
-from smolagents.utils import AgentError
+from smolagents.utils import CANCELLATION_POLL_INTERVAL, AgentError, get_cancellation_token
 
 
 
@@ -209,7 +210,7 @@ def is_download_link(url: str, timeout: int = 30) -> bool:
     try:
         # Use a HEAD request to get only headers, which is much faster.
         # allow_redirects=True ensures we check the final destination's headers.
-        response = requests.head(url, allow_redirects=True, timeout=timeout)
+        response = http_request("HEAD", url, allow_redirects=True, timeout=timeout)
         response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
 
         headers = response.headers
@@ -232,3 +233,39 @@ def is_download_link(url: str, timeout: int = 30) -> bool:
 
     # If checks don't indicate a download, assume it's a regular webpage.
     return False
+
+
+def http_request(method: str, url: str, session: requests.Session | None = None, **kwargs) -> requests.Response:
+    """
+    Send an HTTP request bounded by the cancellation token of the agent run.
+
+    The timeout is clamped to the time left before the token's deadline, so that a slow server cannot outlive the task,
+    and no request is sent once the token is cancelled. A request in flight when the token is cancelled ends at the
+    latest with its timeout. Without an active token, this is a plain `requests` call.
+    """
+    send = getattr(session or requests, method.lower())
+    token = get_cancellation_token()
+    if token is None:
+        return send(url, **kwargs)
+    token.raise_if_cancelled()
+    remaining = token.remaining()
+    if remaining is not None:
+        timeout = kwargs.get("timeout")
+        if timeout is None or isinstance(timeout, (int, float)):
+            kwargs["timeout"] = remaining if timeout is None else min(timeout, remaining)
+    return send(url, **kwargs)
+
+
+async def cancellable(coro):
+    """Await a coroutine, cancelling it as soon as the cancellation token of the agent run is cancelled."""
+    token = get_cancellation_token()
+    if token is None:
+        return await coro
+    task = asyncio.ensure_future(coro)
+    while not task.done():
+        if token.cancelled:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            token.raise_if_cancelled()
+        await asyncio.wait({task}, timeout=CANCELLATION_POLL_INTERVAL)
+    return task.result()